@@ -1,29 +1,68 @@
+import functools
+import io
+import json
 import shutil
 import subprocess
+import time
+import xml.etree.ElementTree as et
 from http.server import HTTPServer, SimpleHTTPRequestHandler
-from os import chdir, listdir, makedirs, path
+from os import chdir, cpu_count, environ, getpid, makedirs, path, remove
 
 import click
+import numpy as np
 import pkg_resources
 import yaml
 
 from aplet import utilities
-from aplet.pltools import ftrenderer, mapbuilder, parsers
+from aplet.pltools import (archive, concurrency, coverage, distributed, docspipeline, ftrenderer, history, index,
+                           mapbuilder, parsers, products, progress, reruns, runcache, sharding, sitegen, tracing,
+                           validation)
+from aplet.pltools.fixtures import FixtureError, FixtureSupervisor
+from aplet.pltools.fm import TestState
 from aplet.pltools.parsers import FeatureModel, FeatureModelParser, ProductConfigParser
 
 
 CONFIG = {}
-RUNNING_TEST_PROCESSES = []
 
 
 @click.group()
 @click.option("--configfile", default="./aplet.yml")
-def cli(configfile):
+@click.option("--profile", is_flag=True, help="Time each phase and print a summary when the command finishes")
+@click.option("--trace", type=click.Path(dir_okay=False), help="Write the phase timings to this Chrome trace JSON file")
+@click.option("--cprofile", multiple=True, metavar="PHASE", type=click.Choice(tracing.PHASES),
+              help="Run the named phase under cProfile and report its slowest functions (may be repeated)")
+@click.pass_context
+def cli(ctx, configfile, profile, trace, cprofile):
     """ Default entry point to the application.
     """
     if path.exists(configfile):
-        load_config("aplet.yml")
-    pass
+        load_config(configfile)
+
+    if profile or trace or cprofile:
+        # Commands may change directory, so resolve the trace path now.
+        trace_path = path.abspath(trace) if trace else None
+        tracing.TRACER.enable(cprofile)
+        ctx.call_on_close(functools.partial(finish_tracing, profile, trace_path, cprofile))
+
+
+def finish_tracing(profile, trace_path, profiled_phases):
+    """ Report the phase timings gathered for --profile, --trace and --cprofile.
+    """
+    if trace_path:
+        tracing.TRACER.write_chrome_trace(trace_path)
+        click.echo("Wrote trace to {0}".format(trace_path), err=True)
+    if profile:
+        click.echo(tracing.TRACER.summary_table(), err=True)
+    for phase in profiled_phases:
+        if not tracing.TRACER.profiled(phase):
+            click.echo("No cProfile of {0}: it didn't run, or only ran inside another profiled phase".format(phase),
+                       err=True)
+            continue
+        click.echo("cProfile of {0}:".format(phase), err=True)
+        click.echo(tracing.TRACER.profile_report(phase), err=True)
+        if trace_path:
+            profile_path = "{0}.{1}.prof".format(path.splitext(trace_path)[0], phase)
+            tracing.TRACER.dump_profile(phase, profile_path)
 
 
 def load_config(filename):
@@ -32,7 +71,7 @@ def load_config(filename):
     with open(filename, "r") as stream:
         try:
             global CONFIG
-            CONFIG = yaml.load(stream)
+            CONFIG = yaml.safe_load(stream)
         except yaml.YAMLError as ex:
             print(ex)
 
@@ -96,102 +135,1203 @@ def init(projectfolder, projectname, example):
         shutil.copyfile(configtemplate_src, configtemplate_dst)
 
 
-def get_feature_toggles_for_testrunner(product_config_file_path, optional_features):
-    with open(product_config_file_path, "r") as product_config_file:
-        product_features = []
-        product_features = [feature.strip() for feature in product_config_file.readlines()]
-        feature_toggles = [feature.strip() for feature in product_features]
-        optionals_names = [optional_feature.name for optional_feature in optional_features]
-        not_features = ["Not" + feature for feature in set(optionals_names) - set(product_features)]
-        feature_toggles.extend(not_features)
+def get_feature_toggles_for_testrunner(product_features, optional_features):
+    feature_toggles = list(product_features)
+    optionals_names = [optional_feature.name for optional_feature in optional_features]
+    not_features = ["Not" + feature for feature in set(optionals_names) - set(product_features)]
+    feature_toggles.extend(not_features)
+
+    return feature_toggles
+
+
+# Used when aplet.yml has no `fixtures` section.
+DEFAULT_FIXTURES = [
+    {
+        "name": "webdriver",
+        "command": ["phantomjs", "--webdriver", "4444"],
+        "scope": "productline",
+        "probe": {"tcp": "localhost:4444"},
+    },
+    {
+        "name": "app",
+        "command": ["php", "-S", "localhost:{port}", "-t", "{app_dir}"],
+        "scope": "product",
+        "probe": {"tcp": "localhost:{port}"},
+    },
+]
+
+# Port of the product's app fixture; shards of a product use the ports that follow it.
+DEFAULT_BASE_PORT = 8080
+
+# Where in the app before_product_steps writes the product's configuration.
+APP_PRODUCTCONFIG_FILENAME = "todo.config"
+
+# Size the cache of product run reports is kept within if aplet.yml doesn't say.
+DEFAULT_CACHE_MAX_SIZE_MB = 1024
+
+# Files and folders of the app left out of run fingerprints if aplet.yml doesn't say.
+DEFAULT_CACHE_APP_EXCLUDE = [".git"]
+
+# Memory to leave available when deciding whether to run another job at once, if aplet.yml doesn't say.
+DEFAULT_MIN_FREE_MEMORY_MB = 512
+
+# How long archived test reports are kept if aplet.yml doesn't say.
+DEFAULT_ARCHIVE_RETENTION_DAYS = 90
+
 
-        return feature_toggles
+def get_results_format():
+    """ Which of the runner's reports test results are read from: `results_format`
+    in aplet.yml, one of auto (the default), xml or json.
+    """
+    results_format = CONFIG.get("results_format", "auto")
+    if results_format not in parsers.RESULTS_FORMATS:
+        raise click.ClickException("results_format must be one of: " + ", ".join(parsers.RESULTS_FORMATS))
+    return results_format
+
+
+def start_fixtures(supervisor, scope, context):
+    """ Start the fixtures of the given scope, failing the command if one can't be made ready.
+    """
+    try:
+        started = supervisor.start(scope, context)
+    except FixtureError as ex:
+        raise click.ClickException(str(ex))
 
+    for fixture_name in started:
+        click.echo("Started fixture " + fixture_name)
 
-def before_productline_steps():
+
+def before_productline_steps(supervisor, productapp_path):
     """ Steps that need running to set up the test environment for whole product line.
     """
-    cmd = ['phantomjs', '--webdriver', '4444']
-    click.echo("Running command" + subprocess.list2cmdline(cmd))
-    process = subprocess.Popen(cmd)
-    RUNNING_TEST_PROCESSES.append(process)
+    with tracing.span("fixtures", scope="productline"):
+        start_fixtures(supervisor, "productline", {"app_dir": productapp_path})
 
 
-def before_product_steps(productconfig_filepath, productapp_path):
+def before_product_steps(supervisor, product_name, productconfig, productapp_path, port):
     """ Steps that need to run before an individual product is tested.
+    productconfig is the product's configuration in the .config format.
     """
     # TODO: this is product line specific and needs to be extracted
-    shutil.copyfile(productconfig_filepath, path.join(productapp_path, "todo.config"))
+    with open(path.join(productapp_path, APP_PRODUCTCONFIG_FILENAME), "w") as productconfig_file:
+        productconfig_file.write(productconfig)
+
+    with tracing.span("fixtures", scope="product", product=product_name):
+        start_fixtures(supervisor, "product", {"app_dir": productapp_path, "product": product_name, "port": port})
+
+
+def get_test_runner_command(test_runner_conf, feature_toggles, scenario_names=()):
+    """ Build the command line for the configured test runner.
+    If scenario names are given, the run is filtered down to just those scenarios.
+    """
+    cmd_list = [test_runner_conf['command']]
+    cmd_list.extend(test_runner_conf['arguments'])
+
+    for feature_toggle in feature_toggles:
+        cmd_list.append(test_runner_conf['feature_include_switch'])
+        cmd_list.append(feature_toggle)
+
+    for scenario_name in scenario_names:
+        cmd_list.append(test_runner_conf['scenario_filter_switch'])
+        cmd_list.append(scenario_name)
+
+    return cmd_list
+
+
+def get_output_dir(workspace_dir):
+    """ Where the test runner writes its reports when run from the given folder.
+    """
+    return path.join(workspace_dir, "tests", "_output")
+
+
+def get_test_run_progress(product_name, scenario_count, fail_fast):
+    """ Progress tracking for a product's run, using the runner's configured output patterns.
+    """
+    return progress.TestRunProgress(product_name, scenario_count, fail_fast,
+                                    CONFIG['test_runner'].get('progress_patterns'), click.echo)
+
+
+def get_job_memory_limiter():
+    """ The preexec_fn that applies `job_memory_limit_mb` in the `concurrency`
+    section of aplet.yml to the test runner, or None without one.
+    """
+    job_memory_limit_mb = (CONFIG.get("concurrency") or {}).get("job_memory_limit_mb")
+    if job_memory_limit_mb is None:
+        return None
+    try:
+        return concurrency.memory_limiter(job_memory_limit_mb * 1024 * 1024)
+    except ValueError as error:
+        raise click.ClickException("concurrency.job_memory_limit_mb can't be applied: {0}".format(error))
+
+
+def start_test_runner(cmd_list, workspace_dir, env):
+    """ Start the test runner with its output piped back to us line by line.
+    """
+    output_dir = get_output_dir(workspace_dir)
+    for report_name in ("report.xml", "report.json", "report.html"):
+        if path.exists(path.join(output_dir, report_name)):
+            remove(path.join(output_dir, report_name))
+
+    return subprocess.Popen(cmd_list, cwd=workspace_dir, env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1,
+                            preexec_fn=get_job_memory_limiter())
+
+
+def write_partial_report(output_dir, test_run_progress, process_index=0):
+    """ If the runner was stopped before writing its XML report, write one from
+    the scenario outcomes seen in its output so far.
+    """
+    report_path = path.join(output_dir, "report.xml")
+    if not path.exists(report_path):
+        if not path.exists(output_dir):
+            makedirs(output_dir)
+        with open(report_path, "w") as report_file:
+            report_file.write(test_run_progress.junit_xml(process_index))
+
+
+def run_product_tests(supervisor, workspace_dir, product_name, productconfig, app_dir,
+                      feature_toggles, scenario_names, port, test_run_progress):
+    """ Run the test runner once for a product from the given workspace folder,
+    following its progress as it goes.
+    Returns the runner's exit code.
+    """
+    before_product_steps(supervisor, product_name, productconfig, app_dir, port)
+
+    cmd_list = get_test_runner_command(CONFIG['test_runner'], feature_toggles, scenario_names)
+    click.echo("Running command" + subprocess.list2cmdline(cmd_list))
+    with tracing.span("test_runner", product=product_name, scenarios=len(scenario_names)):
+        process = start_test_runner(cmd_list, workspace_dir, dict(environ, APLET_PORT=str(port)))
+        test_run_progress.run([process])
+
+    if test_run_progress.aborted:
+        write_partial_report(get_output_dir(workspace_dir), test_run_progress)
+
+    return process.returncode
+
+
+def run_product_test_shards(projectfolder, product_name, productconfig, app_dir,
+                            feature_toggles, shards, test_run_progress):
+    """ Run each shard of a product's scenarios concurrently, each in its own
+    workspace and with its own product fixtures on its own port.
+    Returns the folder holding the merged reports of all the shards.
+    """
+    test_runner_conf = CONFIG['test_runner']
+    shards_dir = path.join(projectfolder, ".aplet", "shards", product_name)
+    base_port = CONFIG.get("base_port", DEFAULT_BASE_PORT)
+    product_fixture_specs = [spec for spec in CONFIG.get("fixtures", DEFAULT_FIXTURES)
+                             if spec.get("scope", "product") == "product"]
+
+    supervisors = []
+    processes = []
+    try:
+        for shard_index, shard_scenarios in enumerate(shards):
+            workspace_dir = path.join(shards_dir, str(shard_index))
+            sharding.create_shard_workspace(projectfolder, workspace_dir)
+
+            port = base_port + shard_index
+            supervisor = FixtureSupervisor(product_fixture_specs)
+            supervisors.append(supervisor)
+            before_product_steps(supervisor, product_name, productconfig, app_dir, port)
+
+            cmd_list = get_test_runner_command(test_runner_conf, feature_toggles, shard_scenarios)
+            env = dict(environ, APLET_PORT=str(port), APLET_SHARD=str(shard_index))
+            click.echo("Running shard {0} of {1} ({2} scenarios): {3}".format(
+                shard_index + 1, len(shards), len(shard_scenarios), subprocess.list2cmdline(cmd_list)))
+            processes.append(start_test_runner(cmd_list, workspace_dir, env))
+
+        with tracing.span("test_runner", product=product_name, shards=len(shards)):
+            test_run_progress.run(processes)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        for supervisor in supervisors:
+            supervisor.close()
+
+    merged_dir = path.join(shards_dir, "merged")
+    shard_output_dirs = [get_output_dir(path.join(shards_dir, str(shard_index)))
+                         for shard_index in range(len(shards))]
+    if test_run_progress.aborted:
+        for shard_index, shard_output_dir in enumerate(shard_output_dirs):
+            write_partial_report(shard_output_dir, test_run_progress, shard_index)
+    with tracing.span("merge_reports", product=product_name):
+        sharding.merge_shard_reports(shard_output_dirs, merged_dir)
+
+    return merged_dir
+
+
+def copy_product_reports(testreports_path, product_name, output_dir):
+    """ Copy the report files of the last test run into the test reports folder,
+    removing any the run didn't write, so that no report from an earlier run is
+    read as this run's.
+    """
+    testreport_path_without_ext = path.join(testreports_path, "report" + product_name)
+    for extension in (".json", ".html", ".xml"):
+        report_path = path.join(output_dir, "report" + extension)
+        if path.exists(report_path):
+            shutil.copyfile(report_path, testreport_path_without_ext + extension)
+        elif path.exists(testreport_path_without_ext + extension):
+            remove(testreport_path_without_ext + extension)
+
+
+def merge_rerun_reports(testreports_path, product_name, failed_scenarios, output_dir):
+    """ Merge the report of a rerun of failed scenarios into the product's existing report.
+    The rerun's events are appended to the product's json report, where they
+    supersede the earlier results. The rerun's own json and html reports are
+    kept alongside as rerun<Product>.*.
+    """
+    testreport_xml_path = path.join(testreports_path, "report" + product_name + ".xml")
+    testreport_json_path = path.join(testreports_path, "report" + product_name + ".json")
+    rerun_xml_path = path.join(output_dir, "report.xml")
+    rerun_json_path = path.join(output_dir, "report.json")
+    retry_history = reruns.RetryHistory(path.join(testreports_path, "retries" + product_name + ".json"))
+    for scenario_name in failed_scenarios:
+        retry_history.record_failure(scenario_name)
+
+    if path.exists(testreport_xml_path) and path.exists(rerun_xml_path):
+        with open(testreport_xml_path, "r") as report_file, open(rerun_xml_path, "r") as rerun_file:
+            merged_xml = reruns.merge_rerun_report(report_file.read(), rerun_file.read(), retry_history)
+        with open(testreport_xml_path, "w") as report_file:
+            report_file.write(merged_xml)
+    elif path.exists(rerun_json_path):
+        with open(rerun_json_path, "r") as rerun_file:
+            rerun_results, _ = parsers.TestResultsParser().get_test_results_for_product_from_json_stream(rerun_file)
+        for scenario_name, test_status in rerun_results.items():
+            retry_history.record_attempt(scenario_name, test_status)
+    retry_history.save()
+
+    if path.exists(testreport_json_path) and path.exists(rerun_json_path):
+        with open(testreport_json_path, "a") as report_file, open(rerun_json_path, "r") as rerun_file:
+            report_file.write("\n")
+            shutil.copyfileobj(rerun_file, report_file)
+    elif path.exists(testreport_json_path) and path.exists(rerun_xml_path):
+        # Without the rerun's results the json report is out of date, so only the merged xml one is kept.
+        remove(testreport_json_path)
+
+    rerun_path_without_ext = path.join(testreports_path, "rerun" + product_name)
+    for extension in (".json", ".html"):
+        report_path = path.join(output_dir, "report" + extension)
+        if path.exists(report_path):
+            shutil.copyfile(report_path, rerun_path_without_ext + extension)
+
+    for scenario_name in retry_history.flaky_scenarios():
+        click.echo("Flaky scenario in {0}: {1}".format(product_name, scenario_name))
+
+
+def plan_product_run(product_name, product_matrix, testreports_path, featuremodel, scenarios_by_tag,
+                     rerun_failed, shards):
+    """ Work out what needs running for a product: its feature toggles, how many
+    scenarios will run, and the scenarios to run split into one or more shards
+    (an empty scenario list runs everything the toggles select).
+    Returns None if there is nothing to run.
+    """
+    resultsparser = parsers.TestResultsParser()
+    results_format = get_results_format()
+
+    failed_scenarios = []
+    if rerun_failed:
+        with tracing.span("parse_report", product=product_name):
+            results, _ = resultsparser.get_test_results_for_product(testreports_path, product_name, results_format)
+        failed_scenarios = [scenario_name for scenario_name, test_status in results.items()
+                            if test_status is TestState.failed]
+        if not failed_scenarios:
+            click.echo("No failed scenarios to rerun for {0}".format(product_name))
+            return None
+
+    feature_toggles = get_feature_toggles_for_testrunner(product_matrix.features_of(product_name),
+                                                         featuremodel.optional_features())
+
+    selected_scenarios = failed_scenarios
+    if not rerun_failed:
+        selected_scenarios = sharding.select_scenarios(scenarios_by_tag, feature_toggles)
+
+    product_shards = [failed_scenarios]
+    if shards > 1 and len(selected_scenarios) > 1:
+        with tracing.span("parse_report", product=product_name):
+            _, durations = resultsparser.get_test_results_for_product(testreports_path, product_name, results_format)
+        product_shards = sharding.partition_scenarios(selected_scenarios, durations, shards)
+
+    return {
+        "product_name": product_name,
+        "productconfig": product_matrix.config_text(product_name),
+        "feature_toggles": feature_toggles,
+        "failed_scenarios": failed_scenarios,
+        "scenario_count": len(selected_scenarios),
+        "shards": product_shards,
+    }
+
+
+def get_report_archive(projectfolder):
+    """ The archive that keeps the reports of every run, unless disabled with `archive: false`.
+    """
+    archive_conf = CONFIG.get("archive")
+    if archive_conf is False:
+        return None
+    compression = (archive_conf or {}).get("compression")
+    return archive.ReportArchive(path.join(projectfolder, ".aplet", "archive"), compression)
+
+
+def evict_archived_reports(report_archive):
+    """ Apply the configured retention policy to the report archive.
+    """
+    archive_conf = CONFIG.get("archive") or {}
+    max_size_mb = archive_conf.get("max_size_mb")
+    removed = report_archive.evict(
+        retention_days=archive_conf.get("retention_days", DEFAULT_ARCHIVE_RETENTION_DAYS),
+        max_runs=archive_conf.get("max_runs"),
+        max_bytes=max_size_mb * 1024 * 1024 if max_size_mb is not None else None)
+    if removed:
+        click.echo("Evicted {0} archived runs".format(len(removed)))
+
+
+def get_run_cache(projectfolder):
+    """ The cache of product run reports by fingerprint, unless disabled with `cache: false`.
+    """
+    if CONFIG.get("cache") is False:
+        return None
+    return runcache.RunCache(path.join(projectfolder, ".aplet", "cache"))
+
 
-    cmd = ['php', '-S', 'localhost:8080', '-t', productapp_path]
-    process = subprocess.Popen(cmd)
+def evict_cached_reports(run_cache):
+    """ Keep the run cache within its configured size.
+    """
+    max_size_mb = (CONFIG.get("cache") or {}).get("max_size_mb", DEFAULT_CACHE_MAX_SIZE_MB)
+    removed = run_cache.evict(max_size_mb * 1024 * 1024)
+    if removed:
+        click.echo("Evicted {0} cached product runs".format(removed))
+
+
+def fingerprint_product_runs(projectfolder, app_dir, bddfeatures_path, product_runs, fail_fast):
+    """ Fingerprint each product run by everything that can affect its results:
+    the product's config and feature toggles, the feature files its toggles
+    select, the app, the project's tests and the test runner and fixture
+    settings. Reruns of failed scenarios depend on the previous results, so
+    they aren't fingerprinted.
+    """
+    cache_conf = CONFIG.get("cache") or {}
+    digest_mode = cache_conf.get("app_digest", "content")
+    if digest_mode not in runcache.FOLDER_DIGEST_MODES:
+        raise click.ClickException("cache.app_digest must be one of: " + ", ".join(runcache.FOLDER_DIGEST_MODES))
+
+    app_excluded = [APP_PRODUCTCONFIG_FILENAME, ".aplet"] + cache_conf.get("app_exclude", DEFAULT_CACHE_APP_EXCLUDE)
+    tests_path = path.join(projectfolder, "tests")
+    shared_inputs = {
+        "test_runner": CONFIG["test_runner"],
+        "fixtures": CONFIG.get("fixtures", DEFAULT_FIXTURES),
+        "fail_fast": fail_fast,
+        "app": runcache.folder_digest(app_dir, digest_mode, app_excluded),
+        "tests": runcache.folder_digest(tests_path, digest_mode, ["_output"]) if path.exists(tests_path) else None,
+    }
+
+    feature_file_tags = {}
+    feature_file_digests = {}
+    if path.exists(bddfeatures_path):
+        feature_file_tags = ftrenderer.feature_file_tags(bddfeatures_path)
+        feature_file_digests = {feature_filename: runcache.file_digest(path.join(bddfeatures_path, feature_filename))
+                                for feature_filename in feature_file_tags}
+
+    for product_run in product_runs:
+        if product_run["failed_scenarios"]:
+            continue
+        feature_toggles = set(product_run["feature_toggles"])
+        product_run["fingerprint"] = runcache.fingerprint(dict(
+            shared_inputs,
+            productconfig=product_run["productconfig"],
+            feature_toggles=sorted(feature_toggles),
+            feature_files={feature_filename: feature_file_digests[feature_filename]
+                           for feature_filename, tag_names in feature_file_tags.items() if tag_names & feature_toggles}))
+
+
+def restore_cached_product_runs(testreports_path, product_runs, run_cache, report_archive, run_id):
+    """ Restore the reports of the product runs whose fingerprint is in the
+    cache, as if they had just run. Returns the product runs left to run.
+    """
+    uncached_product_runs = []
+    for product_run in product_runs:
+        cached_output_dir = None
+        if product_run.get("fingerprint") is not None:
+            cached_output_dir = run_cache.lookup(product_run["fingerprint"])
+        if cached_output_dir is None:
+            uncached_product_runs.append(product_run)
+            continue
+
+        click.echo("Restored the reports of {0}, whose inputs haven't changed since they were cached".format(
+            product_run["product_name"]))
+        finish_product_run(testreports_path, product_run, cached_output_dir, report_archive, run_id)
+    return uncached_product_runs
+
+
+def finish_product_run(testreports_path, product_run, output_dir, report_archive, run_id, run_cache=None):
+    """ Store the reports of a finished product run in the test reports folder,
+    in the report archive under the current run, and in the run cache under the
+    run's fingerprint.
+    """
+    product_name = product_run["product_name"]
+    with tracing.span("store_reports", product=product_name):
+        if product_run["failed_scenarios"]:
+            merge_rerun_reports(testreports_path, product_name, product_run["failed_scenarios"], output_dir)
+        else:
+            copy_product_reports(testreports_path, product_name, output_dir)
+
+    report_paths = {}
+    for report_type in ("xml", "json", "html"):
+        report_path = path.join(testreports_path, "report{0}.{1}".format(product_name, report_type))
+        if path.exists(report_path):
+            report_paths[report_type] = report_path
+
+    if report_archive is not None:
+        with tracing.span("archive_reports", product=product_name):
+            report_archive.add_reports(run_id, product_name, report_paths)
+    if run_cache is not None and product_run.get("fingerprint") is not None:
+        run_cache.add_reports(product_run["fingerprint"], product_name, report_paths)
+
+
+def write_job_output(jobs_dir, job, reports):
+    """ Write the reports of a job ({report name: content}) into the job's own folder.
+    """
+    job_output_dir = path.join(jobs_dir, job["product"], str(job["shard"]))
+    if path.exists(job_output_dir):
+        shutil.rmtree(job_output_dir)
+    makedirs(job_output_dir)
+
+    for report_name, content in reports.items():
+        with open(path.join(job_output_dir, report_name), "wb") as report_file:
+            report_file.write(content)
 
-    RUNNING_TEST_PROCESSES.append(process)
+
+def write_job_reports(jobs_dir, job, result):
+    """ Write the reports sent back by a worker into the job's own folder.
+    """
+    write_job_output(jobs_dir, job, distributed.decode_reports(result["reports"]))
+    click.echo("Received {0} (exit code {1})".format(job["job_id"], result["returncode"]))
+
+
+def get_product_jobs(product_runs, fail_fast):
+    """ Every product run's shards (or the whole run, if it isn't sharded) as separately runnable jobs.
+    """
+    jobs = []
+    for product_run in product_runs:
+        for shard_index, shard_scenarios in enumerate(product_run["shards"]):
+            jobs.append({
+                "job_id": "{0}/{1}".format(product_run["product_name"], shard_index),
+                "product": product_run["product_name"],
+                "shard": shard_index,
+                "productconfig": product_run["productconfig"],
+                "feature_toggles": product_run["feature_toggles"],
+                "scenarios": shard_scenarios,
+                "scenario_count": len(shard_scenarios) or product_run["scenario_count"],
+                "fail_fast": fail_fast,
+            })
+    return jobs
+
+
+def finish_product_jobs(jobs_dir, testreports_path, product_run, report_archive, run_id, run_cache=None):
+    """ Merge the reports of a product run's jobs, if it was sharded, and store them.
+    """
+    product_jobs_dir = path.join(jobs_dir, product_run["product_name"])
+    output_dir = path.join(product_jobs_dir, "0")
+    if len(product_run["shards"]) > 1:
+        output_dir = path.join(product_jobs_dir, "merged")
+        shard_output_dirs = [path.join(product_jobs_dir, str(shard_index))
+                             for shard_index in range(len(product_run["shards"]))]
+        sharding.merge_shard_reports(shard_output_dirs, output_dir)
+    finish_product_run(testreports_path, product_run, output_dir, report_archive, run_id, run_cache)
+
+
+def run_products_distributed(projectfolder, testreports_path, product_runs, serve, job_timeout, fail_fast,
+                             report_archive, run_id, run_cache=None):
+    """ Hand out every product (or product shard) as a job to workers started
+    with `aplet worker`, then store the reports they send back.
+    """
+    jobs = get_product_jobs(product_runs, fail_fast)
+    jobs_dir = path.join(projectfolder, ".aplet", "jobs")
+    host, port = distributed.parse_address(serve)
+    coordinator = distributed.Coordinator(jobs, host, port, job_timeout, functools.partial(write_job_reports, jobs_dir))
+    click.echo("Serving {0} jobs on {1}:{2}".format(len(jobs), *coordinator.address))
+    with tracing.span("distributed_jobs", jobs=len(jobs)):
+        coordinator.run()
+
+    for product_run in product_runs:
+        finish_product_jobs(jobs_dir, testreports_path, product_run, report_archive, run_id, run_cache)
 
 
 @cli.command()
 @click.option("--projectfolder", default=".", help="Location to output the aplet files")
 @click.option("--product", help="If provided, will run for single product.  Otherwise all products are tested")
+@click.option("--rerun-failed", is_flag=True, help="Only rerun the scenarios that failed in the last run of each product")
+@click.option("--shards", default=1, help="Split each product's scenarios into this many concurrently run shards")
+@click.option("--serve", help="host:port to hand out the product runs to `aplet worker` processes on")
+@click.option("--job-timeout", type=float, help="Seconds after which a worker's job is handed to another worker")
+@click.option("--fail-fast", type=int, help="Stop testing a product once this many of its scenarios have failed")
+@click.option("--jobs", type=click.IntRange(1), help="Most products (or shards) to test at once, adjusted below this "
+              "to the machine's load. Defaults to concurrency.max_jobs in aplet.yml, else 1")
+@click.option("--no-cache", is_flag=True, help="Run every product, even those whose inputs match a cached run")
 @click.argument("app_dir")
-def runtests(projectfolder, product, app_dir):
+def runtests(projectfolder, product, rerun_failed, shards, serve, job_timeout, fail_fast, jobs, no_cache, app_dir):
     """ Runs the tests for a given product.
     Outputs the report files to a folder for later use.
     TODO: Should be able to run for all products at once.
     """
-
+    projectfolder = path.abspath(projectfolder)
     featuremodel_path = path.join(projectfolder, "productline", "model.xml")
     configs_path = path.join(projectfolder, "productline", "configs")
+    bddfeatures_path = path.join(projectfolder, "bddfeatures")
     testreports_path = path.join(projectfolder, "testreports")
 
     if not path.exists(testreports_path):
         makedirs(testreports_path)
 
-    fmparser = parsers.FeatureModelParser()
-    featuremodel = fmparser.parse_from_file(featuremodel_path)
-    configparser = parsers.ProductConfigParser(featuremodel.root_feature.name)
+    with tracing.span("parse_model"):
+        featuremodel = parse_feature_model(featuremodel_path)
 
-    before_productline_steps()
+    test_runner_conf = CONFIG['test_runner']
+    if (rerun_failed or shards > 1) and 'scenario_filter_switch' not in test_runner_conf:
+        raise click.ClickException("--rerun-failed and --shards need a scenario_filter_switch in the test_runner config")
+
+    scenarios_by_tag = {}
+    if path.exists(bddfeatures_path):
+        with tracing.span("parse_gherkin"):
+            scenarios_by_tag = ftrenderer.scenarios_grouped_by_tag(bddfeatures_path)
 
     # Figure out which products to run for.
+    product_matrix = get_product_matrix(configs_path)
     product_names = []
     if product is None:
-        product_names = get_product_names_from_configs_path(configs_path)
-    else:
+        product_names = list(product_matrix.products)
+    elif product in product_matrix.rows:
         product_names = [product]
-
+    else:
+        raise click.ClickException("Product {0} is not configured in {1}".format(product, configs_path))
+
+    # Don't spend runner time on products the feature model doesn't allow.
+    with tracing.span("validate_products"):
+        validator = get_configuration_validator(featuremodel)
+        product_violations = get_product_violations(validator, featuremodel, product_matrix, product_names)
+    for product_name, violations in sorted(product_violations.items()):
+        if violations:
+            click.echo("Skipping invalid product {0}: {1}".format(product_name, "; ".join(violations)))
+            product_names.remove(product_name)
+
+    product_runs = []
     for product_name in product_names:
-        productconfig_filepath = path.join(configs_path, product_name + ".config")
+        with tracing.span("plan_product", product=product_name):
+            product_run = plan_product_run(product_name, product_matrix, testreports_path, featuremodel,
+                                           scenarios_by_tag, rerun_failed, shards)
+        if product_run is not None:
+            product_runs.append(product_run)
+
+    report_archive = get_report_archive(projectfolder)
+    run_id = report_archive.new_run_id() if report_archive is not None else archive.new_run_id()
+
+    # Products whose inputs haven't changed since a cached run needn't run again.
+    run_cache = get_run_cache(projectfolder)
+    if run_cache is not None:
+        with tracing.span("fingerprint_products"):
+            fingerprint_product_runs(projectfolder, app_dir, bddfeatures_path, product_runs, fail_fast)
+        if not no_cache:
+            product_runs = restore_cached_product_runs(testreports_path, product_runs, run_cache, report_archive,
+                                                       run_id)
+
+    max_jobs = get_max_jobs(jobs)
+    if not product_runs:
+        click.echo("No products need running")
+    elif serve:
+        run_products_distributed(projectfolder, testreports_path, product_runs, serve, job_timeout, fail_fast,
+                                 report_archive, run_id, run_cache)
+    elif max_jobs > 1:
+        run_products_in_parallel(projectfolder, testreports_path, product_runs, app_dir, fail_fast, report_archive,
+                                 run_id, max_jobs, run_cache)
+    else:
+        run_products_locally(projectfolder, testreports_path, product_runs, app_dir, fail_fast,
+                             report_archive, run_id, run_cache)
+
+    if report_archive is not None:
+        # The results cube keeps the run's results after the archive evicts it.
+        if CONFIG.get("history") is not False:
+            get_results_cube(projectfolder)
+        evict_archived_reports(report_archive)
+    if run_cache is not None:
+        evict_cached_reports(run_cache)
 
-        before_product_steps(productconfig_filepath, app_dir)
 
-        product_features = configparser.parse_config(productconfig_filepath)
-        trimmed_featuremodel = featuremodel.get_copy_trimmed_based_on_config(product_features)
-        feature_toggles = get_feature_toggles_for_testrunner(productconfig_filepath, featuremodel.optional_features())
+def run_products_locally(projectfolder, testreports_path, product_runs, app_dir, fail_fast, report_archive, run_id,
+                         run_cache=None):
+    """ Run every product (sharded or not) on this machine, one after the other.
+    """
+    test_runner_conf = CONFIG['test_runner']
+
+    with FixtureSupervisor(CONFIG.get("fixtures", DEFAULT_FIXTURES)) as supervisor:
+        before_productline_steps(supervisor, app_dir)
+
+        for product_run in product_runs:
+            click.echo("Running tests with {0}".format(test_runner_conf['name']))
+
+            chdir(projectfolder)
+            output_dir = get_output_dir(projectfolder)
+            test_run_progress = get_test_run_progress(product_run["product_name"], product_run["scenario_count"],
+                                                      fail_fast)
+
+            if len(product_run["shards"]) > 1:
+                # Shard 0 serves on base_port, where an earlier unsharded product's fixtures may still be running.
+                supervisor.stop("product")
+                output_dir = run_product_test_shards(projectfolder, product_run["product_name"],
+                                                     product_run["productconfig"], app_dir,
+                                                     product_run["feature_toggles"], product_run["shards"],
+                                                     test_run_progress)
+            else:
+                run_product_tests(supervisor, projectfolder, product_run["product_name"],
+                                  product_run["productconfig"], app_dir, product_run["feature_toggles"],
+                                  product_run["shards"][0], CONFIG.get("base_port", DEFAULT_BASE_PORT),
+                                  test_run_progress)
+
+            finish_product_run(testreports_path, product_run, output_dir, report_archive, run_id, run_cache)
+
+        chdir("..")
+
+
+def get_max_jobs(jobs):
+    """ The most jobs to run at once: --jobs if given, otherwise `max_jobs` in
+    the `concurrency` section of aplet.yml, otherwise 1. Running in parallel
+    is opt-in, since each job serves its own copy of the app on its own port,
+    which suites that hard-code the app's address can't follow.
+    """
+    if jobs is not None:
+        return jobs
+    return (CONFIG.get("concurrency") or {}).get("max_jobs") or 1
+
+
+def get_job_failure_rate(reports):
+    """ The share of a job's scenarios that failed, from the reports it wrote.
+    A job that left no readable report counts as having failed entirely.
+    """
+    resultsparser = parsers.TestResultsParser()
+    try:
+        if "report.xml" in reports:
+            results = resultsparser.get_gherkin_piece_test_statuses_for_product_from_stream(
+                io.BytesIO(reports["report.xml"]))
+        elif "report.json" in reports:
+            results, _ = resultsparser.get_test_results_for_product_from_json_stream(io.BytesIO(reports["report.json"]))
+        else:
+            return 1.0
+    except (et.ParseError, ValueError):
+        return 1.0
+
+    if not results:
+        return 0.0
+    return sum(1 for test_status in results.values() if test_status is TestState.failed) / len(results)
+
+
+def copy_app(app_dir, app_copy_dir):
+    """ Copy the app for a job slot or worker of its own, since each product
+    writes its config into the app it is tested against.
+    """
+    if path.exists(app_copy_dir):
+        shutil.rmtree(app_copy_dir)
+    shutil.copytree(app_dir, app_copy_dir, symlinks=True, ignore=shutil.ignore_patterns(".aplet"))
+    return app_copy_dir
 
-        test_runner_conf = CONFIG['test_runner']
-        click.echo("Running tests with {0}".format(test_runner_conf['name']))
 
-        chdir(projectfolder)
-        cmd_list = [test_runner_conf['command']]
-        cmd_list.extend(test_runner_conf['arguments'])
+def create_job_slot(projectfolder, app_dir, slot, product_fixture_specs):
+    """ What a slot of run_products_in_parallel runs its jobs with: its own
+    workspace, its own copy of the app (each product writes its config into
+    the app), its own port and its own product fixtures.
+    """
+    slot_dir = path.join(projectfolder, ".aplet", "slots", str(slot))
+    workspace_dir = path.join(slot_dir, "workspace")
+    sharding.create_shard_workspace(projectfolder, workspace_dir)
+
+    return {
+        "workspace_dir": workspace_dir,
+        "app_dir": copy_app(app_dir, path.join(slot_dir, "app")),
+        "port": CONFIG.get("base_port", DEFAULT_BASE_PORT) + slot,
+        "supervisor": FixtureSupervisor(product_fixture_specs),
+    }
+
+
+def run_products_in_parallel(projectfolder, testreports_path, product_runs, app_dir, fail_fast, report_archive,
+                             run_id, max_jobs, run_cache=None):
+    """ Run every product (or product shard) as a job on this machine, as many
+    at once as it copes with, up to max_jobs. Each product's reports are stored
+    as soon as all its jobs have finished.
+    """
+    concurrency_conf = CONFIG.get("concurrency") or {}
+    job_memory_limit_mb = concurrency_conf.get("job_memory_limit_mb")
+    controller = concurrency.ConcurrencyController(
+        max_jobs,
+        job_memory=job_memory_limit_mb * 1024 * 1024 if job_memory_limit_mb is not None else None,
+        min_free_memory=concurrency_conf.get("min_free_memory_mb", DEFAULT_MIN_FREE_MEMORY_MB) * 1024 * 1024)
+
+    jobs = get_product_jobs(product_runs, fail_fast)
+    jobs_dir = path.join(projectfolder, ".aplet", "jobs")
+    product_runs_by_name = {product_run["product_name"]: product_run for product_run in product_runs}
+    unfinished_jobs = {product_run["product_name"]: len(product_run["shards"]) for product_run in product_runs}
+    product_fixture_specs = [spec for spec in CONFIG.get("fixtures", DEFAULT_FIXTURES)
+                             if spec.get("scope", "product") == "product"]
+    # Slots are set up by their first job and reused by the ones after it.
+    slots = {}
+
+    def run_job(slot, job):
+        if slot not in slots:
+            slots[slot] = create_job_slot(projectfolder, app_dir, slot, product_fixture_specs)
+        job_slot = slots[slot]
+        return run_test_job(job_slot["supervisor"], job_slot["workspace_dir"], job_slot["app_dir"], job_slot["port"],
+                            job)
+
+    def finish_job(job, result):
+        returncode, reports = result
+        write_job_output(jobs_dir, job, reports)
+        controller.record_job(get_job_failure_rate(reports))
+        click.echo("Finished {0} (exit code {1})".format(job["job_id"], returncode))
+
+        unfinished_jobs[job["product"]] -= 1
+        if not unfinished_jobs[job["product"]]:
+            finish_product_jobs(jobs_dir, testreports_path, product_runs_by_name[job["product"]], report_archive,
+                                run_id, run_cache)
+
+    with FixtureSupervisor(CONFIG.get("fixtures", DEFAULT_FIXTURES)) as supervisor:
+        before_productline_steps(supervisor, app_dir)
+        try:
+            with tracing.span("parallel_jobs", jobs=len(jobs), max_jobs=max_jobs):
+                concurrency.AdaptivePool(controller, echo=click.echo).run(jobs, run_job, finish_job)
+        finally:
+            for job_slot in slots.values():
+                job_slot["supervisor"].close()
 
-        for feature_toggle in feature_toggles:
-            cmd_list.append(test_runner_conf['feature_include_switch'])
-            cmd_list.append(feature_toggle)
 
-        click.echo("Running command" + subprocess.list2cmdline(cmd_list))
-        subprocess.call(cmd_list)
+def run_test_job(supervisor, workspace_dir, app_dir, port, job):
+    """ Run a job handed out by the coordinator, returning the runner's exit code
+    and the contents of the reports it wrote.
+    """
+    output_dir = get_output_dir(workspace_dir)
+    if path.exists(output_dir):
+        shutil.rmtree(output_dir)
 
-        # copying report file for product
-        testreport_path_without_ext = path.join(testreports_path, "report" + product_name)
-        shutil.copyfile("tests/_output/report.json", path.join(testreport_path_without_ext + ".json"))
-        shutil.copyfile("tests/_output/report.html", path.join(testreport_path_without_ext + ".html"))
-        shutil.copyfile("tests/_output/report.xml", path.join(testreport_path_without_ext + ".xml"))
+    test_run_progress = get_test_run_progress(job["job_id"], job["scenario_count"], job["fail_fast"])
+    returncode = run_product_tests(supervisor, workspace_dir, job["product"], job["productconfig"], app_dir,
+                                   job["feature_toggles"], job["scenarios"], port, test_run_progress)
 
-    chdir("..")
+    reports = {}
+    for report_name in ("report.xml", "report.json", "report.html"):
+        report_path = path.join(output_dir, report_name)
+        if path.exists(report_path):
+            with open(report_path, "rb") as report_file:
+                reports[report_name] = report_file.read()
 
-    for process in RUNNING_TEST_PROCESSES:
-        process.terminate()
+    return returncode, reports
+
+
+@cli.command()
+@click.option("--connect", required=True, help="host:port of a coordinator started with `aplet runtests --serve`")
+@click.option("--projectfolder", default=".", help="Location of this worker's copy of the aplet project")
+@click.option("--port", type=int, help="Port for this worker's product fixtures, if not the configured base_port")
+@click.argument("app_dir")
+def worker(connect, projectfolder, port, app_dir):
+    """ Run product test jobs handed out by a `runtests --serve` coordinator.
+    Each worker tests a copy of APP_DIR of its own, so several can share a machine
+    (given different --port values).
+    """
+    projectfolder = path.abspath(projectfolder)
+    worker_dir = path.join(projectfolder, ".aplet", "worker-{0}".format(getpid()))
+    workspace_dir = path.join(worker_dir, "workspace")
+    if port is None:
+        port = CONFIG.get("base_port", DEFAULT_BASE_PORT)
+    host, coordinator_port = distributed.parse_address(connect)
+
+    try:
+        sharding.create_shard_workspace(projectfolder, workspace_dir)
+        app_dir = copy_app(app_dir, path.join(worker_dir, "app"))
+        with FixtureSupervisor(CONFIG.get("fixtures", DEFAULT_FIXTURES)) as supervisor:
+            before_productline_steps(supervisor, app_dir)
+            job_runner = functools.partial(run_test_job, supervisor, workspace_dir, app_dir, port)
+            jobs_run = distributed.Worker(host, coordinator_port, job_runner).run()
+    finally:
+        if path.exists(worker_dir):
+            shutil.rmtree(worker_dir)
+    click.echo("Worker finished after running {0} jobs".format(jobs_run))
+
+
+@cli.group(name="archive")
+def archive_group():
+    """ Inspect and prune the archive of test reports from previous runs.
+    """
+    pass
+
+
+@archive_group.command(name="list")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+def archive_list(projectfolder):
+    """ List the archived runs and the products they have reports for.
+    """
+    report_archive = archive.ReportArchive(path.join(projectfolder, ".aplet", "archive"))
+    for manifest in report_archive.runs():
+        click.echo("{0}  {1} products".format(manifest["run_id"], len(manifest["reports"])))
+    click.echo("{0:.1f} MB stored".format(report_archive.size() / (1024 * 1024)))
+
+
+def read_archived_results(report_archive, run_id, product_name):
+    """ The scenario results of a product in an archived run, from its JSON
+    report unless results_format is xml or there is none.
+    """
+    resultsparser = parsers.TestResultsParser()
+    report_type = "xml"
+    if get_results_format() != "xml" and "json" in report_archive.report_types(run_id, product_name):
+        report_type = "json"
+    with report_archive.open_report(run_id, product_name, report_type) as report_stream:
+        if report_type == "json":
+            results, _ = resultsparser.get_test_results_for_product_from_json_stream(report_stream)
+        else:
+            results = resultsparser.get_gherkin_piece_test_statuses_for_product_from_stream(report_stream)
+    return results
+
+
+@archive_group.command(name="results")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+@click.argument("run_id")
+@click.argument("product")
+def archive_results(projectfolder, run_id, product):
+    """ Show the scenario results of a product in an archived run.
+    """
+    report_archive = archive.ReportArchive(path.join(projectfolder, ".aplet", "archive"))
+    results = read_archived_results(report_archive, run_id, product)
+    for scenario_name, test_status in sorted(results.items()):
+        click.echo("{0}  {1}".format(test_status.name, scenario_name))
+
+
+@archive_group.command(name="evict")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+def archive_evict(projectfolder):
+    """ Apply the configured retention policy to the archive now.
+    """
+    evict_archived_reports(archive.ReportArchive(path.join(projectfolder, ".aplet", "archive")))
+
+
+@cli.group(name="cache")
+def cache_group():
+    """ Manage the cache of product run reports that lets runtests skip products whose inputs haven't changed.
+    """
+    pass
+
+
+@cache_group.command(name="evict")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+def cache_evict(projectfolder):
+    """ Shrink the cache to its configured size now.
+    """
+    run_cache = runcache.RunCache(path.join(projectfolder, ".aplet", "cache"))
+    evict_cached_reports(run_cache)
+    click.echo("{0:.1f} MB cached".format(run_cache.size() / (1024 * 1024)))
+
+
+@cache_group.command(name="clear")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+def cache_clear(projectfolder):
+    """ Remove every cached product run, so that the next runtests runs every product.
+    """
+    removed = runcache.RunCache(path.join(projectfolder, ".aplet", "cache")).clear()
+    click.echo("Removed {0} cached product runs".format(removed))
+
+
+def get_results_cube(projectfolder, rebuild=False):
+    """ Load the results cube, first adding the results of archived runs it
+    doesn't have yet. Rebuilding starts the cube over from the archive, so it
+    loses the runs the archive has since evicted.
+    """
+    results_cube = history.ResultsCube(path.join(projectfolder, ".aplet", "history"))
+    if rebuild:
+        results_cube.clear()
+
+    archive_dir = path.join(projectfolder, ".aplet", "archive")
+    if not path.exists(archive_dir):
+        return results_cube
+
+    report_archive = archive.ReportArchive(archive_dir)
+    synced = time.time()
+    with tracing.span("sync_history"):
+        # A second of slack for file systems with coarse modification times.
+        modified_since = results_cube.synced - 1 if results_cube.synced is not None else None
+        for manifest in report_archive.runs(modified_since):
+            run_products = results_cube.get_run_products(manifest["run_id"])
+            for product_name in sorted(set(manifest["reports"]) - run_products):
+                if not {"xml", "json"} & set(manifest["reports"][product_name]):
+                    continue
+                results = read_archived_results(report_archive, manifest["run_id"], product_name)
+                results_cube.add_results(manifest["run_id"], product_name, results)
+        results_cube.set_synced(synced)
+
+    return results_cube
+
+
+@cli.group(name="history")
+def history_group():
+    """ Query the results of every run, kept in a compact cube that outlives the report archive's retention.
+    """
+    pass
+
+
+@history_group.command(name="flips")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+@click.option("--product", help="Only count the flips of this product")
+@click.option("--limit", default=10, help="How many scenarios to list")
+def history_flips(projectfolder, product, limit):
+    """ List the scenarios whose result flips between passed and failed most often.
+    """
+    results_cube = get_results_cube(projectfolder)
+    with tracing.span("flip_counts"):
+        flips = results_cube.get_flip_counts()
+    if product is not None:
+        product_index = results_cube.products.get(product)
+        if product_index is None:
+            raise click.ClickException("No results for product {0}".format(product))
+        flips = flips[product_index:product_index + 1]
+
+    scenario_flips = flips.sum(axis=0)
+    flipping_products = (flips > 0).sum(axis=0)
+    for scenario_index in np.argsort(-scenario_flips, kind="stable")[:limit]:
+        if not scenario_flips[scenario_index]:
+            break
+        click.echo("{0:6d}  {1}  ({2} products)".format(
+            scenario_flips[scenario_index], results_cube.scenarios.names[scenario_index],
+            flipping_products[scenario_index]))
+
+
+@history_group.command(name="regressions")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+@click.option("--until", "until_run_id", help="Compare with this run rather than the latest")
+@click.argument("run_id")
+def history_regressions(projectfolder, until_run_id, run_id):
+    """ List the scenarios of each product that passed in RUN_ID but fail in the latest run.
+    """
+    results_cube = get_results_cube(projectfolder)
+    if until_run_id is None and len(results_cube.runs):
+        until_run_id = results_cube.runs.names[-1]
+    try:
+        before = results_cube.get_run_results(run_id)
+        after = results_cube.get_run_results(until_run_id)
+    except KeyError as ex:
+        raise click.ClickException("No results for run {0}".format(ex.args[0]))
+
+    regressed = (before == TestState.passed.value) & (after == TestState.failed.value)
+    for product_index, scenario_index in np.argwhere(regressed):
+        click.echo("{0}: {1}".format(results_cube.products.names[product_index],
+                                     results_cube.scenarios.names[scenario_index]))
+    click.echo("{0} scenarios regressed between {1} and {2}".format(int(regressed.sum()), run_id, until_run_id))
+
+
+@history_group.command(name="rebuild")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+def history_rebuild(projectfolder):
+    """ Rebuild the results cube from the report archive.
+    """
+    results_cube = get_results_cube(projectfolder, rebuild=True)
+    click.echo("{0} runs of {1} products over {2} scenarios".format(
+        len(results_cube.runs), len(results_cube.products), len(results_cube.scenarios)))
+
+
+def get_productline_index(projectfolder, rebuild=False):
+    """ Load the product line index, rebuilding it first if it is missing or any
+    of the files it was built from have changed.
+    """
+    featuremodel_path = path.join(projectfolder, "productline", "model.xml")
+    configs_path = path.join(projectfolder, "productline", "configs")
+    bddfeatures_path = path.join(projectfolder, "bddfeatures")
+    aplet_dir = path.join(projectfolder, ".aplet")
+    index_path = path.join(aplet_dir, "index.json")
+    source_paths = [featuremodel_path, configs_path, bddfeatures_path]
+
+    with tracing.span("load_index"):
+        productline_index = None if rebuild else index.load_index(index_path)
+        if productline_index is not None and not productline_index.is_stale(source_paths):
+            return productline_index
+
+    with tracing.span("parse_model"):
+        featuremodel = parse_feature_model(featuremodel_path)
+    configparser = parsers.ProductConfigParser(featuremodel.root_feature.name)
+    product_matrix = get_product_matrix(configs_path)
+    product_features = {}
+    for product_name in product_matrix.products:
+        product_features[product_name] = configparser.parse_product(product_matrix, product_name)
+    with tracing.span("parse_gherkin"):
+        gherkin_pieces = ftrenderer.gherkin_pieces_grouped_by_featurename(bddfeatures_path)
+
+    with tracing.span("build_index"):
+        productline_index = index.build_index(featuremodel, product_features, gherkin_pieces,
+                                              index.get_sources_fingerprint(source_paths))
+    if not path.exists(aplet_dir):
+        makedirs(aplet_dir)
+    productline_index.save(index_path)
+
+    return productline_index
+
+
+# The queries `aplet query` answers, and the index lookup for each.
+QUERIES = {
+    "products": lambda productline_index, name: productline_index.products_with_feature(name),
+    "scenarios": lambda productline_index, name: productline_index.scenarios_for_feature(name),
+    "features": lambda productline_index, name: productline_index.features_for_scenario(name),
+    "untested": lambda productline_index, name: productline_index.features_without_scenarios(),
+}
+
+
+@cli.group()
+def query():
+    """ Look up features, products and scenarios in the product line index.
+    The index is kept in .aplet/index.json and rebuilt whenever the model,
+    product configs or feature files change.
+    """
+    pass
+
+
+@query.command(name="products")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+@click.argument("feature")
+def query_products(projectfolder, feature):
+    """ List the products that include a feature.
+    """
+    for line in QUERIES["products"](get_productline_index(projectfolder), feature):
+        click.echo(line)
+
+
+@query.command(name="scenarios")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+@click.argument("feature")
+def query_scenarios(projectfolder, feature):
+    """ List the scenarios that cover a feature.
+    """
+    for line in QUERIES["scenarios"](get_productline_index(projectfolder), feature):
+        click.echo(line)
+
+
+@query.command(name="features")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+@click.argument("scenario")
+def query_features(projectfolder, scenario):
+    """ List the features a scenario covers.
+    """
+    for line in QUERIES["features"](get_productline_index(projectfolder), scenario):
+        click.echo(line)
+
+
+@query.command(name="untested")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+def query_untested(projectfolder):
+    """ List the concrete features that no scenario covers.
+    """
+    for line in QUERIES["untested"](get_productline_index(projectfolder), None):
+        click.echo(line)
+
+
+@query.command(name="batch")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+@click.option("--rebuild", is_flag=True, help="Rebuild the index even if it is up to date")
+def query_batch(projectfolder, rebuild):
+    """ Answer many queries with one loaded index. Reads one query per line from
+    stdin, e.g. "products Search", and writes one JSON list of results per line.
+    """
+    productline_index = get_productline_index(projectfolder, rebuild)
+    for line in click.get_text_stream("stdin"):
+        query_name, _, argument = line.strip().partition(" ")
+        if not query_name:
+            continue
+        if query_name not in QUERIES:
+            raise click.ClickException("Unknown query {0}".format(query_name))
+        click.echo(json.dumps(QUERIES[query_name](productline_index, argument)))
+
+
+def parse_feature_model(featuremodel_path):
+    """ Parse the feature model, failing the command if it is malformed.
+    """
+    try:
+        return parsers.FeatureModelParser().parse_from_file(featuremodel_path)
+    except ValueError as error:
+        raise click.ClickException("{0}: {1}".format(featuremodel_path, error))
+
+
+def get_configuration_validator(featuremodel):
+    try:
+        return validation.ConfigurationValidator(featuremodel)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+
+def get_product_violations(validator, featuremodel, product_matrix, product_names):
+    """ The ways each product's config breaks the feature model, by product name.
+    """
+    configparser = parsers.ProductConfigParser(featuremodel.root_feature.name)
+
+    product_violations = {}
+    for product_name in product_names:
+        product_features = configparser.parse_product(product_matrix, product_name)
+        product_violations[product_name] = validator.violations(product_features)
+    return product_violations
+
+
+@cli.command()
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+def validate(projectfolder):
+    """ Check every product config against the feature model: its mandatory
+    features, or and alternative groups, and cross-tree constraints.
+    """
+    featuremodel_path = path.join(projectfolder, "productline", "model.xml")
+    configs_path = path.join(projectfolder, "productline", "configs")
+
+    featuremodel = parse_feature_model(featuremodel_path)
+    validator = get_configuration_validator(featuremodel)
+
+    configuration_count = validator.count_configurations()
+    if configuration_count == 0:
+        raise click.ClickException("The feature model allows no configurations")
+    click.echo("The feature model allows {0} configurations".format(configuration_count))
+
+    product_matrix = get_product_matrix(configs_path)
+    product_names = sorted(product_matrix.products)
+    product_violations = get_product_violations(validator, featuremodel, product_matrix, product_names)
+    invalid_count = 0
+    for product_name in product_names:
+        violations = product_violations[product_name]
+        if not violations:
+            click.echo("{0}: valid".format(product_name))
+            continue
+        invalid_count += 1
+        click.echo("{0}: invalid".format(product_name))
+        for violation in violations:
+            click.echo("  " + violation)
+
+    if invalid_count:
+        raise click.ClickException("{0} of {1} products are invalid".format(invalid_count, len(product_names)))
+
+
+@cli.command(name="coverage")
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+@click.option("--t", "t", type=click.IntRange(1, 3), default=2, help="How many features each interaction combines")
+def coverage_command(projectfolder, t):
+    """ Report the t-wise feature interaction coverage of the product configs,
+    and the products that cover no interaction another product doesn't.
+    """
+    featuremodel_path = path.join(projectfolder, "productline", "model.xml")
+    configs_path = path.join(projectfolder, "productline", "configs")
+
+    featuremodel = parse_feature_model(featuremodel_path)
+    product_matrix = get_product_matrix(configs_path)
+    products_features = {product_name: product_matrix.features_of(product_name)
+                         for product_name in product_matrix.products}
+
+    analyzer = coverage.CoverageAnalyzer(featuremodel)
+    try:
+        with tracing.span("coverage", t=t):
+            result = analyzer.analyze(products_features, t)
+    except ValueError as ex:
+        raise click.ClickException(str(ex))
+
+    click.echo("{0}-wise coverage of {1} optional features by {2} products: {3} of {4} interactions ({5:.1%})".format(
+        t, result["features"], result["products"], result["covered"], result["possible"],
+        result["covered"] / result["possible"] if result["possible"] else 1))
+    if not result["redundant"]:
+        click.echo("Every product covers interactions no other product does")
+        return
+    click.echo("Products that add no unique coverage (each could be dropped, but not necessarily all):")
+    for product_name in result["redundant"]:
+        click.echo("  " + product_name)
 
 
 @cli.command()
@@ -208,26 +1348,140 @@ def servedocs(docsfolder, port):
     httpd.serve_forever()
 
 
-def get_product_names_from_configs_path(configs_path):
-    return [path.splitext(product_path)[0] for product_path in listdir(configs_path)]
+def get_product_matrix(configs_path):
+    """ Load every product configured in the configs folder, whatever its format.
+    """
+    try:
+        with tracing.span("load_products"):
+            return products.load_product_matrix(configs_path)
+    except (ValueError, et.ParseError) as error:
+        raise click.ClickException("Couldn't load the product configs: {0}".format(error))
 
 
 @cli.command()
-@click.option("--projectfolder", default=".", help="Location to output the aplet files")
-def makedocs(projectfolder):
-    """ Generate the aplet documentation.
-    Builds the docs from lektor templates incorporating test results from test runs in.
+@click.option("--projectfolder", default=".", help="Location of the aplet files")
+@click.argument("output")
+def packproducts(projectfolder, output):
+    """ Write every configured product into a single product matrix file, as CSV
+    if OUTPUT ends in .csv and in the binary .matrix format otherwise.
+    Move it into productline/configs in place of the files it was made from.
     """
-    featuremodel_path = path.join(projectfolder, "productline", "model.xml")
     configs_path = path.join(projectfolder, "productline", "configs")
-    bddfeatures_path = path.join(projectfolder, "bddfeatures")
-    testreports_path = path.join(projectfolder, "testreports")
+    product_matrix = get_product_matrix(configs_path)
+    if output.endswith(".csv"):
+        products.write_csv_matrix(product_matrix, output)
+    else:
+        products.write_binary_matrix(product_matrix, output)
+    click.echo("Wrote {0} products with {1} features to {2}".format(
+        len(product_matrix.products), len(product_matrix.features), output))
 
-    fmparser = parsers.FeatureModelParser()
-    resultsparser = parsers.TestResultsParser()
-    feature_tree_renderer = ftrenderer.FeatureTreeRenderer()
 
+def get_product_page_inputs(projectfolder):
+    """ The read-only inputs every product's docs page is made from, as
+    docspipeline.make_product_pages takes them.
+    """
+    featuremodel_path = path.join(projectfolder, "productline", "model.xml")
+    with open(featuremodel_path, "r") as model_file:
+        model_xml = model_file.read()
+    # A malformed model fails the command here rather than in every product's worker.
+    parse_feature_model(featuremodel_path)
+    with tracing.span("parse_gherkin"):
+        gherkin_pieces = ftrenderer.gherkin_pieces_grouped_by_featurename(path.join(projectfolder, "bddfeatures"))
+    return {
+        "model_xml": model_xml,
+        "gherkin_pieces": gherkin_pieces,
+        "product_matrix": get_product_matrix(path.join(projectfolder, "productline", "configs")),
+        "testreports_path": path.join(projectfolder, "testreports"),
+        "results_format": get_results_format(),
+    }
+
+
+def get_product_line_feature_model(inputs):
+    """ The whole product line's feature model, with the test statuses of every product's last run.
+    """
+    with tracing.span("parse_model"):
+        feature_model = parsers.FeatureModelParser().parse_xml(inputs["model_xml"])
+    with tracing.span("parse_report"):
+        gherkin_piece_test_statuses = parsers.TestResultsParser().get_gherkin_piece_test_statuses_for_dir(
+            inputs["testreports_path"], inputs["results_format"])
+    with tracing.span("calculate_test_statuses"):
+        feature_model.add_gherkin_pieces(inputs["gherkin_pieces"])
+        feature_model.calculate_test_statuses(gherkin_piece_test_statuses)
+    return feature_model
+
+
+def make_sitegen_docs(projectfolder, docs_dir, jobs):
+    """ Generate the docs with the built-in site generator, straight from the
+    feature model and test results, without going through the lektor templates.
+    """
+    inputs = get_product_page_inputs(projectfolder)
+    product_names = inputs["product_matrix"].products
+
+    product_statuses = {}
+    with sitegen.SiteGenerator(docs_dir, CONFIG["project_name"], jobs) as site:
+        def product_page_done(product_name, test_status, has_diagram):
+            product_statuses[product_name] = test_status
+            if not has_diagram:
+                site.missing_dot = True
+
+        with tracing.span("product_pages", products=len(product_names)):
+            docspipeline.make_product_pages(inputs, product_names, site.page_writer().write_product_page, site.jobs,
+                                            product_page_done)
+
+        feature_model = get_product_line_feature_model(inputs)
+        with tracing.span("productmap"):
+            site.add_index_page(feature_model, inputs["product_matrix"], product_statuses)
+
+    if site.missing_dot:
+        click.echo("Graphviz's dot wasn't found, so the feature model diagrams were left out")
+    click.echo("Wrote docs for {0} products to {1}".format(len(product_statuses), docs_dir))
+
+
+def write_lektor_product_page(lektor_templates_path, product_name, root_feature, test_status, test_report_path):
+    """ Write a product's lektor page, with its trimmed feature model and its
+    runner's HTML test report, if there is one, into the lektor templates.
+    """
+    current_product_lektor_dir = path.join(lektor_templates_path, "content/products", product_name)
+    if not path.exists(current_product_lektor_dir):
+        makedirs(current_product_lektor_dir)
+
+    product_filepath = path.join(current_product_lektor_dir, "contents.lr")
+    shutil.copyfile(path.join(lektor_templates_path, "helpers/product_contents.lr"), product_filepath)
+
+    with tracing.span("render_svg", product=product_name):
+        feature_tree_renderer = ftrenderer.FeatureTreeRenderer()
+        feature_tree_renderer.build_graphviz_graph(root_feature)
+        feature_tree_renderer.render_as_svg(current_product_lektor_dir, "feature_model")
+
+    utilities.sed_inplace(product_filepath, r'<<PRODUCT>>', product_name)
+    utilities.sed_inplace(product_filepath, "<<TEST_STATUS>>", test_status.name)
+
+    # Copy test run html report to generated docs
+    if test_report_path is not None:
+        shutil.copyfile(test_report_path, path.join(current_product_lektor_dir, path.basename(test_report_path)))
+
+
+@cli.command()
+@click.option("--projectfolder", default=".", help="Location to output the aplet files")
+@click.option("--generator", type=click.Choice(["lektor", "sitegen"]), default=None,
+              help="Build the docs with lektor or the built-in site generator "
+                   "(default: docs_generator in aplet.yml, else lektor)")
+@click.option("--jobs", type=click.IntRange(1), default=None, help="Product pages made at once, each in a worker "
+              "process (default: the number of CPUs)")
+def makedocs(projectfolder, generator, jobs):
+    """ Generate the aplet documentation.
+    Builds the docs from lektor templates incorporating test results from test runs in,
+    or with the built-in site generator.
+    """
     docs_dir = path.join(projectfolder, "docs/generated")
+    if (generator or CONFIG.get("docs_generator", "lektor")) == "sitegen":
+        if path.exists(docs_dir):
+            shutil.rmtree(docs_dir)
+        make_sitegen_docs(projectfolder, docs_dir, jobs)
+        return
+
+    featuremodel_path = path.join(projectfolder, "productline", "model.xml")
+
     if path.exists(docs_dir):
         shutil.rmtree(docs_dir)
     makedirs(docs_dir)
@@ -238,64 +1492,30 @@ def makedocs(projectfolder):
         r'<<PROJECT>>',
         CONFIG["project_name"])
 
-    products = {}
-    product_names = get_product_names_from_configs_path(configs_path)
-    for product_name in product_names:
-        productconfig_filepath = path.join(projectfolder, "productline/configs", product_name + ".config")
-        product_html_report_name = "report{0}.html".format(product_name)
-        product_html_results_src = path.join(testreports_path, product_html_report_name)
-        product_xml_report_name = "report{0}.xml".format(product_name)
-        product_xml_results_src = path.join(testreports_path, product_xml_report_name)
-
-        with open(productconfig_filepath, "r") as productconfig_file:
-            products[product_name] = {}
-            products[product_name]['features'] = [feature.strip() for feature in productconfig_file.readlines()]
-
-        current_product_lektor_dir = path.join(lektor_templates_path, "content/products", product_name)
-        if not path.exists(current_product_lektor_dir):
-            makedirs(current_product_lektor_dir)
-
-        product_filepath = path.join(current_product_lektor_dir,"contents.lr")
-        shutil.copyfile(path.join(lektor_templates_path, "helpers/product_contents.lr"), product_filepath)
-
-        feature_model = fmparser.parse_from_file(featuremodel_path)
-        gherkin_pieces = ftrenderer.gherkin_pieces_grouped_by_featurename(bddfeatures_path)
-        gherkin_piece_test_statuses = resultsparser.get_gherkin_piece_test_statuses_for_product_from_file(product_xml_results_src)
-        configparser = parsers.ProductConfigParser(feature_model.root_feature.name)
-        product_features = configparser.parse_config(productconfig_filepath)
-        feature_model.trim_based_on_config(product_features)
-        feature_model.add_gherkin_pieces(gherkin_pieces)
-        feature_model.calculate_test_statuses(gherkin_piece_test_statuses)
-
-        feature_tree_renderer.build_graphviz_graph(feature_model.root_feature)
-        feature_tree_renderer.render_as_svg(current_product_lektor_dir, "feature_model")
-
-        utilities.sed_inplace(product_filepath, r'<<PRODUCT>>', product_name)
-        product_test_status = feature_model.root_feature.test_status
-        utilities.sed_inplace(product_filepath, "<<TEST_STATUS>>", product_test_status.name)
-
-        # Copy test run html report to generated docs
-        if path.exists(product_html_results_src):
-            shutil.copyfile(product_html_results_src, path.join(current_product_lektor_dir, product_html_report_name))
+    inputs = get_product_page_inputs(projectfolder)
+    product_names = inputs["product_matrix"].products
+    with tracing.span("product_pages", products=len(product_names)):
+        docspipeline.make_product_pages(
+            inputs, product_names, functools.partial(write_lektor_product_page, lektor_templates_path),
+            jobs or cpu_count() or 1)
 
     click.echo("- Generating feature model SVG...")
     click.echo(featuremodel_path)
 
-    feature_model = fmparser.parse_from_file(featuremodel_path)
-    gherkin_pieces = ftrenderer.gherkin_pieces_grouped_by_featurename(bddfeatures_path)
-    gherkin_piece_test_statuses = resultsparser.get_gherkin_piece_test_statuses_for_dir(testreports_path)
-    feature_model.add_gherkin_pieces(gherkin_pieces)
-    feature_model.calculate_test_statuses(gherkin_piece_test_statuses)
-
-    feature_tree_renderer.build_graphviz_graph(feature_model.root_feature)
-    feature_tree_renderer.render_as_svg(path.join(lektor_templates_path, "content/"), "feature_model")
+    feature_model = get_product_line_feature_model(inputs)
+    with tracing.span("render_svg"):
+        feature_tree_renderer = ftrenderer.FeatureTreeRenderer()
+        feature_tree_renderer.build_graphviz_graph(feature_model.root_feature)
+        feature_tree_renderer.render_as_svg(path.join(lektor_templates_path, "content/"), "feature_model")
 
     click.echo("- Building site")
     lektor_cmd = ["lektor", "--project", lektor_templates_path, "build", "-O", path.abspath(docs_dir)]
     click.echo("Running: " + subprocess.list2cmdline(lektor_cmd))
-    subprocess.call(lektor_cmd)
-
-    product_map_renderer = mapbuilder.ProductMapRenderer()
-    productline_generated_filepath = path.join(docs_dir, "index.html")
-    html = product_map_renderer.get_productmap_html(feature_model, products)
-    utilities.sed_inplace(productline_generated_filepath, r'<<PRODUCTMAP>>', html)
+    with tracing.span("lektor_build"):
+        subprocess.call(lektor_cmd)
+
+    with tracing.span("productmap"):
+        product_map_renderer = mapbuilder.ProductMapRenderer()
+        productline_generated_filepath = path.join(docs_dir, "index.html")
+        html = product_map_renderer.get_productmap_html_for_matrix(feature_model, inputs["product_matrix"])
+        utilities.sed_inplace(productline_generated_filepath, r'<<PRODUCTMAP>>', html)
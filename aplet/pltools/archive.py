@@ -0,0 +1,233 @@
+""" Provides ReportArchive, a content-addressed store of compressed test reports
+with a manifest per test run.
+
+Report files are stored once per distinct content, as blobs named by the
+SHA-256 of their uncompressed bytes, so identical reports across products and
+runs take up space only once. Blobs are compressed with zstd when the
+`zstandard` package is installed, and gzip otherwise.
+"""
+import gzip
+import hashlib
+import json
+import shutil
+import tempfile
+import time
+from os import getpid, listdir, makedirs, path, remove
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CHUNK_SIZE = 1024 * 1024
+
+BLOB_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def new_run_id(runs_dir=None):
+    """ An id for a new run: the time it started, then the process id, so that
+    runs started in the same second get different ids, and a count if a run
+    with that id is already archived in runs_dir.
+    """
+    run_id = "{0}-{1}".format(time.strftime("%Y%m%dT%H%M%S"), getpid())
+    unique_run_id = run_id
+    count = 1
+    while runs_dir is not None and path.exists(path.join(runs_dir, unique_run_id + ".json")):
+        count += 1
+        unique_run_id = "{0}-{1}".format(run_id, count)
+    return unique_run_id
+
+
+class ReportArchive:
+    """ Archive of the report files of every test run, kept under archive_dir.
+    """
+
+    def __init__(self, archive_dir, compression=None):
+        if compression is None:
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        if compression not in BLOB_EXTENSIONS:
+            raise ValueError("Unknown compression {0}".format(compression))
+
+        self.archive_dir = archive_dir
+        self.compression = compression
+        self.blobs_dir = path.join(archive_dir, "blobs")
+        self.runs_dir = path.join(archive_dir, "runs")
+        for directory in (self.blobs_dir, self.runs_dir):
+            if not path.exists(directory):
+                makedirs(directory)
+
+    def blob_path(self, digest, compression):
+        return path.join(self.blobs_dir, digest[:2], digest + BLOB_EXTENSIONS[compression])
+
+    def find_blob(self, digest):
+        """ The path and compression of a stored blob, whichever compression it was stored with.
+        """
+        for compression in BLOB_EXTENSIONS:
+            blob_path = self.blob_path(digest, compression)
+            if path.exists(blob_path):
+                return blob_path, compression
+        return None, None
+
+    def add_blob(self, source_path):
+        """ Store a file's content, returning its digest. Content already in the
+        archive is not stored again.
+        """
+        sha = hashlib.sha256()
+        with open(source_path, "rb") as source_file:
+            for chunk in iter(lambda: source_file.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+        if self.find_blob(digest)[0] is not None:
+            return digest
+
+        blob_path = self.blob_path(digest, self.compression)
+        if not path.exists(path.dirname(blob_path)):
+            makedirs(path.dirname(blob_path))
+
+        # Compress to a temporary file first so that a blob is never half written.
+        with tempfile.NamedTemporaryFile(dir=self.blobs_dir, delete=False) as tmp_file:
+            with open(source_path, "rb") as source_file:
+                if self.compression == "zstd":
+                    compressor = zstandard.ZstdCompressor()
+                    compressor.copy_stream(source_file, tmp_file)
+                else:
+                    with gzip.GzipFile(fileobj=tmp_file, mode="wb") as gzip_file:
+                        shutil.copyfileobj(source_file, gzip_file, CHUNK_SIZE)
+        shutil.move(tmp_file.name, blob_path)
+
+        return digest
+
+    def new_run_id(self):
+        return new_run_id(self.runs_dir)
+
+    def manifest_path(self, run_id):
+        return path.join(self.runs_dir, run_id + ".json")
+
+    def load_manifest(self, run_id):
+        manifest_path = self.manifest_path(run_id)
+        if not path.exists(manifest_path):
+            return {"run_id": run_id, "created": time.time(), "reports": {}}
+        with open(manifest_path, "r") as manifest_file:
+            return json.load(manifest_file)
+
+    def save_manifest(self, manifest):
+        manifest_path = self.manifest_path(manifest["run_id"])
+        with open(manifest_path + ".tmp", "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        shutil.move(manifest_path + ".tmp", manifest_path)
+
+    def add_reports(self, run_id, product_name, report_paths):
+        """ Archive a product's report files for a run. report_paths maps the
+        report type (e.g. "xml") to the report file.
+        """
+        manifest = self.load_manifest(run_id)
+        product_reports = manifest["reports"].setdefault(product_name, {})
+        for report_type, report_path in report_paths.items():
+            product_reports[report_type] = {
+                "blob": self.add_blob(report_path),
+                "size": path.getsize(report_path),
+            }
+        self.save_manifest(manifest)
+
+    def runs(self, modified_since=None):
+        """ The manifests of all archived runs, oldest first, or only of those
+        modified since a time.
+        """
+        manifests = [self.load_manifest(path.splitext(filename)[0])
+                     for filename in listdir(self.runs_dir) if filename.endswith(".json") and
+                     (modified_since is None or path.getmtime(path.join(self.runs_dir, filename)) >= modified_since)]
+        return sorted(manifests, key=lambda manifest: (manifest["created"], manifest["run_id"]))
+
+    def report_types(self, run_id, product_name):
+        """ The types of report (xml, json, html) archived for a product in a run.
+        """
+        return list(self.load_manifest(run_id)["reports"].get(product_name, {}))
+
+    def open_report(self, run_id, product_name, report_type):
+        """ Open an archived report for reading. The report is decompressed as it
+        is read, so it never has to be held in memory or on disk in full.
+        """
+        manifest = self.load_manifest(run_id)
+        try:
+            digest = manifest["reports"][product_name][report_type]["blob"]
+        except KeyError:
+            raise IOError("No {0} report for {1} in run {2}".format(report_type, product_name, run_id))
+
+        blob_path, compression = self.find_blob(digest)
+        if blob_path is None:
+            raise IOError("Blob {0} missing from the archive".format(digest))
+
+        if compression == "zstd":
+            if zstandard is None:
+                raise IOError("Reading {0} needs the zstandard package".format(blob_path))
+            return zstandard.ZstdDecompressor().stream_reader(open(blob_path, "rb"), closefd=True)
+        return gzip.open(blob_path, "rb")
+
+    def blobs(self):
+        """ The paths of all stored blobs, by digest.
+        """
+        blobs = {}
+        for prefix in listdir(self.blobs_dir):
+            prefix_dir = path.join(self.blobs_dir, prefix)
+            if not path.isdir(prefix_dir):
+                continue
+            for filename in listdir(prefix_dir):
+                blobs[filename.split(".")[0]] = path.join(prefix_dir, filename)
+        return blobs
+
+    def remove_run(self, run_id):
+        remove(self.manifest_path(run_id))
+
+    def collect_garbage(self):
+        """ Remove blobs no longer referenced by any run. Returns the bytes freed.
+        """
+        referenced = set()
+        for manifest in self.runs():
+            for product_reports in manifest["reports"].values():
+                referenced.update(report["blob"] for report in product_reports.values())
+
+        freed = 0
+        for digest, blob_path in self.blobs().items():
+            if digest not in referenced:
+                freed += path.getsize(blob_path)
+                remove(blob_path)
+        return freed
+
+    def size(self):
+        return sum(path.getsize(blob_path) for blob_path in self.blobs().values())
+
+    def evict(self, retention_days=None, max_runs=None, max_bytes=None, now=None):
+        """ Apply the retention policy: drop runs older than retention_days, then
+        the oldest runs beyond max_runs, then the oldest runs until the stored
+        blobs fit in max_bytes. The most recent run is always kept.
+        Returns the ids of the removed runs.
+        """
+        now = time.time() if now is None else now
+        manifests = self.runs()
+        removed = []
+
+        def drop_oldest():
+            manifest = manifests.pop(0)
+            self.remove_run(manifest["run_id"])
+            removed.append(manifest["run_id"])
+
+        if retention_days is not None:
+            while len(manifests) > 1 and manifests[0]["created"] < now - retention_days * 86400:
+                drop_oldest()
+
+        if max_runs is not None:
+            while len(manifests) > max(max_runs, 1):
+                drop_oldest()
+
+        self.collect_garbage()
+
+        if max_bytes is not None:
+            while len(manifests) > 1 and self.size() > max_bytes:
+                drop_oldest()
+                self.collect_garbage()
+
+        return removed
@@ -0,0 +1,249 @@
+""" Provides ConcurrencyController, which decides how many test jobs to run at
+once from how the machine is coping, and AdaptivePool, which runs jobs within
+the controller's limit.
+
+The controller reads CPU use, load, available memory and memory pressure from
+/proc, and is told the failure rate of each finished job. The limit grows by one
+while the jobs don't keep the CPUs busy and there is memory for another job. It
+halves when the machine is overloaded: the run queue is longer than the CPUs
+can serve, memory is nearly exhausted or under pressure, or jobs fail more
+often than they did at a lower limit (fixtures thrashing and tests timing out).
+Where /proc isn't available, the limit stays where it started.
+"""
+import heapq
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+PROC_DIR = "/proc"
+
+
+def read_cpu_times(proc_dir=PROC_DIR):
+    """ The (busy, total) jiffies all CPUs have spent since boot, from /proc/stat.
+    """
+    with open(os.path.join(proc_dir, "stat"), "r") as stat_file:
+        cpu_times = [int(value) for value in stat_file.readline().split()[1:]]
+    # idle and iowait
+    idle = sum(cpu_times[3:5])
+    return sum(cpu_times) - idle, sum(cpu_times)
+
+
+def read_loadavg(proc_dir=PROC_DIR):
+    """ The 1 minute load average, from /proc/loadavg.
+    """
+    with open(os.path.join(proc_dir, "loadavg"), "r") as loadavg_file:
+        return float(loadavg_file.read().split()[0])
+
+
+def read_meminfo(proc_dir=PROC_DIR):
+    """ The fields of /proc/meminfo, in bytes.
+    """
+    meminfo = {}
+    with open(os.path.join(proc_dir, "meminfo"), "r") as meminfo_file:
+        for line in meminfo_file:
+            name, value = line.split(":", 1)
+            fields = value.split()
+            meminfo[name] = int(fields[0]) * (1024 if fields[1:] == ["kB"] else 1)
+    return meminfo
+
+
+def read_memory_pressure(proc_dir=PROC_DIR):
+    """ The share (0-100) of the last 10 seconds some tasks were stalled waiting
+    on memory, from /proc/pressure/memory, or None on kernels without it.
+    """
+    try:
+        with open(os.path.join(proc_dir, "pressure", "memory"), "r") as pressure_file:
+            for line in pressure_file:
+                fields = line.split()
+                if fields[0] == "some":
+                    return float(dict(field.split("=") for field in fields[1:])["avg10"])
+    except (OSError, KeyError, ValueError):
+        pass
+    return None
+
+
+class SystemStats:
+    """ Samples the machine's CPU use, load and memory from /proc. Values that
+    can't be read are None.
+    """
+
+    def __init__(self, proc_dir=PROC_DIR):
+        self.proc_dir = proc_dir
+        self.cpu_count = os.cpu_count() or 1
+        self.last_cpu_times = None
+
+    def sample(self):
+        sample = {"cpu_busy": None, "load_per_cpu": None, "memory_available": None, "memory_pressure": None}
+        try:
+            cpu_times = read_cpu_times(self.proc_dir)
+            if self.last_cpu_times is not None and cpu_times[1] > self.last_cpu_times[1]:
+                sample["cpu_busy"] = (cpu_times[0] - self.last_cpu_times[0]) / (cpu_times[1] - self.last_cpu_times[1])
+            self.last_cpu_times = cpu_times
+            sample["load_per_cpu"] = read_loadavg(self.proc_dir) / self.cpu_count
+            sample["memory_available"] = read_meminfo(self.proc_dir).get("MemAvailable")
+        except (OSError, ValueError, IndexError):
+            pass
+        sample["memory_pressure"] = read_memory_pressure(self.proc_dir)
+        return sample
+
+
+def memory_limiter(limit_bytes):
+    """ A preexec_fn for subprocess.Popen that limits the address space of the
+    process it starts, and of the processes that one starts, to limit_bytes.
+    None where that's not supported.
+    Raises ValueError if the limit is above the hard limit of this process,
+    which an unprivileged process can't raise.
+    """
+    if resource is None or not hasattr(resource, "RLIMIT_AS"):
+        return None
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+    if hard_limit != resource.RLIM_INFINITY and limit_bytes > hard_limit:
+        raise ValueError("A memory limit of {0} MB is above this process's hard limit of {1} MB".format(
+            limit_bytes // (1024 * 1024), hard_limit // (1024 * 1024)))
+
+    def limit_memory():
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+    return limit_memory
+
+
+class ConcurrencyController:
+    """ Keeps the number of jobs to run at once between 1 and max_jobs, from
+    samples of stats (a SystemStats) and the failure rates of finished jobs.
+
+    min_free_memory is the memory, in bytes, to keep available on top of what
+    another job is expected to need: job_memory if given, otherwise the memory
+    the running jobs have taken on average.
+    """
+
+    def __init__(self, max_jobs, stats=None, job_memory=None, min_free_memory=512 * 1024 * 1024,
+                 target_cpu_busy=0.85, max_load_per_cpu=1.5, max_memory_pressure=10.0,
+                 failure_rate_margin=0.2, failure_window=6, increase_interval=10.0, clock=time.monotonic):
+        self.max_jobs = max_jobs
+        self.stats = stats or SystemStats()
+        self.job_memory = job_memory
+        self.min_free_memory = min_free_memory
+        self.target_cpu_busy = target_cpu_busy
+        self.max_load_per_cpu = max_load_per_cpu
+        self.max_memory_pressure = max_memory_pressure
+        self.failure_rate_margin = failure_rate_margin
+        self.clock = clock
+        self.increase_interval = increase_interval
+
+        # Start halfway to the CPU count, and find the rest of the way from how the machine copes.
+        self.limit = max(1, min(max_jobs, (self.stats.cpu_count + 1) // 2))
+        self.reason = "starting"
+        self.last_change = clock()
+        self.failure_rates = deque(maxlen=failure_window)
+        # The lowest failure rate seen over a full window, taken as the rate of genuine failures.
+        self.baseline_failure_rate = None
+        # Memory available before any job was started, for estimating what a job takes.
+        self.idle_memory_available = None
+
+    def record_job(self, failure_rate):
+        """ Note the share (0 to 1) of a finished job's tests that failed.
+        """
+        self.failure_rates.append(failure_rate)
+        if len(self.failure_rates) == self.failure_rates.maxlen:
+            mean_failure_rate = sum(self.failure_rates) / len(self.failure_rates)
+            if self.baseline_failure_rate is None or mean_failure_rate < self.baseline_failure_rate:
+                self.baseline_failure_rate = mean_failure_rate
+
+    def get_overload(self, sample):
+        """ Why the machine is overloaded, or None if it isn't.
+        """
+        if sample["load_per_cpu"] is not None and sample["load_per_cpu"] > self.max_load_per_cpu:
+            return "load {0:.1f} per CPU".format(sample["load_per_cpu"])
+        if sample["memory_available"] is not None and sample["memory_available"] < self.min_free_memory:
+            return "{0} MB of memory available".format(sample["memory_available"] // (1024 * 1024))
+        if sample["memory_pressure"] is not None and sample["memory_pressure"] > self.max_memory_pressure:
+            return "memory pressure {0:.0f}%".format(sample["memory_pressure"])
+        if self.baseline_failure_rate is not None and len(self.failure_rates) == self.failure_rates.maxlen:
+            mean_failure_rate = sum(self.failure_rates) / len(self.failure_rates)
+            if mean_failure_rate > self.baseline_failure_rate + self.failure_rate_margin:
+                return "{0:.0%} of tests failing".format(mean_failure_rate)
+        return None
+
+    def has_room_for_another_job(self, sample, running):
+        if sample["cpu_busy"] is None or sample["memory_available"] is None:
+            return False
+        if sample["cpu_busy"] >= self.target_cpu_busy:
+            return False
+
+        job_memory = self.job_memory
+        if job_memory is None and running and self.idle_memory_available is not None:
+            job_memory = max(self.idle_memory_available - sample["memory_available"], 0) / running
+        return sample["memory_available"] - (job_memory or 0) >= self.min_free_memory
+
+    def update(self, running):
+        """ Sample the machine and adjust the limit, given how many jobs are running.
+        Returns the new limit.
+        """
+        sample = self.stats.sample()
+        if running == 0 and sample["memory_available"] is not None:
+            self.idle_memory_available = max(self.idle_memory_available or 0, sample["memory_available"])
+
+        overload = self.get_overload(sample)
+        now = self.clock()
+        if overload is not None:
+            # Only once the jobs started above the current limit have finished does the
+            # overload reflect it, so the limit isn't halved again for the same overload.
+            if self.limit > 1 and running <= self.limit:
+                self.set_limit(max(1, self.limit // 2), overload, now)
+                self.failure_rates.clear()
+        elif (self.limit < self.max_jobs and running >= self.limit and
+              now - self.last_change >= self.increase_interval and self.has_room_for_another_job(sample, running)):
+            self.set_limit(self.limit + 1, "CPU {0:.0%} busy".format(sample["cpu_busy"]), now)
+
+        return self.limit
+
+    def set_limit(self, limit, reason, now):
+        self.limit = limit
+        self.reason = reason
+        self.last_change = now
+
+
+class AdaptivePool:
+    """ Runs jobs on up to controller.max_jobs threads, starting another only
+    while fewer than the controller's limit are running.
+
+    Each job is run as run_job(slot, job), where slot is the lowest index from 0
+    not in use by another running job, so that whatever a job needs set up
+    (a workspace, a port) can be kept per slot and reused by the next job.
+    on_done(job, result) is called on the calling thread as each job finishes.
+    """
+
+    def __init__(self, controller, poll_interval=2.0, echo=print):
+        self.controller = controller
+        self.poll_interval = poll_interval
+        self.echo = echo
+
+    def run(self, jobs, run_job, on_done):
+        pending = deque(jobs)
+        running = {}
+        free_slots = list(range(self.controller.max_jobs))
+        limit = None
+
+        with ThreadPoolExecutor(max_workers=self.controller.max_jobs) as executor:
+            while pending or running:
+                new_limit = self.controller.update(len(running))
+                if new_limit != limit:
+                    limit = new_limit
+                    self.echo("Running up to {0} jobs at once ({1})".format(limit, self.controller.reason))
+
+                while pending and len(running) < limit:
+                    slot = heapq.heappop(free_slots)
+                    job = pending.popleft()
+                    running[executor.submit(run_job, slot, job)] = (slot, job)
+
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    slot, job = running.pop(future)
+                    heapq.heappush(free_slots, slot)
+                    on_done(job, future.result())
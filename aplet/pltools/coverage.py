@@ -0,0 +1,286 @@
+""" Provides CoverageAnalyzer, which measures the t-wise feature interaction
+coverage of a set of products.
+
+An interaction is a choice of t optional features together with whether each
+is selected, e.g. (Search selected, Labels not selected) for t=2. A product
+covers the interactions it agrees with. Interactions that the feature model's
+structure rules out aren't counted: a feature selected without its ancestor,
+two features from different branches of an alternative group, or every branch
+deselected of an alternative group that is always selected. Cross-tree
+constraints and or-groups aren't taken into account.
+
+Products are encoded as bitsets over the optional features, with both the
+selected and the deselected features in one int. The products agreeing with a
+choice of t-1 features form a class, and the OR of a class's rows gives every
+t-th feature it covers in one go. These ORs are built from per-byte lookup
+tables over the products, so the work is one lookup per 8 products rather than
+one operation per product per interaction.
+"""
+import operator
+from functools import reduce
+
+
+# Classes of up to this many products are ORed row by row rather than through the lookup tables.
+SMALL_CLASS_ROWS = 16
+
+# How many groups the lookup tables are split into, for stopping early on classes that cover everything.
+TABLE_GROUPS = 8
+
+
+def iter_bits(bits):
+    """ The indexes of the set bits of an int, lowest first.
+    """
+    while bits:
+        low_bit = bits & -bits
+        yield low_bit.bit_length() - 1
+        bits ^= low_bit
+
+
+def count_bits(bits):
+    """ The number of set bits of an int.
+    """
+    return bin(bits).count("1")
+
+
+def get_or_tables(rows):
+    """ For each run of 8 rows, a table of the OR of every subset of the run,
+    indexed by the subset's bits.
+    """
+    tables = []
+    for start in range(0, len(rows), 8):
+        chunk = rows[start:start + 8]
+        table = [0] * 256
+        for subset in range(1, 1 << len(chunk)):
+            low_bit = subset & -subset
+            table[subset] = table[subset ^ low_bit] | chunk[low_bit.bit_length() - 1]
+        tables.append(table)
+    return tables
+
+
+class CoverageAnalyzer:
+    """ Measures the interaction coverage of products of a FeatureModel parsed
+    with FeatureModelParser.
+    """
+
+    def __init__(self, feature_model):
+        self.feature_model = feature_model
+        self.features = feature_model.optional_features()
+        self.feature_indexes = {feature.name: index for index, feature in enumerate(self.features)}
+        self.all_features = (1 << len(self.features)) - 1
+        # The branches of each alternative group that is always selected, as bits, when
+        # they are all optional features: they can't all be deselected.
+        self.required_branches = self.get_required_branches()
+        # impossible[value][other_value][index]: the features that can't have
+        # other_value while the feature at index has value.
+        self.impossible = self.get_impossible_pairs()
+        # For each feature, the sets of more than two required branches it is one of,
+        # which only rule out interactions of as many features.
+        self.larger_required_branches = [[] for _ in self.features]
+        for branches in self.required_branches:
+            if count_bits(branches) > 2:
+                for index in iter_bits(branches):
+                    self.larger_required_branches[index].append(branches)
+
+    def is_always_selected(self, node):
+        """ Whether the feature model's structure selects a feature in every product.
+        """
+        while node.parent is not None:
+            if not node.mandatory or getattr(node.parent, "group_type", "and") != "and":
+                return False
+            node = node.parent
+        return True
+
+    def get_required_branches(self):
+        required_branches = []
+        for node in self.iter_tree(self.feature_model.root_feature):
+            if getattr(node, "group_type", "and") != "alt" or not self.is_always_selected(node):
+                continue
+            if all(child.name in self.feature_indexes for child in node.children):
+                required_branches.append(sum(1 << self.feature_indexes[child.name] for child in node.children))
+        return required_branches
+
+    def get_impossible_pairs(self):
+        feature_count = len(self.features)
+        impossible = [[[0] * feature_count for _ in range(2)] for _ in range(2)]
+
+        # The optional features in each feature's subtree, itself included.
+        descendants = {}
+        for node in reversed(list(self.iter_tree(self.feature_model.root_feature))):
+            bits = 0
+            if node.name in self.feature_indexes:
+                bits = 1 << self.feature_indexes[node.name]
+            for child in node.children:
+                bits |= descendants[child.name]
+            descendants[node.name] = bits
+
+        for feature in self.features:
+            index = self.feature_indexes[feature.name]
+            feature_bit = 1 << index
+            # A feature's descendants can't be selected without it.
+            for descendant in iter_bits(descendants[feature.name] & ~feature_bit):
+                impossible[0][1][index] |= 1 << descendant
+                impossible[1][0][descendant] |= feature_bit
+
+            # Only one branch of an alternative group can be selected.
+            child = feature
+            while child.parent is not None:
+                group = child.parent
+                if getattr(group, "group_type", "and") == "alt":
+                    # An optional group is itself selected along with any of its branches.
+                    branches = descendants[group.name] & ~descendants[child.name]
+                    if group.name in self.feature_indexes:
+                        branches &= ~(1 << self.feature_indexes[group.name])
+                    impossible[1][1][index] |= branches
+                child = group
+
+        # Of two required branches, deselecting one rules out deselecting the other.
+        for branches in self.required_branches:
+            if count_bits(branches) == 2:
+                first, second = iter_bits(branches)
+                impossible[0][0][first] |= 1 << second
+                impossible[0][0][second] |= 1 << first
+
+        return impossible
+
+    def iter_tree(self, node):
+        yield node
+        for child in node.children:
+            yield from self.iter_tree(child)
+
+    def get_row(self, product_features):
+        """ A product's selected and deselected optional features, as one int:
+        bit i for the selected feature i, and bit i + n for the deselected one.
+        """
+        selected = 0
+        for name in product_features:
+            if name in self.feature_indexes:
+                selected |= 1 << self.feature_indexes[name]
+        return selected | (self.all_features & ~selected) << len(self.features)
+
+    def analyze(self, products, t=2):
+        """ The t-wise coverage of products ({product: [feature names]}).
+        Returns a dict of the number of `possible` and `covered` interactions, and
+        the `redundant` products: those that cover no interaction that another
+        product doesn't also cover. Any one of them can be dropped without losing
+        coverage, though not necessarily several.
+        """
+        feature_count = len(self.features)
+        if t < 1 or t > feature_count:
+            raise ValueError("t must be between 1 and the number of optional features ({0})".format(feature_count))
+
+        # Identical products cover the same interactions, so each is analyzed once.
+        products_by_row = {}
+        for product_name, product_features in sorted(products.items()):
+            products_by_row.setdefault(self.get_row(product_features), []).append(product_name)
+        rows = list(products_by_row)
+        all_rows = (1 << len(rows)) - 1
+
+        # The rows with each selected and each deselected feature, indexed as the bits of a row.
+        columns = [0] * (2 * feature_count)
+        for row_index, row in enumerate(rows):
+            for bit in iter_bits(row):
+                columns[bit] |= 1 << row_index
+
+        tables = get_or_tables(rows)
+        group_tables = [tables[group::TABLE_GROUPS] for group in range(TABLE_GROUPS)]
+        row_bytes = (len(rows) + 7) // 8
+
+        totals = {"possible": 0, "covered": 0}
+        # Rows known to cover an interaction no other row does.
+        unique_rows = [0]
+
+        def count_class(row_class, last_index, excluded):
+            """ Count the interactions of a class of rows agreeing on t-1
+            features, together with each later feature, selected or not.
+            excluded[value] are the features that can't have value alongside
+            the class's features.
+            """
+            later = self.all_features & ~((1 << (last_index + 1)) - 1)
+            possible = (later & ~excluded[1]) | (later & ~excluded[0]) << feature_count
+            totals["possible"] += count_bits(possible)
+            if not row_class or not possible:
+                return
+
+            if count_bits(row_class) <= SMALL_CLASS_ROWS:
+                # Small classes are cheaper to OR row by row, noting what is covered more than once.
+                covered = covered_twice = 0
+                for row_index in iter_bits(row_class):
+                    covered_twice |= covered & rows[row_index]
+                    covered |= rows[row_index]
+            else:
+                # The class's rows are ORed a group of tables at a time. An interaction covered in
+                # two groups is covered by at least two rows, and once everything possible is, the
+                # remaining groups can't change anything.
+                class_bytes = row_class.to_bytes(row_bytes, "little")
+                covered = covered_twice = 0
+                for group, tables_of_group in enumerate(group_tables):
+                    group_or = reduce(operator.or_, map(operator.getitem, tables_of_group,
+                                                        class_bytes[group::TABLE_GROUPS]), 0)
+                    covered_twice |= covered & group_or
+                    covered |= group_or
+                    if not possible & ~covered_twice:
+                        break
+            covered &= possible
+            totals["covered"] += count_bits(covered)
+
+            # Only interactions not known to be covered twice can be unique to one row.
+            candidates = covered & ~covered_twice
+            unmarked_rows = row_class & ~unique_rows[0]
+            if not candidates or not unmarked_rows:
+                return
+            # Only the interactions of rows not yet known to be unique are of interest.
+            if count_bits(unmarked_rows) <= SMALL_CLASS_ROWS:
+                unmarked_or = 0
+                for row_index in iter_bits(unmarked_rows):
+                    unmarked_or |= rows[row_index]
+                candidates &= unmarked_or
+
+            for bit in iter_bits(candidates):
+                if not row_class & ~unique_rows[0]:
+                    break
+                covering_rows = row_class & columns[bit]
+                if not covering_rows & (covering_rows - 1):
+                    unique_rows[0] |= covering_rows
+
+        def count_prefix(depth, row_class, last_index, excluded, deselected):
+            """ deselected are the features the prefix deselects.
+            """
+            if depth == t - 1:
+                count_class(row_class, last_index, excluded)
+                return
+            for index in range(last_index + 1, feature_count - (t - 1 - depth) + 1):
+                feature_bit = 1 << index
+                for value in (1, 0):
+                    if excluded[value] & feature_bit:
+                        # This choice of features can't happen, nor can any extension of it.
+                        continue
+                    value_rows = columns[index if value else index + feature_count]
+                    value_excluded = (excluded[0] | self.impossible[value][0][index],
+                                      excluded[1] | self.impossible[value][1][index])
+                    value_deselected = deselected
+                    if not value:
+                        value_deselected |= feature_bit
+                        # Once all but one of the required branches are deselected, a later last one can't be.
+                        for branches in self.larger_required_branches[index]:
+                            last_branch = branches & ~value_deselected
+                            if last_branch > feature_bit and not last_branch & (last_branch - 1):
+                                value_excluded = (value_excluded[0] | last_branch, value_excluded[1])
+                    count_prefix(depth + 1, row_class & value_rows, index, value_excluded, value_deselected)
+
+        # The only branch of an alternative group that is always selected can't be deselected.
+        never_deselected = sum(branches for branches in self.required_branches if count_bits(branches) == 1)
+        count_prefix(0, all_rows, -1, (never_deselected, 0), 0)
+
+        redundant = []
+        for row_index, row in enumerate(rows):
+            if len(products_by_row[row]) > 1 or not unique_rows[0] >> row_index & 1:
+                redundant.extend(products_by_row[row])
+
+        return {
+            "t": t,
+            "features": feature_count,
+            "products": len(products),
+            "possible": totals["possible"],
+            "covered": totals["covered"],
+            "redundant": sorted(redundant),
+        }
@@ -0,0 +1,215 @@
+""" Provides Coordinator and Worker for distributing test jobs over TCP.
+
+Messages are newline delimited JSON objects. A worker repeatedly sends
+`{"type": "ready"}` and is answered with either `{"type": "job", "job": {...}}`
+or `{"type": "done"}`. After running a job the worker sends
+`{"type": "result", "job_id": ..., "returncode": ..., "reports": {...}}`, with the
+report file contents base64 encoded. A job whose worker disconnects or times
+out before sending its result is put back on the queue for another worker.
+"""
+import base64
+import collections
+import json
+import socket
+import socketserver
+import threading
+import time
+
+
+def send_message(wfile, message):
+    wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+    wfile.flush()
+
+
+def read_message(rfile):
+    """ Read the next message, or None if the other end has gone away.
+    """
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+def encode_reports(reports):
+    return {name: base64.b64encode(content).decode("ascii") for name, content in reports.items()}
+
+
+def decode_reports(encoded_reports):
+    return {name: base64.b64decode(content) for name, content in encoded_reports.items()}
+
+
+def parse_address(address):
+    """ Split a host:port string.
+    """
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+class _CoordinatorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    block_on_close = False
+
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+    """ Hands out jobs to one connected worker until there are none left.
+    """
+
+    def handle(self):
+        coordinator = self.server.coordinator
+
+        while True:
+            try:
+                message = read_message(self.rfile)
+            except (OSError, ValueError):
+                return
+            if message is None or message.get("type") != "ready":
+                return
+
+            job = coordinator.next_job()
+            if job is None:
+                send_message(self.wfile, {"type": "done"})
+                return
+
+            result = None
+            try:
+                send_message(self.wfile, {"type": "job", "job": job})
+                self.connection.settimeout(coordinator.job_timeout)
+                result = read_message(self.rfile)
+                self.connection.settimeout(None)
+            except (OSError, ValueError):
+                result = None
+
+            if result is None or result.get("type") != "result" or result.get("job_id") != job["job_id"]:
+                coordinator.requeue(job)
+                return
+
+            coordinator.complete(job, result)
+
+
+class Coordinator:
+    """ Serves a fixed set of jobs to workers and collects their results.
+    """
+
+    def __init__(self, jobs, host="localhost", port=0, job_timeout=None, on_result=None):
+        self.pending = collections.deque(jobs)
+        self.outstanding = {job["job_id"] for job in jobs}
+        self.returncodes = {}
+        self.job_timeout = job_timeout
+        self.on_result = on_result
+        self.condition = threading.Condition()
+        self.server = _CoordinatorServer((host, port), _CoordinatorHandler)
+        self.server.coordinator = self
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def run(self):
+        """ Serve jobs until every job has a result.
+        Returns the runner's return code for each job id.
+        """
+        server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        server_thread.start()
+        try:
+            with self.condition:
+                while self.outstanding:
+                    self.condition.wait()
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+
+        return self.returncodes
+
+    def next_job(self):
+        """ The next job to run, waiting while other workers might still hand jobs back.
+        None once all jobs are complete.
+        """
+        with self.condition:
+            while True:
+                if self.pending:
+                    return self.pending.popleft()
+                if not self.outstanding:
+                    return None
+                self.condition.wait()
+
+    def requeue(self, job):
+        with self.condition:
+            if job["job_id"] in self.outstanding:
+                self.pending.appendleft(job)
+                self.condition.notify_all()
+
+    def complete(self, job, result):
+        with self.condition:
+            if job["job_id"] not in self.outstanding:
+                return
+            if self.on_result is not None:
+                self.on_result(job, result)
+            self.returncodes[job["job_id"]] = result.get("returncode")
+            self.outstanding.remove(job["job_id"])
+            self.condition.notify_all()
+
+
+class Worker:
+    """ Connects to a coordinator and runs the jobs it is given.
+
+    run_job is called with each job and must return the runner's return code
+    and a dict of report file names to their contents as bytes.
+    """
+
+    def __init__(self, host, port, run_job, connect_timeout=30):
+        self.host = host
+        self.port = port
+        self.run_job = run_job
+        self.connect_timeout = connect_timeout
+
+    def connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                return socket.create_connection((self.host, self.port))
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+    def run(self):
+        """ Run jobs until the coordinator says there are none left, or goes
+        away. The coordinator drops a worker whose job has timed out, having
+        handed the job to another worker, so the result of a job that took too
+        long may not be sent.
+        Returns the number of jobs run.
+        """
+        jobs_run = 0
+        with self.connect() as sock:
+            rfile = sock.makefile("rb")
+            wfile = sock.makefile("wb")
+            try:
+                while True:
+                    try:
+                        send_message(wfile, {"type": "ready"})
+                        message = read_message(rfile)
+                    except OSError:
+                        return jobs_run
+                    if message is None or message.get("type") != "job":
+                        return jobs_run
+
+                    job = message["job"]
+                    returncode, reports = self.run_job(job)
+                    jobs_run += 1
+                    try:
+                        send_message(wfile, {
+                            "type": "result",
+                            "job_id": job["job_id"],
+                            "returncode": returncode,
+                            "reports": encode_reports(reports),
+                        })
+                    except OSError:
+                        return jobs_run
+            finally:
+                rfile.close()
+                try:
+                    wfile.close()
+                except OSError:
+                    # What couldn't be sent is still buffered, and is dropped.
+                    pass
@@ -0,0 +1,91 @@
+""" Makes the per-product pages of the docs, each product independently of the
+others, on a pool of worker processes.
+
+Every worker gets the same read-only inputs once, when it starts: the feature
+model's XML, the gherkin pieces, the product matrix and where the test reports
+are. For each product it parses its own copy of the feature model, trims it
+to the product, works out its test statuses and writes the page. Only a
+summary of each product comes back, so the memory used doesn't grow with the
+number of products, and at most twice as many products as there are workers
+are queued at once.
+"""
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from os import getpid, path
+
+from aplet.pltools import parsers, tracing
+
+
+# The inputs and page writer of the worker process this module runs in.
+WORKER = {}
+
+
+def make_product_page(inputs, write_page, product_name):
+    """ Work out a product's test statuses and write its page by calling
+    write_page(product_name, root_feature, test_status, test_report_path),
+    where test_report_path is None if the product has no HTML test report.
+    Returns (product_name, test_status, whatever write_page returned).
+    """
+    testreports_path = inputs["testreports_path"]
+    with tracing.span("parse_model", product=product_name):
+        feature_model = parsers.FeatureModelParser().parse_xml(inputs["model_xml"])
+    with tracing.span("parse_report", product=product_name):
+        gherkin_piece_test_statuses, _ = parsers.TestResultsParser().get_test_results_for_product(
+            testreports_path, product_name, inputs["results_format"])
+    with tracing.span("calculate_test_statuses", product=product_name):
+        configparser = parsers.ProductConfigParser(feature_model.root_feature.name)
+        feature_model.trim_based_on_config(configparser.parse_product(inputs["product_matrix"], product_name))
+        feature_model.add_gherkin_pieces(inputs["gherkin_pieces"])
+        feature_model.calculate_test_statuses(gherkin_piece_test_statuses)
+
+    test_status = feature_model.root_feature.test_status
+    test_report_path = path.join(testreports_path, "report{0}.html".format(product_name))
+    page_result = write_page(product_name, feature_model.root_feature, test_status,
+                             test_report_path if path.exists(test_report_path) else None)
+    return product_name, test_status, page_result
+
+
+def init_worker(inputs, write_page, trace_start_time):
+    WORKER["inputs"] = inputs
+    WORKER["write_page"] = write_page
+    if trace_start_time is not None:
+        tracing.TRACER.enable_in_worker(trace_start_time)
+
+
+def make_product_page_in_worker(product_name):
+    product_name, test_status, page_result = make_product_page(WORKER["inputs"], WORKER["write_page"], product_name)
+    return product_name, test_status, page_result, getpid(), tracing.TRACER.take_spans()
+
+
+def make_product_pages(inputs, product_names, write_page, jobs, on_done=None):
+    """ Make the page of every product, up to `jobs` at once, calling
+    on_done(product_name, test_status, page_result), if given, in this
+    process as each is made, in whatever order they finish.
+    inputs is a dict of the model_xml, gherkin_pieces, product_matrix,
+    testreports_path and results_format; it and write_page must be picklable.
+    With a single job, the pages are made in this process.
+    """
+    if on_done is None:
+        on_done = lambda product_name, test_status, page_result: None
+
+    if jobs <= 1 or len(product_names) <= 1:
+        for product_name in product_names:
+            on_done(*make_product_page(inputs, write_page, product_name))
+        return
+
+    trace_start_time = tracing.TRACER.start_time if tracing.TRACER.enabled else None
+    unqueued_product_names = iter(product_names)
+    workers = min(jobs, len(product_names))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(inputs, write_page, trace_start_time)) as executor:
+        pending = set()
+        while True:
+            for product_name in itertools.islice(unqueued_product_names, 2 * workers - len(pending)):
+                pending.add(executor.submit(make_product_page_in_worker, product_name))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                product_name, test_status, page_result, worker_id, spans = future.result()
+                tracing.TRACER.add_worker_spans(worker_id, spans)
+                on_done(product_name, test_status, page_result)
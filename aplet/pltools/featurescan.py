@@ -0,0 +1,164 @@
+""" Provides scan_feature, a fast line scanner for BDD .feature files that picks
+out just the feature and scenario names and tags, without building the full
+gherkin3 AST of steps, tables and doc strings.
+
+It understands the common, well-formed subset of Gherkin. For anything it
+can't be sure gherkin3 would read the same way (other languages, doc strings
+outside of steps, misplaced tags, or syntax errors) it returns None so that
+the caller falls back to the full gherkin3 Parser.
+"""
+from gherkin3.dialect import Dialect
+from gherkin3.gherkin_line import GherkinLine
+from gherkin3.token_matcher import TokenMatcher
+
+
+DIALECT = Dialect.for_name("en")
+
+TITLE_KEYWORDS = (
+    [(keyword + ":", "feature") for keyword in DIALECT.feature_keywords] +
+    [(keyword + ":", "background") for keyword in DIALECT.background_keywords] +
+    [(keyword + ":", "scenario") for keyword in DIALECT.scenario_keywords] +
+    [(keyword + ":", "outline") for keyword in DIALECT.scenario_outline_keywords] +
+    [(keyword + ":", "examples") for keyword in DIALECT.examples_keywords]
+)
+
+STEP_KEYWORDS = tuple(set(DIALECT.given_keywords + DIALECT.when_keywords + DIALECT.then_keywords +
+                          DIALECT.and_keywords + DIALECT.but_keywords))
+
+DOC_STRING_SEPARATORS = ('"""', '```')
+
+
+def match_title_keyword(stripped_line):
+    for keyword, section in TITLE_KEYWORDS:
+        if stripped_line.startswith(keyword):
+            return section, stripped_line[len(keyword):].strip()
+    return None, None
+
+
+def count_table_cells(line):
+    return len(GherkinLine(line, 0).table_cells)
+
+
+def is_section_complete(section, examples_rows):
+    """ Whether gherkin3 allows a section to end here: scenario outlines need
+    examples, and examples need a table with a header and at least one row.
+    """
+    if section == "outline":
+        return False
+    if section == "examples":
+        return examples_rows >= 2
+    return True
+
+
+def scan_feature(text):
+    """ Scan a feature file's text into the parts of the gherkin3 AST that aplet
+    uses: the feature's `tags` and `name`, and the `tags` and `name` of each of
+    its `scenarioDefinitions` (scenarios and scenario outlines).
+    Returns None if the text needs the full parser.
+    """
+    feature = None
+    has_background = False
+    pending_tags = []
+    section = None
+    # What the last line of the current section was: "step", "table", "doc_string" or None.
+    last_line = None
+    # Description text has to come straight after a keyword line, before any comments, steps or tables.
+    description_ended = False
+    examples_rows = 0
+    # gherkin3 rejects tables whose rows have different numbers of cells.
+    table_width = None
+    doc_string_separator = None
+
+    for line in text.split("\n"):
+        stripped_line = line.strip()
+
+        if doc_string_separator is not None:
+            if stripped_line.startswith(doc_string_separator):
+                doc_string_separator = None
+                last_line = "doc_string"
+            continue
+
+        if not stripped_line:
+            continue
+
+        if stripped_line.startswith("#"):
+            language_match = TokenMatcher.LANGUAGE_RE.match(line)
+            if section is None and language_match and language_match.group(1) != "en":
+                return None
+            description_ended = section is not None
+            continue
+
+        if stripped_line.startswith("@"):
+            pending_tags.extend({"name": "@" + item.strip()} for item in stripped_line.split("@")[1:])
+            continue
+
+        title_section, title = match_title_keyword(stripped_line)
+        if title_section is not None:
+            if not (title_section == "examples" and section == "outline" or
+                    is_section_complete(section, examples_rows)):
+                return None
+
+            if title_section == "feature":
+                if section is not None:
+                    return None
+                feature = {"tags": pending_tags, "name": title, "scenarioDefinitions": []}
+            elif section is None:
+                return None
+            elif title_section == "background":
+                if pending_tags or has_background or feature["scenarioDefinitions"]:
+                    return None
+                has_background = True
+            elif title_section == "examples":
+                # Examples tags aren't part of the outline's tags.
+                if section not in ("outline", "examples"):
+                    return None
+            else:
+                feature["scenarioDefinitions"].append({"tags": pending_tags, "name": title})
+
+            section = title_section
+            pending_tags = []
+            last_line = None
+            description_ended = False
+            examples_rows = 0
+            continue
+
+        # Tags must be followed by a feature, scenario or examples.
+        if pending_tags or section is None:
+            return None
+
+        if section in ("background", "scenario", "outline"):
+            if stripped_line.startswith(STEP_KEYWORDS):
+                last_line = "step"
+                description_ended = True
+            elif stripped_line.startswith("|"):
+                if last_line not in ("step", "table"):
+                    return None
+                if last_line == "step":
+                    table_width = count_table_cells(line)
+                elif count_table_cells(line) != table_width:
+                    return None
+                last_line = "table"
+            elif stripped_line.startswith(DOC_STRING_SEPARATORS):
+                if last_line != "step":
+                    return None
+                doc_string_separator = stripped_line[:3]
+            elif description_ended:
+                return None
+        elif section == "examples":
+            if stripped_line.startswith("|"):
+                if last_line != "table":
+                    table_width = count_table_cells(line)
+                elif count_table_cells(line) != table_width:
+                    return None
+                last_line = "table"
+                examples_rows += 1
+                description_ended = True
+            elif description_ended or stripped_line.startswith(DOC_STRING_SEPARATORS):
+                return None
+        elif description_ended or stripped_line.startswith(DOC_STRING_SEPARATORS):
+            return None
+
+    if (doc_string_separator is not None or pending_tags or feature is None or
+            not is_section_complete(section, examples_rows)):
+        return None
+    return feature
@@ -0,0 +1,189 @@
+""" Provides FixtureSupervisor for starting, probing and reaping the long-running
+processes (web servers, webdrivers, ...) that a product line's tests depend on.
+"""
+import asyncio
+from urllib.parse import urlsplit
+
+
+class FixtureError(Exception):
+    """ Raised when a fixture fails to start or never becomes ready. """
+
+
+class Fixture:
+    """ A single configured fixture, as found in the `fixtures` section of aplet.yml.
+    """
+
+    def __init__(self, spec):
+        self.name = spec["name"]
+        self.command = list(spec["command"])
+        self.scope = spec.get("scope", "product")
+        self.probe = spec.get("probe", {})
+        self.timeout = float(spec.get("timeout", 30))
+        self.process = None
+        self.rendered_command = None
+        self.rendered_probe = {}
+
+    def render(self, template, context):
+        """ Fill in the {placeholders} of a template from the given context.
+        Literal braces must be doubled, as {{ and }}.
+        """
+        try:
+            return str(template).format(**context)
+        except KeyError as error:
+            raise FixtureError("Fixture {0} uses {{{1}}}, which isn't known in {2} scope (known are {3}); "
+                               "write literal braces as {{{{ and }}}}".format(
+                                   self.name, error.args[0], self.scope, ", ".join(sorted(context)) or "none")) from None
+        except (IndexError, ValueError) as error:
+            raise FixtureError("Fixture {0} can't fill in {1!r}: {2}; write literal braces as {{{{ and }}}}".format(
+                self.name, str(template), error)) from None
+
+    def render_command(self, context):
+        return [self.render(argument, context) for argument in self.command]
+
+    def render_probe(self, context):
+        return {kind: self.render(target, context) for kind, target in self.probe.items()}
+
+    def is_running(self):
+        return self.process is not None and self.process.returncode is None
+
+
+class FixtureSupervisor:
+    """ Starts fixtures concurrently, waits on their readiness probes and reaps them.
+
+    Fixtures with `scope: productline` are started once for the whole run.
+    Fixtures with `scope: product` are (re)started before each product, but a
+    running fixture is reused when its rendered command has not changed.
+    """
+
+    def __init__(self, fixture_specs, stop_timeout=5):
+        self.fixtures = [Fixture(spec) for spec in fixture_specs]
+        self.stop_timeout = stop_timeout
+        self.loop = asyncio.new_event_loop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self, scope, context):
+        """ Make sure every fixture of the given scope is running and ready.
+        Returns the names of the fixtures that had to be (re)started.
+        """
+        return self.loop.run_until_complete(self._start(scope, context))
+
+    def stop(self, scope):
+        """ Terminate the running fixtures of the given scope and wait for them to exit.
+        """
+        self.loop.run_until_complete(self._stop_scope(scope))
+
+    def stop_all(self):
+        """ Terminate all running fixtures and wait for them to exit.
+        """
+        self.loop.run_until_complete(self._stop_all())
+
+    def close(self):
+        if not self.loop.is_closed():
+            self.stop_all()
+            self.loop.close()
+
+    async def _start(self, scope, context):
+        pending = []
+        for fixture in self.fixtures:
+            if fixture.scope != scope:
+                continue
+            command = fixture.render_command(context)
+            if fixture.is_running() and fixture.rendered_command == command:
+                continue
+            pending.append((fixture, command, fixture.render_probe(context)))
+
+        await asyncio.gather(*[self._stop(fixture) for fixture, _, _ in pending])
+        await asyncio.gather(*[self._spawn(fixture, command, probe) for fixture, command, probe in pending])
+
+        return [fixture.name for fixture, _, _ in pending]
+
+    async def _spawn(self, fixture, command, probe):
+        try:
+            fixture.process = await asyncio.create_subprocess_exec(*command)
+        except OSError as ex:
+            raise FixtureError("Could not start fixture {0}: {1}".format(fixture.name, ex))
+        fixture.rendered_command = command
+        fixture.rendered_probe = probe
+
+        try:
+            await asyncio.wait_for(self._wait_until_ready(fixture), fixture.timeout)
+        except asyncio.TimeoutError:
+            raise FixtureError("Fixture {0} not ready after {1}s".format(fixture.name, fixture.timeout))
+
+    async def _wait_until_ready(self, fixture):
+        if "tcp" in fixture.rendered_probe:
+            probe = self._probe_tcp
+            target = fixture.rendered_probe["tcp"]
+        elif "http" in fixture.rendered_probe:
+            probe = self._probe_http
+            target = fixture.rendered_probe["http"]
+        else:
+            return
+
+        delay = 0.01
+        while True:
+            if fixture.process.returncode is not None:
+                raise FixtureError("Fixture {0} exited with code {1} before becoming ready".format(
+                    fixture.name, fixture.process.returncode))
+            if await probe(target):
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def _probe_tcp(self, target):
+        host, port = target.rsplit(":", 1)
+        try:
+            _, writer = await asyncio.open_connection(host, int(port))
+        except OSError:
+            return False
+        writer.close()
+        return True
+
+    async def _probe_http(self, url):
+        parts = urlsplit(url)
+        request_path = parts.path or "/"
+        if parts.query:
+            request_path += "?" + parts.query
+        try:
+            reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        except OSError:
+            return False
+        try:
+            writer.write("GET {0} HTTP/1.0\r\nHost: {1}\r\n\r\n".format(request_path, parts.netloc).encode())
+            await writer.drain()
+            status_line = await reader.readline()
+        except OSError:
+            return False
+        finally:
+            writer.close()
+
+        fields = status_line.split()
+        return len(fields) >= 2 and fields[0].startswith(b"HTTP/") and fields[1].isdigit() and int(fields[1]) < 500
+
+    async def _stop_scope(self, scope):
+        await asyncio.gather(*[self._stop(fixture) for fixture in self.fixtures if fixture.scope == scope])
+
+    async def _stop_all(self):
+        await asyncio.gather(*[self._stop(fixture) for fixture in self.fixtures])
+
+    async def _stop(self, fixture):
+        process = fixture.process
+        fixture.process = None
+        fixture.rendered_command = None
+        if process is None:
+            return
+        if process.returncode is None:
+            try:
+                process.terminate()
+            except ProcessLookupError:
+                pass
+            try:
+                await asyncio.wait_for(process.wait(), self.stop_timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+        await process.wait()
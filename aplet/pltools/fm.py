@@ -1,4 +1,5 @@
 import copy
+from collections import Counter
 from enum import Enum
 
 from anytree import Node
@@ -21,8 +22,12 @@ class FeatureModel:
 
     def __init__(self):
         self.root_feature = None
+        self.gherkin_pieces_by_name = {}
+        # Cross-tree constraints, as nested tuples such as ("imp", ("var", "A"), ("var", "B")).
+        self.constraints = []
 
     def add_gherkin_pieces(self, gherkin_pieces):
+        self.gherkin_pieces_by_name = {}
         self.add_gherkin_pieces_rec(self.root_feature, gherkin_pieces) 
 
     def add_gherkin_pieces_rec(self, feature, gherkin_pieces):
@@ -33,6 +38,7 @@ class FeatureModel:
             for piece_name in gherkin_pieces_for_feature:
                 piece_node = Node(piece_name, parent=None, node_type=NodeType.gherkin_piece)
                 feature.gherkin_pieces.append(piece_node)
+                self.gherkin_pieces_by_name.setdefault(piece_name, []).append((feature, piece_node))
 
         if not feature.mandatory and feature.notname in gherkin_pieces:
             gherkin_pieces_for_feature = gherkin_pieces[feature.notname]
@@ -40,6 +46,7 @@ class FeatureModel:
             for piece_name in gherkin_pieces_for_feature:
                 piece_node = Node(piece_name, parent=None, node_type=NodeType.gherkin_piece)
                 feature.gherkin_pieces.append(piece_node)
+                self.gherkin_pieces_by_name.setdefault(piece_name, []).append((feature, piece_node))
 
         for child in feature.children:
             self.add_gherkin_pieces_rec(child, gherkin_pieces)
@@ -49,33 +56,71 @@ class FeatureModel:
         self.calculate_test_statuses_rec(self.root_feature, test_statuses) 
 
     def calculate_test_statuses_rec(self, feature, test_statuses):
-        feature.test_status = None
-
-        # recursively parse the children
+        # recursively parse the children, counting their statuses
+        feature.child_test_statuses = Counter()
         for child in feature.children:
             child_test_status = self.calculate_test_statuses_rec(child, test_statuses)
-            if child_test_status is TestState.passed:
-                if feature.test_status is None or feature.test_status is TestState.passed:
-                    feature.test_status = TestState.passed
-            if child_test_status is TestState.inconclusive:
-                if feature.test_status is None or feature.test_status is not TestState.failed:
-                    feature.test_status = TestState.inconclusive
-            if child_test_status is TestState.failed:
-                feature.test_status = TestState.failed
+            feature.child_test_statuses[child_test_status] += 1
 
         if feature.gherkin_pieces:
             for piece in feature.gherkin_pieces:
                 piece.test_status = TestState.inconclusive
-                if piece.name in test_statuses:
+                piece.has_result = piece.name in test_statuses
+                if piece.has_result:
                     piece.test_status = test_statuses[piece.name]
-                    feature.test_status = test_statuses[piece.name]
 
-        if feature.test_status is None:
-            feature.test_status = TestState.inconclusive
+        feature.test_status = self.get_feature_test_status(feature)
 
         return feature.test_status
 
 
+    def get_feature_test_status(self, feature):
+        """ A feature's status: that of its last gherkin piece with a test result, or
+        if none of its pieces have results, the worst status amongst its children.
+        """
+        for piece in reversed(feature.gherkin_pieces):
+            if piece.has_result:
+                return piece.test_status
+
+        for test_status in (TestState.failed, TestState.inconclusive, TestState.passed):
+            if feature.child_test_statuses[test_status]:
+                return test_status
+
+        return TestState.inconclusive
+
+
+    def update_test_statuses(self, changed_test_statuses):
+        """ Update the statuses after new results for some scenarios, without
+        recalculating the whole tree. calculate_test_statuses must have been run first.
+
+        Only the gherkin pieces with the changed names are updated, and the change is
+        propagated up through their ancestors' child status counts, stopping at the
+        first ancestor whose status doesn't change.
+        Returns the features whose status changed.
+        """
+        changed_features = []
+
+        for piece_name, test_status in changed_test_statuses.items():
+            for feature, piece in self.gherkin_pieces_by_name.get(piece_name, []):
+                piece.test_status = test_status
+                piece.has_result = True
+
+                while feature is not None:
+                    old_test_status = feature.test_status
+                    feature.test_status = self.get_feature_test_status(feature)
+                    if feature.test_status is old_test_status:
+                        break
+
+                    changed_features.append(feature)
+                    parent = feature.parent
+                    if parent is not None:
+                        parent.child_test_statuses[old_test_status] -= 1
+                        parent.child_test_statuses[feature.test_status] += 1
+                    feature = parent
+
+        return changed_features
+
+
     def get_copy_trimmed_based_on_config(self, configured_features):
         copy_fm = copy.deepcopy(self)
         copy_fm.trim_based_on_config(configured_features)
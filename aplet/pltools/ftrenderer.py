@@ -9,6 +9,7 @@ from os import path, listdir
 from gherkin3.parser import Parser
 import graphviz as gv
 
+from aplet.pltools.featurescan import scan_feature
 from aplet.pltools.fm import NodeType, TestState
 
 NodeProps = namedtuple("NodeProps", "fillcolor linecolor shape style")
@@ -112,17 +113,50 @@ class FeatureTreeRenderer:
         self.graph.render(filename=path.join(output_dir, output_filename))
 
 
+def parsed_feature_files(features_dir):
+    """ Parse each BDD feature file in a folder, yielding the gherkin ASTs.
+    Only the tags and names are needed, so files are read with the fast
+    scan_feature where possible, falling back to the full gherkin3 parser.
+    """
+    for _, feature_parsed in parsed_feature_files_by_name(features_dir):
+        yield feature_parsed
+
+
+def parsed_feature_files_by_name(features_dir):
+    """ As parsed_feature_files, yielding each file's name along with its AST.
+    """
+    gherkin_parser = Parser()
+
+    for feature_filename in listdir(features_dir):
+        with open(path.join(features_dir, feature_filename), "r") as feature_file:
+            text = feature_file.read()
+        feature_parsed = scan_feature(text)
+        if feature_parsed is None:
+            feature_parsed = gherkin_parser.parse(text)
+        yield feature_filename, feature_parsed
+
+
+def feature_file_tags(features_dir):
+    """ The tag names used in each BDD feature file, on the feature or any of
+    its scenarios, by file name.
+    """
+    tags_by_filename = {}
+    for feature_filename, feature_parsed in parsed_feature_files_by_name(features_dir):
+        tag_names = {tag['name'][1:] for tag in feature_parsed['tags']}
+        for scenario in feature_parsed['scenarioDefinitions']:
+            tag_names.update(tag['name'][1:] for tag in scenario['tags'])
+        tags_by_filename[feature_filename] = tag_names
+
+    return tags_by_filename
+
+
 def gherkin_pieces_grouped_by_featurename(features_dir):
     """ For a list of BDD feature files, discover the parts
     that are tagged with FM feature names (features and scenarios) and group them by the FM feature names.
     """
 
-    gherkin_parser = Parser()
-
     pieces_grouped_by_tag = {}
-    for feature_file in listdir(features_dir):
-        feature_file = open(path.join(features_dir, feature_file), "r")
-        feature_parsed = gherkin_parser.parse(feature_file.read())
+    for feature_parsed in parsed_feature_files(features_dir):
 
         for tag in feature_parsed['tags']:
             tag_name = tag['name'][1:] # remove @
@@ -138,3 +172,20 @@ def gherkin_pieces_grouped_by_featurename(features_dir):
                 pieces_grouped_by_tag[tag_name].append(scenario['name'])
 
     return pieces_grouped_by_tag
+
+
+def scenarios_grouped_by_tag(features_dir):
+    """ Group the scenarios of the BDD feature files by tag name. Unlike
+    gherkin_pieces_grouped_by_featurename, scenarios inherit their feature's tags,
+    so this is the set of scenarios a test runner selects for a tag.
+    """
+    scenarios_by_tag = {}
+    for feature_parsed in parsed_feature_files(features_dir):
+        feature_tags = [tag['name'][1:] for tag in feature_parsed['tags']]
+
+        for scenario in feature_parsed['scenarioDefinitions']:
+            scenario_tags = feature_tags + [tag['name'][1:] for tag in scenario['tags']]
+            for tag_name in scenario_tags:
+                scenarios_by_tag.setdefault(tag_name, []).append(scenario['name'])
+
+    return scenarios_by_tag
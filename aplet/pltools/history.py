@@ -0,0 +1,279 @@
+""" Provides ResultsCube, an append-only store of the test results of every
+run: runs × products × scenarios, at 2 bits per cell, which queries read
+memory-mapped.
+
+The cube is a folder of:
+- runs.txt, products.txt and scenarios.txt, string tables with a name per
+  line in order of first appearance, so that a name's index never changes;
+- rows.bin, the run and product index of each row, as two uint32s;
+- cells-<n>.bin, the rows' scenario results packed 4 cells to a byte, in
+  segments with a fixed number of scenarios per row. A row with more
+  scenarios than its segment holds starts a new, wider segment;
+- cube.json, each segment's scenario count and first row, and when the cube
+  was last brought up to date with the report archive.
+
+A cell holds the TestState value of the scenario's result, or 0 if it has
+none. Queries stream the rows in chunks, so the memory they need depends on
+the numbers of products and scenarios, not on the length of the history.
+"""
+import bisect
+import json
+import shutil
+from os import makedirs, path, remove
+
+import numpy as np
+
+from aplet.pltools.fm import TestState
+
+
+NO_RESULT = 0
+
+CELLS_PER_BYTE = 4
+
+CELL_SHIFTS = np.arange(0, 8, 2, dtype=np.uint8)
+
+ROW_DTYPE = np.dtype([("run", "<u4"), ("product", "<u4")])
+
+# Segments are at least this many scenarios wide, so that a growing suite doesn't start a segment every run.
+MIN_SEGMENT_SCENARIOS = 64
+
+# Roughly how many cells a query unpacks at a time.
+CHUNK_CELLS = 1 << 20
+
+
+def pack_cells(cells):
+    """ Pack a row of cell values, whose length is a multiple of 4, into bytes.
+    """
+    grouped = cells.reshape(-1, CELLS_PER_BYTE)
+    return np.bitwise_or.reduce(grouped << CELL_SHIFTS, axis=1).astype(np.uint8)
+
+
+def unpack_cells(packed):
+    """ Unpack a (rows, bytes) array of packed cells into a (rows, scenarios) array of cell values.
+    """
+    return ((packed[:, :, np.newaxis] >> CELL_SHIFTS) & 3).reshape(packed.shape[0], -1)
+
+
+class StringTable:
+    """ Names by index, appended to a text file as they are first seen.
+    """
+
+    def __init__(self, table_path):
+        self.table_path = table_path
+        self.names = []
+        if path.exists(table_path):
+            with open(table_path, "r", encoding="utf-8") as table_file:
+                self.names = table_file.read().split("\n")[:-1]
+        self.indexes = {name: index for index, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, name):
+        return self.indexes.get(name)
+
+    def add(self, name):
+        """ The index of a name, adding it if it is new.
+        """
+        index = self.indexes.get(name)
+        if index is None:
+            if "\n" in name:
+                raise ValueError("Names can't contain line breaks: {0!r}".format(name))
+            with open(self.table_path, "a", encoding="utf-8") as table_file:
+                table_file.write(name + "\n")
+            index = self.indexes[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+
+class ResultsCube:
+    """ The results of every run of every product, kept in cube_dir.
+    """
+
+    def __init__(self, cube_dir):
+        self.cube_dir = cube_dir
+        if not path.exists(cube_dir):
+            makedirs(cube_dir)
+        self.runs = StringTable(path.join(cube_dir, "runs.txt"))
+        self.products = StringTable(path.join(cube_dir, "products.txt"))
+        self.scenarios = StringTable(path.join(cube_dir, "scenarios.txt"))
+
+        self.rows_path = path.join(cube_dir, "rows.bin")
+        self.row_count = path.getsize(self.rows_path) // ROW_DTYPE.itemsize if path.exists(self.rows_path) else 0
+        self.meta_path = path.join(cube_dir, "cube.json")
+        meta = {"segments": [], "synced": None}
+        if path.exists(self.meta_path):
+            with open(self.meta_path, "r") as meta_file:
+                meta = json.load(meta_file)
+        self.segments = meta["segments"]
+        # When the results of the archived runs were last added.
+        self.synced = meta["synced"]
+
+    def segment_path(self, segment_index):
+        return path.join(self.cube_dir, "cells-{0}.bin".format(segment_index))
+
+    def save_meta(self):
+        with open(self.meta_path + ".tmp", "w") as meta_file:
+            json.dump({"segments": self.segments, "synced": self.synced}, meta_file)
+        shutil.move(self.meta_path + ".tmp", self.meta_path)
+
+    def set_synced(self, synced):
+        self.synced = synced
+        self.save_meta()
+
+    def read_rows(self):
+        """ The run and product indexes of every row, memory-mapped.
+        """
+        if not self.row_count:
+            return np.zeros(0, dtype=ROW_DTYPE)
+        return np.memmap(self.rows_path, dtype=ROW_DTYPE, mode="r", shape=(self.row_count,))
+
+    def read_segment(self, segment_index):
+        """ A segment's packed cells, memory-mapped as a (rows, bytes) array.
+        """
+        segment = self.segments[segment_index]
+        end_row = self.row_count
+        if segment_index + 1 < len(self.segments):
+            end_row = self.segments[segment_index + 1]["first_row"]
+        shape = (end_row - segment["first_row"], segment["scenarios"] // CELLS_PER_BYTE)
+        if not shape[0]:
+            return np.zeros(shape, dtype=np.uint8)
+        return np.memmap(self.segment_path(segment_index), dtype=np.uint8, mode="r", shape=shape)
+
+    def add_results(self, run_id, product_name, results):
+        """ Append a product's results in a run ({scenario name: TestState}) as a row.
+        """
+        run_index = self.runs.add(run_id)
+        product_index = self.products.add(product_name)
+        scenario_indexes = np.array([self.scenarios.add(scenario_name) for scenario_name in results], dtype=np.int64)
+        scenario_count = int(scenario_indexes.max()) + 1 if len(scenario_indexes) else 0
+
+        if not self.segments or scenario_count > self.segments[-1]["scenarios"]:
+            width = max(MIN_SEGMENT_SCENARIOS, 2 * self.segments[-1]["scenarios"] if self.segments else 0)
+            while width < scenario_count:
+                width *= 2
+            self.segments.append({"scenarios": width, "first_row": self.row_count})
+            self.save_meta()
+        segment_index = len(self.segments) - 1
+        segment = self.segments[segment_index]
+
+        cells = np.zeros(segment["scenarios"], dtype=np.uint8)
+        cells[scenario_indexes] = [test_status.value for test_status in results.values()]
+
+        # Cells are written before the row that refers to them, and anything past the last
+        # row (left by an interrupted append) is overwritten.
+        row_bytes = segment["scenarios"] // CELLS_PER_BYTE
+        segment_path = self.segment_path(segment_index)
+        with open(segment_path, "r+b" if path.exists(segment_path) else "wb") as segment_file:
+            segment_file.seek((self.row_count - segment["first_row"]) * row_bytes)
+            segment_file.write(pack_cells(cells).tobytes())
+            segment_file.truncate()
+        with open(self.rows_path, "r+b" if path.exists(self.rows_path) else "wb") as rows_file:
+            rows_file.seek(self.row_count * ROW_DTYPE.itemsize)
+            rows_file.write(np.array([(run_index, product_index)], dtype=ROW_DTYPE).tobytes())
+            rows_file.truncate()
+        self.row_count += 1
+
+    def iter_chunks(self):
+        """ Yield the rows in order, a chunk at a time, as (rows, cells): the
+        chunk's run and product indexes, and its (rows, scenarios) cell values.
+        Scenarios past the row's segment width have no result.
+        """
+        rows = self.read_rows()
+        scenario_count = len(self.scenarios)
+        for segment_index, segment in enumerate(self.segments):
+            packed = self.read_segment(segment_index)
+            chunk_rows = max(1, CHUNK_CELLS // max(segment["scenarios"], 1))
+            for start in range(0, packed.shape[0], chunk_rows):
+                cells = unpack_cells(np.asarray(packed[start:start + chunk_rows]))[:, :scenario_count]
+                if cells.shape[1] < scenario_count:
+                    cells = np.pad(cells, ((0, 0), (0, scenario_count - cells.shape[1])))
+                first_row = segment["first_row"] + start
+                yield np.asarray(rows[first_row:first_row + cells.shape[0]]), cells
+
+    def get_run_products(self, run_id):
+        """ The names of the products with results in a run.
+        """
+        run_index = self.runs.get(run_id)
+        if run_index is None:
+            return set()
+        rows = self.read_rows()
+        product_indexes = np.unique(rows["product"][rows["run"] == run_index])
+        return {self.products.names[product_index] for product_index in product_indexes}
+
+    def get_run_results(self, run_id):
+        """ The cell values of every product and scenario in a run, as a
+        (products, scenarios) array.
+        """
+        run_index = self.runs.get(run_id)
+        if run_index is None:
+            raise KeyError(run_id)
+
+        results = np.zeros((len(self.products), len(self.scenarios)), dtype=np.uint8)
+        rows = self.read_rows()
+        first_rows = [segment["first_row"] for segment in self.segments]
+        packed_segments = {}
+        for row_index in np.flatnonzero(rows["run"] == run_index):
+            segment_index = bisect.bisect_right(first_rows, row_index) - 1
+            if segment_index not in packed_segments:
+                packed_segments[segment_index] = self.read_segment(segment_index)
+            packed = packed_segments[segment_index][row_index - first_rows[segment_index]]
+            cells = unpack_cells(np.asarray(packed)[np.newaxis])[0, :len(self.scenarios)]
+            results[rows["product"][row_index], :len(cells)] = cells
+        return results
+
+    def get_flip_counts(self):
+        """ How many times each product's scenarios went from passed to failed
+        or back, between one result of the scenario and the next.
+        Returns a (products, scenarios) array of counts.
+        """
+        product_count = len(self.products)
+        scenario_count = len(self.scenarios)
+        flips = np.zeros((product_count, scenario_count), dtype=np.int64)
+        # The last passed or failed result of each product's scenarios so far.
+        last_results = np.zeros((product_count, scenario_count), dtype=np.uint8)
+
+        for rows, cells in self.iter_chunks():
+            # Group the chunk's rows by product, keeping them in run order.
+            order = np.argsort(rows["product"], kind="stable")
+            products = rows["product"][order]
+            cells = cells[order]
+            cells[(cells != TestState.passed.value) & (cells != TestState.failed.value)] = NO_RESULT
+
+            group_starts = np.flatnonzero(np.r_[True, products[1:] != products[:-1]])
+            group_products = products[group_starts]
+            group_sizes = np.diff(np.r_[group_starts, len(products)])
+
+            # Each group is preceded by a row of its product's last results before the chunk, so
+            # that every cell's previous result is the last one in the rows above it in its group.
+            # That is found for all cells at once by a running maximum of the results tagged with
+            # their row's position.
+            positions = np.arange(len(products) + len(group_starts), dtype=np.int32)
+            start_rows = group_starts + np.arange(len(group_starts))
+            result_rows = np.delete(positions, start_rows)
+            extended = np.empty((len(positions), scenario_count), dtype=np.uint8)
+            extended[start_rows] = last_results[group_products]
+            extended[result_rows] = cells
+            tagged = np.where(extended != NO_RESULT, positions[:, np.newaxis] * 4 + extended, -1)
+            latest = np.maximum.accumulate(tagged, axis=0)
+
+            previous = latest[result_rows - 1]
+            row_start_rows = np.repeat(start_rows, group_sizes)
+            previous = np.where(previous >= row_start_rows[:, np.newaxis] * 4, previous & 3, NO_RESULT)
+            flipped = (cells != NO_RESULT) & (previous != NO_RESULT) & (cells != previous)
+            flips[group_products] += np.add.reduceat(flipped, group_starts, axis=0)
+
+            group_latest = latest[start_rows + group_sizes]
+            last_results[group_products] = np.where(
+                group_latest >= start_rows[:, np.newaxis] * 4, group_latest & 3, NO_RESULT)
+
+        return flips
+
+    def clear(self):
+        for segment_index in range(len(self.segments)):
+            remove(self.segment_path(segment_index))
+        for table_path in (self.rows_path, self.meta_path, self.runs.table_path, self.products.table_path,
+                           self.scenarios.table_path):
+            if path.exists(table_path):
+                remove(table_path)
+        self.__init__(self.cube_dir)
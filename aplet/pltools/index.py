@@ -0,0 +1,139 @@
+""" Provides ProductLineIndex, a prebuilt set of inverted indexes for looking up
+which products include a feature, which scenarios cover a feature and which
+features a scenario covers, without re-reading the product line's files.
+"""
+import json
+from os import listdir, path
+
+from anytree import PostOrderIter, PreOrderIter
+
+
+INDEX_VERSION = 1
+
+
+def get_sources_fingerprint(source_paths):
+    """ Size and modification time of every file the index is built from, so that
+    a stale index can be detected with a stat per file.
+    """
+    fingerprint = {}
+    for source_path in source_paths:
+        if path.isdir(source_path):
+            files = [path.join(source_path, filename) for filename in sorted(listdir(source_path))]
+        else:
+            files = [source_path]
+        for file_path in files:
+            if path.exists(file_path):
+                stat = path.getmtime(file_path), path.getsize(file_path)
+                fingerprint[file_path] = list(stat)
+    return fingerprint
+
+
+class ProductLineIndex:
+    """ Inverted indexes over a product line.
+
+    Which products include a feature is kept as a bitset per feature, with bit i
+    set when the i-th product (in sorted order) includes the feature.
+    """
+
+    def __init__(self, features, products, feature_products, feature_scenarios, untested_features, sources=None):
+        self.features = features
+        self.products = products
+        self.feature_products = feature_products
+        self.feature_scenarios = feature_scenarios
+        self.untested_features = untested_features
+        self.sources = sources or {}
+
+        self.scenario_features = {}
+        for feature_name in features:
+            for scenario_name in feature_scenarios.get(feature_name, []):
+                self.scenario_features.setdefault(scenario_name, []).append(feature_name)
+
+    def products_with_feature(self, feature_name):
+        bitset = self.feature_products.get(feature_name, 0)
+        products = []
+        while bitset:
+            lowest_bit = bitset & -bitset
+            products.append(self.products[lowest_bit.bit_length() - 1])
+            bitset ^= lowest_bit
+        return products
+
+    def scenarios_for_feature(self, feature_name):
+        return self.feature_scenarios.get(feature_name, [])
+
+    def features_for_scenario(self, scenario_name):
+        return self.scenario_features.get(scenario_name, [])
+
+    def features_without_scenarios(self):
+        return self.untested_features
+
+    def is_stale(self, source_paths):
+        return get_sources_fingerprint(source_paths) != self.sources
+
+    def save(self, index_path):
+        data = {
+            "version": INDEX_VERSION,
+            "features": self.features,
+            "products": self.products,
+            "feature_products": {name: format(bitset, "x") for name, bitset in self.feature_products.items()},
+            "feature_scenarios": self.feature_scenarios,
+            "untested_features": self.untested_features,
+            "sources": self.sources,
+        }
+        with open(index_path, "w") as index_file:
+            json.dump(data, index_file)
+
+
+def load_index(index_path):
+    """ Load a saved index, or return None if there isn't a usable one.
+    """
+    if not path.exists(index_path):
+        return None
+    with open(index_path, "r") as index_file:
+        data = json.load(index_file)
+    if data.get("version") != INDEX_VERSION:
+        return None
+
+    return ProductLineIndex(
+        data["features"],
+        data["products"],
+        {name: int(bitset, 16) for name, bitset in data["feature_products"].items()},
+        data["feature_scenarios"],
+        data["untested_features"],
+        data["sources"])
+
+
+def build_index(feature_model, product_features, gherkin_pieces, sources=None):
+    """ Build the index from a feature model, the configured features of each
+    product (as given by ProductConfigParser) and the gherkin pieces grouped by
+    tag (as given by gherkin_pieces_grouped_by_featurename).
+    """
+    products = sorted(product_features)
+    features = [feature.name for feature in PreOrderIter(feature_model.root_feature)]
+
+    feature_products = {feature_name: 0 for feature_name in features}
+    for product_index, product_name in enumerate(products):
+        product_bit = 1 << product_index
+        for feature_name in product_features[product_name]:
+            if feature_name in feature_products:
+                feature_products[feature_name] |= product_bit
+
+    # An abstract feature is in every product that has any of its descendants.
+    for feature in PostOrderIter(feature_model.root_feature):
+        if feature.abstract:
+            for child in feature.children:
+                feature_products[feature.name] |= feature_products[child.name]
+
+    # A feature's scenarios are those tagged with it, and for optional
+    # features those tagged with its absence, as in FeatureModel.add_gherkin_pieces.
+    feature_scenarios = {}
+    untested_features = []
+    for feature in PreOrderIter(feature_model.root_feature):
+        scenarios = list(gherkin_pieces.get(feature.name, []))
+        if not feature.mandatory:
+            scenarios.extend(gherkin_pieces.get(feature.notname, []))
+        if scenarios:
+            feature_scenarios[feature.name] = scenarios
+        elif not feature.abstract:
+            untested_features.append(feature.name)
+
+    return ProductLineIndex(features, products, feature_products, feature_scenarios, untested_features, sources)
@@ -2,6 +2,8 @@
 """
 import xml.etree.ElementTree as et
 
+import numpy as np
+
 from aplet.pltools.fm import TestState
 
 class ProductMapRenderer:
@@ -11,61 +13,85 @@ class ProductMapRenderer:
     def get_productmap_html(self, feature_model, products):
         """ Construct the product map HTML for the feature model and product configurations.
         """
-        root_feature = feature_model.root_feature
-
-        html = "<table class='table table-sm'>"
-        html += "<thead>"
-        html += "<tr>"
-        html += "<th scope='row' class='text-left' style='width:200px'>Features</th>"
-        for product_name, product in sorted(products.items()):
-            html += "<th scope='col' class='text-center' style='max-width:100px'>"
-            html += product_name
-            html += "</th>"
-        html += "</tr>"
-        html += "</thead>"
-        html += "<tbody>"
-        html += self.get_productmap_html_rec(root_feature, products, depth=0)
-        html += "</tbody>"
-        html += "</table>"
-
-        return html
-
-
-    def get_productmap_html_rec(self, node, products, depth):
-        """ Build the HTML table row for a feature in a product line.
-        Recursively build the rows for the feature's children, too.
+        # Each product's features as a set, in column order.
+        product_columns = [set(product['features']) for _, product in sorted(products.items())]
+
+        def enabled_in_products(feature_name):
+            return [feature_name in product_features for product_features in product_columns]
+
+        return self.get_table_html(feature_model.root_feature, sorted(products), enabled_in_products)
+
+    def get_productmap_html_for_matrix(self, feature_model, product_matrix):
+        """ Construct the product map HTML for the feature model and the products
+        of a ProductMatrix, reading each feature's column straight from the
+        products' feature bitmaps rather than listing every product's features.
         """
+        product_names = sorted(product_matrix.products)
+        row_size = (len(product_matrix.features) + 7) // 8
+        # The products' rows as little-endian bytes, one product per row.
+        packed_rows = np.frombuffer(
+            b"".join(product_matrix.rows[product_name].to_bytes(row_size, "little") for product_name in product_names),
+            dtype=np.uint8).reshape(len(product_names), row_size)
 
-        html = "<tr>"
+        def enabled_in_products(feature_name):
+            bit = product_matrix.feature_bits.get(feature_name)
+            if bit is None:
+                return [False] * len(product_names)
+            return ((packed_rows[:, bit >> 3] >> (bit & 7)) & 1).astype(bool).tolist()
+
+        return self.get_table_html(feature_model.root_feature, product_names, enabled_in_products)
+
+    def get_table_html(self, root_feature, product_names, enabled_in_products):
+        """ The product map table, with a column per product in product_names.
+        enabled_in_products(feature_name) says whether each product has the feature.
+        """
+        html = ["<table class='table table-sm'>"]
+        html.append("<thead>")
+        html.append("<tr>")
+        html.append("<th scope='row' class='text-left' style='width:200px'>Features</th>")
+        for product_name in product_names:
+            html.append("<th scope='col' class='text-center' style='max-width:100px'>")
+            html.append(product_name)
+            html.append("</th>")
+        html.append("</tr>")
+        html.append("</thead>")
+        html.append("<tbody>")
+        self.get_productmap_html_rec(root_feature, len(product_names), enabled_in_products, 0, html)
+        html.append("</tbody>")
+        html.append("</table>")
+
+        return "".join(html)
+
+
+    def get_productmap_html_rec(self, node, product_count, enabled_in_products, depth, html):
+        """ Append the HTML table row for a feature in a product line to html.
+        Recursively append the rows for the feature's children, too.
+        """
+
+        html.append("<tr>")
 
         # Name of the feature.
-        html += "<th scope='row' class='text-left' style='width:200px' >"
-        html += ("&nbsp;" * depth * 4) + "&rsaquo;&nbsp;" + node.name
-        html += "</th>"
+        html.append("<th scope='row' class='text-left' style='width:200px' >")
+        html.append(("&nbsp;" * depth * 4) + "&rsaquo;&nbsp;" + node.name)
+        html.append("</th>")
 
         # Whether the feature is enabled for each product.
-        for product_name, product in sorted(products.items()):
-            symbol = ""
-            css_classes = ["text-center"]
-            if not node.abstract:
-                if node.name in product['features']:
-                    symbol = "[&plus;]"
-                    css_classes.append("font-weight-bold")
-                    if node.test_status is TestState.failed:
-                        css_classes.append("text-danger")
-                    elif node.test_status is TestState.passed:
-                        css_classes.append("text-success")
-                    else:
-                        css_classes.append("text-warning")
-                else:
-                    symbol = "&minus;"
+        if node.abstract:
+            html.append("<td class='text-center'>&nbsp;</td>" * product_count)
+        else:
+            css_classes = ["text-center", "font-weight-bold"]
+            if node.test_status is TestState.failed:
+                css_classes.append("text-danger")
+            elif node.test_status is TestState.passed:
+                css_classes.append("text-success")
             else:
-                symbol = "&nbsp;"
-            html += "<td class='{0}'>{1}</td>".format(" ".join(css_classes), symbol)
-        html += "</tr>"
+                css_classes.append("text-warning")
+            enabled_cell = "<td class='{0}'>[&plus;]</td>".format(" ".join(css_classes))
+            disabled_cell = "<td class='text-center'>&minus;</td>"
+            for enabled in enabled_in_products(node.name):
+                html.append(enabled_cell if enabled else disabled_cell)
+        html.append("</tr>")
 
         depth += 1
         for child in node.children:
-            html += self.get_productmap_html_rec(child, products, depth)
-
-        return html
+            self.get_productmap_html_rec(child, product_count, enabled_in_products, depth, html)
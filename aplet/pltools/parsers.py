@@ -1,6 +1,8 @@
 """ Parsers for FeatureIDE feature model files.
 """
 
+import codecs
+import json
 import xml.etree.ElementTree as et
 from os import listdir, path
 
@@ -8,6 +10,23 @@ from anytree import Node, RenderTree
 from aplet.pltools.fm import FeatureModel, NodeType, TestState
 
 
+# The operators allowed in FeatureIDE constraints, with how many operands each
+# takes (None for any number).
+CONSTRAINT_OPERATORS = {"var": 0, "not": 1, "and": None, "or": None, "imp": 2, "eq": 2}
+
+# Where test results are read from: the runner's XML or JSON report, or "auto"
+# for the JSON report if a product has one, else the XML one.
+RESULTS_FORMATS = ("auto", "xml", "json")
+
+# How much of a JSON report is read at a time.
+JSON_REPORT_CHUNK_SIZE = 64 * 1024
+
+# What may come between the top-level values of a JSON report.
+JSON_SEPARATORS = frozenset(" \t\r\n[,]")
+
+# The statuses of the runner's JSON "test" events that count as failures.
+JSON_FAILED_STATUSES = ("fail", "error")
+
 class FeatureModelParser:
     """ Parses a FeatureIDE XML file and returns feature model data structure.
     """
@@ -30,6 +49,17 @@ class FeatureModelParser:
             features_root = list(struct_el)[0]
             fm.root_feature = self.recurse_features(features_root, None)
 
+        constraints_el = xml_el.find('constraints')
+        if constraints_el is not None:
+            for rule_el in constraints_el.findall('rule'):
+                expression_els = [el for el in rule_el if el.tag in CONSTRAINT_OPERATORS]
+                if expression_els:
+                    try:
+                        fm.constraints.append(self.parse_constraint(expression_els[0]))
+                    except ValueError as error:
+                        rule_text = " ".join(et.tostring(rule_el, encoding="unicode").split())
+                        raise ValueError("Invalid constraint {0}: {1}".format(rule_text, error)) from None
+
         return fm
 
     def recurse_features(self, xml_feature, parent):
@@ -39,12 +69,32 @@ class FeatureModelParser:
         feature.mandatory = bool(xml_feature.get("mandatory") == "true")
         if not feature.mandatory:
             feature.notname = "Not" + feature.name
+        # How the feature's children may be selected: "and", "or" or "alt" ("feature" for leaves).
+        feature.group_type = xml_feature.tag
 
         for xml_child in list(xml_feature):
             self.recurse_features(xml_child, parent=feature)
 
         return feature
 
+    def parse_constraint(self, xml_expression):
+        """ Turn a constraint expression into nested tuples, e.g.
+        <imp><var>A</var><not><var>B</var></not></imp> becomes
+        ("imp", ("var", "A"), ("not", ("var", "B"))).
+        Raises ValueError if the expression is malformed.
+        """
+        if xml_expression.tag == "var":
+            if not (xml_expression.text or "").strip():
+                raise ValueError("<var> names no feature")
+            return ("var", xml_expression.text.strip())
+
+        operands = [self.parse_constraint(el) for el in xml_expression if el.tag in CONSTRAINT_OPERATORS]
+        operand_count = CONSTRAINT_OPERATORS[xml_expression.tag]
+        if operand_count is not None and len(operands) != operand_count:
+            raise ValueError("<{0}> has {1} operands rather than {2}".format(
+                xml_expression.tag, len(operands), operand_count))
+        return (xml_expression.tag,) + tuple(operands)
+
 
 
 class ProductConfigParser:
@@ -70,6 +120,67 @@ class ProductConfigParser:
 
         return product_features
 
+    def parse_product(self, product_matrix, product_name):
+        """ As parse_config, for a product loaded into a ProductMatrix.
+        """
+        if product_name not in product_matrix.rows:
+            raise IOError("Product {0} is not configured".format(product_name))
+
+        product_features = product_matrix.features_of(product_name)
+        product_features.append(self.root_feature_name)
+
+        return product_features
+
+
+
+def iter_json_stream_values(stream, chunk_size=JSON_REPORT_CHUNK_SIZE):
+    """ Yield the top-level values of a JSON report read a chunk at a time from
+    a text or binary file-like object, so the whole report is never held in memory.
+    The report may be several concatenated values, as written by the runner's
+    JSON logger, or an array of them, as written when shard reports are merged;
+    the array's items are yielded one by one.
+    Raises ValueError if the report is invalid or cut short.
+    """
+    # The decoder's scanner is called directly, skipping raw_decode's per-value overhead.
+    scan_once = json.JSONDecoder().scan_once
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    at_end = False
+
+    while True:
+        buffer_length = len(buffer)
+        while position < buffer_length:
+            # Skip whitespace, and the brackets and commas of a top-level array.
+            if buffer[position] in JSON_SEPARATORS:
+                position += 1
+                continue
+            try:
+                value, position = scan_once(buffer, position)
+            except (StopIteration, ValueError):
+                if at_end:
+                    raise ValueError("Invalid or incomplete JSON at character {0}".format(position))
+                break
+            yield value
+
+        if at_end and position >= buffer_length:
+            return
+
+        # Read more, growing the reads so that a large value isn't decoded over and over.
+        chunk = stream.read(max(chunk_size, len(buffer) - position))
+        if isinstance(chunk, bytes):
+            chunk = utf8_decoder.decode(chunk, final=not chunk)
+        at_end = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def get_json_scenario_name(test_name):
+    """ The scenario name of a JSON "test" event, whose name is prefixed with
+    the feature's, e.g. "Add todo to list: Add one-word todo".
+    """
+    feature_name, separator, scenario_name = test_name.partition(": ")
+    return scenario_name if separator else test_name
 
 
 class TestResultsParser:
@@ -100,7 +211,141 @@ class TestResultsParser:
         return results
 
 
-    def get_gherkin_piece_test_statuses_for_dir(self, reports_dir):
+    def get_gherkin_piece_test_statuses_for_product_from_stream(self, stream):
+        """ As get_gherkin_piece_test_statuses_for_product, but reading the report
+        incrementally from a binary file-like object, such as a report being
+        decompressed from the report archive. Testcases are discarded once read.
+        """
+        results = {}
+        depth = 0
+        in_acceptance_suite = False
+        acceptance_suite_seen = False
+
+        for event, element in et.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 2 and element.tag == "testsuite" and not acceptance_suite_seen:
+                    in_acceptance_suite = True
+                    acceptance_suite_seen = True
+                continue
+
+            if depth == 3 and in_acceptance_suite:
+                test_status = TestState.passed
+                if element.find("failure") is not None:
+                    test_status = TestState.failed
+                results[element.get("feature")] = test_status
+                element.clear()
+            elif depth == 2:
+                in_acceptance_suite = False
+                element.clear()
+            depth -= 1
+
+        return results
+
+
+    def get_test_results_for_product_from_json_stream(self, stream):
+        """ Read a product's scenario results and durations from the runner's
+        JSON report as it is streamed in.
+        Like the XML report's, only the first (acceptance) suite's tests are read.
+        Returns ({scenario: TestState}, {scenario: seconds}).
+        """
+        results = {}
+        durations = {}
+        acceptance_suite = None
+
+        for event in iter_json_stream_values(stream):
+            if not isinstance(event, dict):
+                continue
+            event_type = event.get("event")
+            if event_type == "suiteStart" and acceptance_suite is None:
+                acceptance_suite = event.get("suite")
+            if event_type != "test":
+                continue
+            if acceptance_suite is None:
+                acceptance_suite = event.get("suite")
+            elif event.get("suite") != acceptance_suite:
+                continue
+
+            scenario_name = get_json_scenario_name(event["test"])
+            test_status = TestState.passed
+            if event.get("status") in JSON_FAILED_STATUSES:
+                test_status = TestState.failed
+            results[scenario_name] = test_status
+            duration = event.get("time")
+            if duration is not None:
+                durations[scenario_name] = float(duration)
+
+        return results, durations
+
+
+    def get_report_path(self, reports_dir, product_name, results_format="auto"):
+        """ The report to read a product's results from: its XML or JSON report,
+        or with "auto" the JSON one, which is faster to read, if there is one.
+        Rerun results are appended to the JSON report, so it is as up to date as
+        the XML one whenever it exists. None if the product has no report.
+        """
+        if results_format not in RESULTS_FORMATS:
+            raise ValueError("Unknown results format: {0}".format(results_format))
+
+        xml_path = path.join(reports_dir, "report" + product_name + ".xml")
+        json_path = path.join(reports_dir, "report" + product_name + ".json")
+        if results_format == "xml":
+            report_paths = [xml_path]
+        elif results_format == "json":
+            report_paths = [json_path]
+        else:
+            report_paths = [json_path, xml_path]
+
+        for report_path in report_paths:
+            if path.exists(report_path):
+                return report_path
+        return None
+
+
+    def get_test_results_for_product(self, reports_dir, product_name, results_format="auto"):
+        """ A product's scenario results and durations from its last test run,
+        read from the report chosen by get_report_path. If "auto" picks a JSON
+        report that was cut short, the XML report is read instead.
+        Returns ({scenario: TestState}, {scenario: seconds}).
+        """
+        report_path = self.get_report_path(reports_dir, product_name, results_format)
+        if report_path is None:
+            return {}, {}
+
+        if report_path.endswith(".json"):
+            try:
+                with open(report_path, "r") as report_file:
+                    return self.get_test_results_for_product_from_json_stream(report_file)
+            except ValueError:
+                report_path = path.join(reports_dir, "report" + product_name + ".xml")
+                if results_format == "json" or not path.exists(report_path):
+                    raise
+
+        with open(report_path, "rb") as report_file:
+            return self.get_test_results_for_product_from_xml_stream(report_file)
+
+
+    def get_test_results_for_product_from_xml_stream(self, stream):
+        """ As get_test_results_for_product_from_json_stream, for the XML report.
+        """
+        results = {}
+        durations = {}
+        acceptance_suite = et.parse(stream).find('testsuite')
+
+        if acceptance_suite is not None:
+            for testcase in acceptance_suite:
+                scenario_name = testcase.get("feature")
+                test_status = TestState.passed
+                if testcase.find("failure") is not None:
+                    test_status = TestState.failed
+                results[scenario_name] = test_status
+                if testcase.get("time") is not None:
+                    durations[scenario_name] = float(testcase.get("time"))
+
+        return results, durations
+
+
+    def get_gherkin_piece_test_statuses_for_dir(self, reports_dir, results_format="auto"):
         """ For previously produced test reports for all products in the product
         line, parse through the results. For each scenario that has been run for
         all of the products, check whether it passed or failed.
@@ -111,10 +356,12 @@ class TestResultsParser:
         """
         pl_test_results = {}
 
-        xml_files = [file for file in listdir(reports_dir) if file.endswith(".xml")]
-        for test_results_file in xml_files:
-            file_path = path.join(reports_dir, test_results_file)
-            results_for_product = self.get_gherkin_piece_test_statuses_for_product_from_file(file_path)
+        report_names = [path.splitext(file) for file in listdir(reports_dir) if file.startswith("report")]
+        product_names = set(name[len("report"):] for name, extension in report_names
+                            if extension in (".xml", ".json"))
+        for product_name in sorted(product_names):
+            results_for_product, durations = self.get_test_results_for_product(reports_dir, product_name,
+                                                                               results_format)
 
             for scenario_name in results_for_product:
                 if scenario_name not in pl_test_results:
@@ -0,0 +1,189 @@
+""" Provides ProductMatrix, the configured features of every product in the
+product line held as a products x features bitmap, and loaders for the
+product configuration formats found in a product line's configs folder:
+
+- `<Product>.config`: one product per file, one feature name per line.
+- `<Product>.xml`: a FeatureIDE configuration, one product per file.
+- `*.csv`: a matrix with a header row of `product,<feature>,<feature>,...`
+  and one row per product, with 1 for each selected feature and 0 or blank otherwise.
+- `*.matrix`: the same matrix in a compact binary form (see write_binary_matrix),
+  for product sets too large for one file per product.
+"""
+import csv
+import struct
+import xml.etree.ElementTree as et
+from os import listdir, path
+
+
+BINARY_MAGIC = b"APLETPM1"
+# Feature count, product count, and the byte length of the names that follow.
+BINARY_HEADER = struct.Struct("<III")
+
+
+class ProductMatrix:
+    """ Products x features bitmap. Each product's row is an int with bit i set
+    when it has the i-th feature in self.features.
+    """
+
+    def __init__(self, features=()):
+        self.features = []
+        self.feature_bits = {}
+        self.products = []
+        self.rows = {}
+        for feature_name in features:
+            self.feature_bit(feature_name)
+
+    def feature_bit(self, feature_name):
+        if feature_name not in self.feature_bits:
+            self.feature_bits[feature_name] = len(self.features)
+            self.features.append(feature_name)
+        return self.feature_bits[feature_name]
+
+    def add_row(self, product_name, row):
+        if product_name in self.rows:
+            raise ValueError("Product {0} is configured more than once".format(product_name))
+        self.products.append(product_name)
+        self.rows[product_name] = row
+
+    def add_product(self, product_name, feature_names):
+        row = 0
+        for feature_name in feature_names:
+            if feature_name:
+                row |= 1 << self.feature_bit(feature_name)
+        self.add_row(product_name, row)
+
+    def add_matrix(self, matrix):
+        """ Add all the products of another matrix, whose features may be in a different order.
+        """
+        if not self.features:
+            for feature_name in matrix.features:
+                self.feature_bit(feature_name)
+        if self.features[:len(matrix.features)] == matrix.features:
+            for product_name in matrix.products:
+                self.add_row(product_name, matrix.rows[product_name])
+        else:
+            for product_name in matrix.products:
+                self.add_product(product_name, matrix.features_of(product_name))
+
+    def features_of(self, product_name):
+        """ The product's configured features, in feature order.
+        """
+        row = self.rows[product_name]
+        feature_names = []
+        while row:
+            lowest_bit = row & -row
+            feature_names.append(self.features[lowest_bit.bit_length() - 1])
+            row ^= lowest_bit
+        return feature_names
+
+    def has_feature(self, product_name, feature_name):
+        bit = self.feature_bits.get(feature_name)
+        return bit is not None and bool(self.rows[product_name] >> bit & 1)
+
+    def config_text(self, product_name):
+        """ The product's configuration in the one-feature-per-line .config format.
+        """
+        return "".join(feature_name + "\n" for feature_name in self.features_of(product_name))
+
+
+def read_config_file(config_path):
+    with open(config_path, "r") as config_file:
+        return [line.strip() for line in config_file]
+
+
+def read_featureide_xml(config_path):
+    """ The selected features of a FeatureIDE XML configuration, whether they
+    were selected by hand or automatically.
+    """
+    configuration_el = et.parse(config_path).getroot()
+    return [feature_el.get("name") for feature_el in configuration_el.iter("feature")
+            if "selected" in (feature_el.get("manual"), feature_el.get("automatic"))]
+
+
+def read_csv_matrix(matrix_path):
+    with open(matrix_path, "r", newline="") as matrix_file:
+        reader = csv.reader(matrix_file)
+        header = next(reader, None)
+        if not header:
+            return ProductMatrix()
+
+        matrix = ProductMatrix(name.strip() for name in header[1:])
+        for row_values in reader:
+            if not row_values:
+                continue
+            row = 0
+            for bit, value in enumerate(row_values[1:]):
+                if value.strip() not in ("", "0"):
+                    row |= 1 << bit
+            matrix.add_row(row_values[0].strip(), row)
+    return matrix
+
+
+def read_binary_matrix(matrix_path):
+    """ Read a matrix written by write_binary_matrix, in a single read.
+    """
+    with open(matrix_path, "rb") as matrix_file:
+        data = matrix_file.read()
+
+    if not data.startswith(BINARY_MAGIC):
+        raise ValueError("{0} is not a product matrix file".format(matrix_path))
+    offset = len(BINARY_MAGIC)
+    feature_count, product_count, names_length = BINARY_HEADER.unpack_from(data, offset)
+    offset += BINARY_HEADER.size
+
+    names = data[offset:offset + names_length].decode("utf-8").split("\n") if names_length else []
+    offset += names_length
+    if len(names) != feature_count + product_count:
+        raise ValueError("{0} is corrupt".format(matrix_path))
+
+    matrix = ProductMatrix(names[:feature_count])
+    row_size = (feature_count + 7) // 8
+    if len(data) != offset + product_count * row_size:
+        raise ValueError("{0} is truncated".format(matrix_path))
+    for product_name in names[feature_count:]:
+        matrix.add_row(product_name, int.from_bytes(data[offset:offset + row_size], "little"))
+        offset += row_size
+    return matrix
+
+
+def write_csv_matrix(matrix, matrix_path):
+    with open(matrix_path, "w", newline="") as matrix_file:
+        writer = csv.writer(matrix_file)
+        writer.writerow(["product"] + matrix.features)
+        for product_name in matrix.products:
+            row = matrix.rows[product_name]
+            writer.writerow([product_name] + [row >> bit & 1 for bit in range(len(matrix.features))])
+
+
+def write_binary_matrix(matrix, matrix_path):
+    """ Write the matrix as: the magic bytes, a header of feature count, product
+    count and names length, the feature then product names separated by
+    newlines, then a row of ceil(features / 8) little-endian bytes per product.
+    """
+    names = "\n".join(matrix.features + matrix.products).encode("utf-8")
+    row_size = (len(matrix.features) + 7) // 8
+    with open(matrix_path, "wb") as matrix_file:
+        matrix_file.write(BINARY_MAGIC)
+        matrix_file.write(BINARY_HEADER.pack(len(matrix.features), len(matrix.products), len(names)))
+        matrix_file.write(names)
+        for product_name in matrix.products:
+            matrix_file.write(matrix.rows[product_name].to_bytes(row_size, "little"))
+
+
+def load_product_matrix(configs_path):
+    """ Load every product configured in the configs folder, in any of the
+    supported formats, into a single matrix. Other files are ignored.
+    """
+    matrix = ProductMatrix()
+    for filename in sorted(listdir(configs_path)):
+        file_path = path.join(configs_path, filename)
+        product_name, extension = path.splitext(filename)
+        if extension == ".config":
+            matrix.add_product(product_name, read_config_file(file_path))
+        elif extension == ".xml":
+            matrix.add_product(product_name, read_featureide_xml(file_path))
+        elif extension == ".csv":
+            matrix.add_matrix(read_csv_matrix(file_path))
+        elif extension == ".matrix":
+            matrix.add_matrix(read_binary_matrix(file_path))
+    return matrix
@@ -0,0 +1,133 @@
+""" Provides TestRunProgress for following test runner output as it is written,
+recording scenario outcomes as they happen and stopping early on failures.
+"""
+import re
+import threading
+import time
+import xml.etree.ElementTree as et
+from datetime import timedelta
+
+from aplet.pltools.fm import TestState
+
+
+# Codeception's per-scenario result lines, e.g. "✔ Add todo to list: Add one-word todo (0.18s)".
+# Older versions use "+" and "x" instead of the check and cross marks, and "E" for errors. The
+# runner's stderr is mixed in, so the scenario's time is required: without it, any warning or
+# stack trace line starting with "x " or "E " would count as a failed scenario.
+DEFAULT_PROGRESS_PATTERNS = {
+    "passed": r"^\s*(?:✔|\+)\s+(?:(?P<feature>[^:]+): )?(?P<scenario>.+?)\s+\((?P<time>\d+(?:\.\d+)?)s\)\s*$",
+    "failed": r"^\s*(?:✖|x|E)\s+(?:(?P<feature>[^:]+): )?(?P<scenario>.+?)\s+\((?P<time>\d+(?:\.\d+)?)s\)\s*$",
+}
+
+
+class TestRunProgress:
+    """ Follows the output of one or more test runner processes for a product.
+
+    Each line is matched against the passed/failed patterns (regular expressions
+    with a `scenario` group and optional `feature` and `time` groups). Matched
+    outcomes are recorded, and a progress line with an ETA is echoed after each.
+    Once fail_fast scenarios have failed, the processes are terminated.
+    """
+
+    def __init__(self, label, total, fail_fast=None, patterns=None, echo=print):
+        self.label = label
+        self.total = total
+        self.fail_fast = fail_fast
+        self.patterns = {TestState[status]: re.compile(pattern)
+                         for status, pattern in (patterns or DEFAULT_PROGRESS_PATTERNS).items()}
+        self.echo = echo
+        self.outcomes = []
+        self.aborted = False
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.processes = []
+
+    @property
+    def passed(self):
+        return sum(1 for outcome in self.outcomes if outcome["status"] is TestState.passed)
+
+    @property
+    def failed(self):
+        return sum(1 for outcome in self.outcomes if outcome["status"] is TestState.failed)
+
+    def match_line(self, line):
+        """ The outcome reported by a line of runner output, if any.
+        """
+        for status, pattern in self.patterns.items():
+            match = pattern.match(line)
+            if match:
+                groups = match.groupdict()
+                return {
+                    "status": status,
+                    "feature": groups.get("feature"),
+                    "scenario": groups["scenario"],
+                    "time": float(groups["time"]) if groups.get("time") else None,
+                }
+        return None
+
+    def record(self, outcome):
+        with self.lock:
+            self.outcomes.append(outcome)
+            self.echo(self.status_line())
+            if self.fail_fast and self.failed >= self.fail_fast and not self.aborted:
+                self.aborted = True
+                self.echo("{0}: {1} scenarios failed, stopping the run".format(self.label, self.failed))
+                for process in self.processes:
+                    if process.poll() is None:
+                        process.terminate()
+
+    def status_line(self):
+        done = len(self.outcomes)
+        remaining = max(self.total - done, 0)
+        eta = "?"
+        if done:
+            elapsed = time.monotonic() - self.started
+            eta = str(timedelta(seconds=round(elapsed / done * remaining)))
+        return "{0}: {1} passed, {2} failed, {3} remaining, ETA {4}".format(
+            self.label, self.passed, self.failed, remaining, eta)
+
+    def follow(self, process_index):
+        """ Read a process's output line by line until it exits.
+        The process must have been started with stdout as a text pipe.
+        """
+        process = self.processes[process_index]
+        for line in process.stdout:
+            self.echo(line.rstrip("\n"))
+            outcome = self.match_line(line)
+            if outcome is not None:
+                outcome["process"] = process_index
+                self.record(outcome)
+        process.wait()
+
+    def run(self, processes):
+        """ Follow all the given processes, returning once they have all exited.
+        """
+        self.processes = list(processes)
+        threads = [threading.Thread(target=self.follow, args=(process_index,))
+                   for process_index in range(len(self.processes))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def junit_xml(self, process_index=0):
+        """ A JUnit report of the outcomes recorded so far from one of the processes,
+        for when the runner was stopped before writing its own.
+        """
+        outcomes = [outcome for outcome in self.outcomes if outcome.get("process", 0) == process_index]
+        failures = sum(1 for outcome in outcomes if outcome["status"] is TestState.failed)
+
+        testsuites = et.Element("testsuites")
+        suite = et.SubElement(testsuites, "testsuite", name="acceptance", tests=str(len(outcomes)),
+                              failures=str(failures))
+        for outcome in outcomes:
+            name = outcome["scenario"]
+            if outcome["feature"]:
+                name = outcome["feature"] + ": " + name
+            testcase = et.SubElement(suite, "testcase", name=name, feature=outcome["scenario"])
+            if outcome["time"] is not None:
+                testcase.set("time", str(outcome["time"]))
+            if outcome["status"] is TestState.failed:
+                et.SubElement(testcase, "failure")
+
+        return et.tostring(testsuites, encoding="unicode")
@@ -0,0 +1,93 @@
+""" Provides RetryHistory and report merging for re-running only the failed
+scenarios of a product.
+"""
+import json
+import xml.etree.ElementTree as et
+from os import path
+
+from aplet.pltools.fm import TestState
+
+
+class RetryHistory:
+    """ The outcomes of every attempt at a product's scenarios that have been retried,
+    kept so that flaky scenarios stay visible after a successful retry.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.attempts = {}
+        if path.exists(filepath):
+            with open(filepath, "r") as history_file:
+                self.attempts = json.load(history_file)
+
+    def record_failure(self, scenario_name):
+        """ Record the failure that triggered a retry, unless it is already the
+        latest attempt on record.
+        """
+        attempts = self.attempts.setdefault(scenario_name, [])
+        if not attempts or attempts[-1] != TestState.failed.name:
+            attempts.append(TestState.failed.name)
+
+    def record_attempt(self, scenario_name, test_status):
+        self.attempts.setdefault(scenario_name, []).append(test_status.name)
+
+    def retries(self, scenario_name):
+        return max(len(self.attempts.get(scenario_name, [])) - 1, 0)
+
+    def is_flaky(self, scenario_name):
+        """ A scenario is flaky when it has both failed and passed over its attempts.
+        """
+        outcomes = set(self.attempts.get(scenario_name, []))
+        return TestState.failed.name in outcomes and TestState.passed.name in outcomes
+
+    def flaky_scenarios(self):
+        return sorted(name for name in self.attempts if self.is_flaky(name))
+
+    def save(self):
+        with open(self.filepath, "w") as history_file:
+            json.dump(self.attempts, history_file, indent=2, sort_keys=True)
+
+
+def testcase_status(testcase):
+    if testcase.find("failure") is not None:
+        return TestState.failed
+    return TestState.passed
+
+
+def merge_rerun_report(report_xml, rerun_xml, retry_history):
+    """ Merge the testcases of a rerun report into a product's full report.
+
+    Testcases of the full report are replaced in place by their rerun
+    counterparts, which are annotated with the retry count and flakiness from
+    the retry history. The suite's test and failure counts are recomputed.
+    Returns the merged report as a string.
+    """
+    report_tree = et.fromstring(report_xml)
+    rerun_tree = et.fromstring(rerun_xml)
+    suite = report_tree.find("testsuite")
+    rerun_suite = rerun_tree.find("testsuite")
+
+    if suite is None or rerun_suite is None:
+        return report_xml
+
+    rerun_testcases = {testcase.get("feature"): testcase for testcase in rerun_suite}
+
+    for index, testcase in enumerate(list(suite)):
+        scenario_name = testcase.get("feature")
+        if scenario_name not in rerun_testcases:
+            continue
+
+        rerun_testcase = rerun_testcases.pop(scenario_name)
+        retry_history.record_attempt(scenario_name, testcase_status(rerun_testcase))
+        rerun_testcase.set("retries", str(retry_history.retries(scenario_name)))
+        if retry_history.is_flaky(scenario_name):
+            rerun_testcase.set("flaky", "true")
+
+        suite.remove(testcase)
+        suite.insert(index, rerun_testcase)
+
+    testcases = list(suite)
+    suite.set("tests", str(len(testcases)))
+    suite.set("failures", str(sum(1 for testcase in testcases if testcase.find("failure") is not None)))
+
+    return et.tostring(report_tree, encoding="unicode")
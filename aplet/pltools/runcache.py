@@ -0,0 +1,153 @@
+""" Provides RunCache, which keeps the reports of product runs under a
+fingerprint of everything that went into the run, so that a product whose
+inputs haven't changed since doesn't need running again.
+
+A fingerprint is the SHA-256 of the run's inputs as canonical JSON. Folders
+such as the app are part of the inputs as a digest of their files, from
+either the files' contents or, more cheaply, their sizes and modification
+times. Entries are evicted least recently used first once the cache grows
+beyond its size limit.
+"""
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from os import listdir, makedirs, path
+
+
+CHUNK_SIZE = 1024 * 1024
+
+# The ways a folder's files can be digested.
+FOLDER_DIGEST_MODES = ("content", "mtime")
+
+
+def fingerprint(inputs):
+    """ The fingerprint of a run's inputs, given as a dict of JSON values.
+    """
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as source_file:
+        for chunk in iter(lambda: source_file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def folder_digest(folder, mode="content", excluded=()):
+    """ A digest of the files in a folder and its subfolders, skipping any file
+    or folder whose name matches one of the excluded glob patterns.
+    Symlinked folders aren't followed.
+    """
+    if mode not in FOLDER_DIGEST_MODES:
+        raise ValueError("Folder digest mode must be one of: " + ", ".join(FOLDER_DIGEST_MODES))
+
+    def is_excluded(name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in excluded)
+
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = sorted(dirname for dirname in dirnames if not is_excluded(dirname))
+        for filename in sorted(filenames):
+            if is_excluded(filename):
+                continue
+            file_path = path.join(dirpath, filename)
+            digest.update(path.relpath(file_path, folder).encode("utf-8") + b"\0")
+            if mode == "mtime":
+                stat = os.stat(file_path)
+                digest.update("{0} {1}\n".format(stat.st_size, stat.st_mtime_ns).encode("ascii"))
+            else:
+                digest.update(file_digest(file_path).encode("ascii") + b"\n")
+    return digest.hexdigest()
+
+
+class RunCache:
+    """ Reports of previous product runs, kept under cache_dir by fingerprint.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not path.exists(cache_dir):
+            makedirs(cache_dir)
+
+    def entry_dir(self, run_fingerprint):
+        return path.join(self.cache_dir, run_fingerprint[:2], run_fingerprint)
+
+    def lookup(self, run_fingerprint):
+        """ The folder holding the reports stored for a fingerprint, as the test
+        runner names them, or None if there are none.
+        Looking an entry up makes it the most recently used.
+        """
+        entry_dir = self.entry_dir(run_fingerprint)
+        if not path.exists(entry_dir):
+            return None
+        os.utime(entry_dir)
+        return entry_dir
+
+    def add_reports(self, run_fingerprint, product_name, report_paths):
+        """ Store a run's reports ({report type: path}) under its fingerprint,
+        replacing any stored before. Runs that left neither an XML nor a JSON
+        report aren't stored.
+        """
+        if "xml" not in report_paths and "json" not in report_paths:
+            return
+        entry_dir = self.entry_dir(run_fingerprint)
+        if not path.exists(path.dirname(entry_dir)):
+            makedirs(path.dirname(entry_dir))
+        # Written aside and moved into place, so an interrupted run never leaves a partial entry.
+        staging_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        for report_type, report_path in report_paths.items():
+            shutil.copyfile(report_path, path.join(staging_dir, "report." + report_type))
+        with open(path.join(staging_dir, "entry.json"), "w") as entry_file:
+            json.dump({"product": product_name, "created": time.time()}, entry_file)
+        if path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+        try:
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            # Another run stored the same fingerprint in the meantime.
+            shutil.rmtree(staging_dir)
+
+    def entries(self):
+        """ The folders of all stored entries, least recently used first.
+        """
+        entry_dirs = []
+        for prefix in listdir(self.cache_dir):
+            prefix_dir = path.join(self.cache_dir, prefix)
+            if len(prefix) != 2 or not path.isdir(prefix_dir):
+                continue
+            entry_dirs.extend(path.join(prefix_dir, entry_name) for entry_name in listdir(prefix_dir))
+        return sorted(entry_dirs, key=path.getmtime)
+
+    def entry_size(self, entry_dir):
+        return sum(path.getsize(path.join(entry_dir, filename)) for filename in listdir(entry_dir))
+
+    def size(self):
+        return sum(self.entry_size(entry_dir) for entry_dir in self.entries())
+
+    def evict(self, max_bytes):
+        """ Remove the least recently used entries until the cache fits in max_bytes.
+        Returns the number of entries removed.
+        """
+        entry_sizes = [(entry_dir, self.entry_size(entry_dir)) for entry_dir in self.entries()]
+        total = sum(size for _, size in entry_sizes)
+        removed = 0
+        for entry_dir, size in entry_sizes:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry_dir)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """ Remove every entry. Returns the number removed.
+        """
+        entry_dirs = self.entries()
+        for entry_dir in entry_dirs:
+            shutil.rmtree(entry_dir)
+        return len(entry_dirs)
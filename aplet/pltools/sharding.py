@@ -0,0 +1,170 @@
+""" Provides splitting of a product's scenarios into shards, isolated shard
+workspaces and the merging of shard reports back into one report set.
+"""
+import heapq
+import json
+import re
+import shutil
+import xml.etree.ElementTree as et
+from os import listdir, makedirs, path, symlink
+
+
+# Top-level entries of a project folder that are never shared with shard workspaces.
+WORKSPACE_EXCLUDED = (".aplet", "testreports", "docs")
+
+# Top-level entries that are copied into, rather than linked from, a shard workspace,
+# so that each shard writes its own output.
+WORKSPACE_COPIED = ("tests",)
+
+JUNIT_SUITE_COUNTERS = ("tests", "assertions", "errors", "failures", "skipped")
+
+
+def select_scenarios(scenarios_by_tag, feature_toggles):
+    """ The scenarios a test runner would pick up for the given feature toggles,
+    in a stable order and without duplicates.
+    """
+    selected = []
+    seen = set()
+    for feature_toggle in feature_toggles:
+        for scenario_name in scenarios_by_tag.get(feature_toggle, []):
+            if scenario_name not in seen:
+                seen.add(scenario_name)
+                selected.append(scenario_name)
+
+    return selected
+
+
+def partition_scenarios(scenario_names, durations, shard_count):
+    """ Split scenarios into at most shard_count shards of similar total duration.
+
+    Uses the longest-processing-time-first heuristic: scenarios are placed,
+    longest first, on the shard with the smallest total so far. Scenarios with
+    no recorded duration are assumed to take the mean recorded duration.
+    """
+    known_durations = [durations[name] for name in scenario_names if name in durations]
+    default_duration = sum(known_durations) / len(known_durations) if known_durations else 1.0
+
+    def duration(name):
+        return durations.get(name, default_duration)
+
+    shards = [(0.0, index, []) for index in range(shard_count)]
+    for scenario_name in sorted(scenario_names, key=lambda name: (-duration(name), name)):
+        total, index, shard = heapq.heappop(shards)
+        shard.append(scenario_name)
+        heapq.heappush(shards, (total + duration(scenario_name), index, shard))
+
+    return [shard for _, _, shard in sorted(shards, key=lambda entry: entry[1]) if shard]
+
+
+def create_shard_workspace(projectfolder, workspace_dir):
+    """ Create a fresh workspace for a shard: the project's test folder is copied
+    (without previous output) and everything else is symlinked.
+    """
+    if path.exists(workspace_dir):
+        shutil.rmtree(workspace_dir)
+    makedirs(workspace_dir)
+
+    for entry in listdir(projectfolder):
+        if entry in WORKSPACE_EXCLUDED:
+            continue
+        entry_path = path.abspath(path.join(projectfolder, entry))
+        if entry in WORKSPACE_COPIED and path.isdir(entry_path):
+            shutil.copytree(entry_path, path.join(workspace_dir, entry), ignore=shutil.ignore_patterns("_output"))
+        else:
+            symlink(entry_path, path.join(workspace_dir, entry))
+
+
+def merge_junit_reports(xml_reports):
+    """ Merge JUnit XML reports, combining the testcases of suites with the same name.
+    """
+    merged_tree = et.fromstring(xml_reports[0])
+    merged_suites = {suite.get("name"): suite for suite in merged_tree.findall("testsuite")}
+
+    for xml_report in xml_reports[1:]:
+        for suite in et.fromstring(xml_report).findall("testsuite"):
+            merged_suite = merged_suites.get(suite.get("name"))
+            if merged_suite is None:
+                merged_tree.append(suite)
+                merged_suites[suite.get("name")] = suite
+                continue
+
+            merged_suite.extend(list(suite))
+            for counter in JUNIT_SUITE_COUNTERS:
+                if suite.get(counter) is not None:
+                    merged_suite.set(counter, str(int(merged_suite.get(counter, "0")) + int(suite.get(counter))))
+            if suite.get("time") is not None:
+                merged_suite.set("time", str(float(merged_suite.get("time", "0")) + float(suite.get("time"))))
+
+    return et.tostring(merged_tree, encoding="unicode")
+
+
+def iter_json_values(text):
+    """ Yield the top-level values of a JSON document that may consist of
+    several concatenated values, as written by the runner's JSON logger.
+    """
+    decoder = json.JSONDecoder()
+    position = 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if position >= len(text):
+            return
+        value, position = decoder.raw_decode(text, position)
+        yield value
+
+
+def merge_json_reports(json_reports):
+    """ Merge JSON reports, keeping the events of every report in shard order.
+    """
+    values = [value for json_report in json_reports for value in iter_json_values(json_report)]
+
+    if values and all(isinstance(value, list) for value in values):
+        return json.dumps([event for value in values for event in value])
+
+    return "".join(json.dumps(value) for value in values)
+
+
+def merge_html_reports(html_reports):
+    """ Merge HTML reports by appending the body of every later report to the first.
+    """
+    body_pattern = re.compile(r"<body[^>]*>(.*)</body>", re.DOTALL | re.IGNORECASE)
+    merged_html = html_reports[0]
+
+    extra_bodies = []
+    for html_report in html_reports[1:]:
+        match = body_pattern.search(html_report)
+        extra_bodies.append(match.group(1) if match else html_report)
+
+    closing_body = merged_html.lower().rfind("</body>")
+    if closing_body == -1:
+        return merged_html + "".join(extra_bodies)
+
+    return merged_html[:closing_body] + "".join(extra_bodies) + merged_html[closing_body:]
+
+
+def merge_shard_reports(shard_output_dirs, merged_output_dir):
+    """ Merge the report.xml, report.json and report.html of every shard's output
+    folder into a single report set in merged_output_dir, which is emptied
+    first so that no report of an earlier run is left among them.
+    """
+    mergers = {
+        "report.xml": merge_junit_reports,
+        "report.json": merge_json_reports,
+        "report.html": merge_html_reports,
+    }
+
+    if path.exists(merged_output_dir):
+        shutil.rmtree(merged_output_dir)
+    makedirs(merged_output_dir)
+
+    for report_name, merge in mergers.items():
+        reports = []
+        for output_dir in shard_output_dirs:
+            report_path = path.join(output_dir, report_name)
+            if path.exists(report_path):
+                with open(report_path, "r") as report_file:
+                    reports.append(report_file.read())
+
+        if reports:
+            with open(path.join(merged_output_dir, report_name), "w") as merged_file:
+                merged_file.write(merge(reports))
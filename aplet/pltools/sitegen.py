@@ -0,0 +1,141 @@
+""" Provides SiteGenerator, which writes the aplet docs site straight from the
+in-memory feature models and test results, as an alternative to building the
+lektor templates. It never touches the project's doc_templates folder.
+
+The site is an index page with the product line's feature model, its products
+and the product map, and a page per product under products/<name>/. Product
+pages are made by docspipeline, up to `jobs` at once in worker processes, each
+writing its pages with a PageWriter of its own.
+"""
+import html
+import shutil
+from os import cpu_count, makedirs, path
+from string import Template
+
+import graphviz as gv
+import pkg_resources
+
+from aplet.pltools import tracing
+from aplet.pltools.ftrenderer import FeatureTreeRenderer
+from aplet.pltools.mapbuilder import ProductMapRenderer
+
+
+def load_templates():
+    """ The site's page templates by name, as string.Templates.
+    """
+    templates = {}
+    for template_name in ("layout", "index", "product"):
+        template_path = pkg_resources.resource_filename("aplet", "templates/sitegen/{0}.html".format(template_name))
+        with open(template_path, "r") as template_file:
+            templates[template_name] = Template(template_file.read())
+    return templates
+
+
+class PageWriter:
+    """ Writes the pages of the docs site in docs_dir as they are asked for.
+    """
+
+    def __init__(self, docs_dir, project_name):
+        self.docs_dir = docs_dir
+        self.project_name = project_name
+        self.templates = load_templates()
+        # Set if dot couldn't be run, in which case the pages are written without their diagrams.
+        self.missing_dot = False
+
+    def render_page(self, title, root, body):
+        return self.templates["layout"].substitute(
+            title=html.escape(title), project_name=html.escape(self.project_name), root=root, body=body)
+
+    def build_graph(self, root_feature):
+        return FeatureTreeRenderer().build_graphviz_graph(root_feature)
+
+    def write_feature_model_svg(self, graph, page_dir):
+        """ Render a feature model graph as feature_model.svg in page_dir.
+        Returns the HTML showing it, which is empty if dot couldn't be run.
+        """
+        try:
+            svg = graph.pipe(format="svg")
+        except gv.ExecutableNotFound:
+            self.missing_dot = True
+            return ""
+
+        with open(path.join(page_dir, "feature_model.svg"), "wb") as svg_file:
+            svg_file.write(svg)
+        return '<img class="feature-model" src="feature_model.svg" alt="Feature model">'
+
+    def write_page(self, page_dir, page_html):
+        with open(path.join(page_dir, "index.html"), "w") as page_file:
+            page_file.write(page_html)
+
+    def write_product_page(self, product_name, root_feature, test_status, test_report_path=None):
+        """ Write the page of a product, with its trimmed feature model and its
+        runner's HTML test report, if there is one.
+        Returns whether the page has its feature model diagram.
+        """
+        with tracing.span("write_product_page", product=product_name):
+            page_dir = path.join(self.docs_dir, "products", product_name)
+            if not path.exists(page_dir):
+                makedirs(page_dir)
+
+            test_report = ""
+            if test_report_path is not None:
+                report_name = path.basename(test_report_path)
+                shutil.copyfile(test_report_path, path.join(page_dir, report_name))
+                test_report = '<p><a href="{0}">Test report</a></p>'.format(html.escape(report_name))
+
+            body = self.templates["product"].substitute(
+                product_name=html.escape(product_name),
+                test_status=test_status.name,
+                test_report=test_report,
+                feature_model=self.write_feature_model_svg(self.build_graph(root_feature), page_dir))
+            self.write_page(page_dir, self.render_page(product_name, "../../", body))
+        return not self.missing_dot
+
+    def write_index_page(self, graph, test_status, productmap, product_statuses):
+        with tracing.span("write_index_page"):
+            product_links = "\n".join(
+                '<li><a href="products/{0}/index.html">{0}</a> <span class="status-{1}">{1}</span></li>'.format(
+                    html.escape(product_name), product_status.name)
+                for product_name, product_status in sorted(product_statuses.items()))
+
+            body = self.templates["index"].substitute(
+                project_name=html.escape(self.project_name),
+                test_status=test_status.name,
+                feature_model=self.write_feature_model_svg(graph, self.docs_dir),
+                product_links=product_links,
+                productmap=productmap)
+            self.write_page(self.docs_dir, self.render_page(self.project_name, "", body))
+
+
+class SiteGenerator(PageWriter):
+    """ Writes the docs site into docs_dir, its product pages up to `jobs` at
+    once. Use as a context manager, which sets up docs_dir on entering.
+    """
+
+    def __init__(self, docs_dir, project_name, jobs=None):
+        super().__init__(docs_dir, project_name)
+        self.jobs = jobs or cpu_count() or 1
+
+    def __enter__(self):
+        if not path.exists(self.docs_dir):
+            makedirs(self.docs_dir)
+        shutil.copyfile(pkg_resources.resource_filename("aplet", "templates/sitegen/style.css"),
+                        path.join(self.docs_dir, "style.css"))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def page_writer(self):
+        """ A PageWriter for the same site, which unlike the generator itself
+        can be sent to another process.
+        """
+        return PageWriter(self.docs_dir, self.project_name)
+
+    def add_index_page(self, feature_model, product_matrix, product_statuses):
+        """ Write the index page, from the whole product line's feature model,
+        the ProductMatrix of the products and the products' test statuses.
+        """
+        graph = self.build_graph(feature_model.root_feature)
+        productmap = ProductMapRenderer().get_productmap_html_for_matrix(feature_model, product_matrix)
+        self.write_index_page(graph, feature_model.root_feature.test_status, productmap, product_statuses)
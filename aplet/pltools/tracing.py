@@ -0,0 +1,204 @@
+""" Provides span timing of aplet's phases, enabled by the global --profile and
+--trace options.
+
+Code marks a phase with
+
+    with tracing.span("parse_model", product=product_name):
+        ...
+
+which costs nothing while tracing is off. When on, every span is recorded and
+can be written out as Chrome trace-event JSON (viewable in chrome://tracing or
+https://ui.perfetto.dev) or summarised as a table. Phases can also be run
+under cProfile by name; a new phase's name must be added to PHASES.
+"""
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from os import getpid
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# The names of the phases marked with span, which --cprofile accepts.
+PHASES = (
+    "archive_reports", "build_index", "calculate_test_statuses", "coverage", "distributed_jobs",
+    "fingerprint_products", "fixtures", "flip_counts", "lektor_build", "load_index", "load_products",
+    "merge_reports", "parallel_jobs", "parse_gherkin", "parse_model", "parse_report", "plan_product",
+    "product_pages", "productmap", "render_svg", "sed_inplace", "store_reports", "sync_history", "test_runner",
+    "validate_products", "write_index_page", "write_product_page",
+)
+
+
+def get_peak_rss():
+    """ Peak resident set size in bytes of this process and of its finished
+    child processes, such as the test runner.
+    """
+    if resource is None:
+        return 0, 0
+    # ru_maxrss is in kilobytes on Linux but bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+class Tracer:
+    """ Records timed spans while enabled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.rss_samples = []
+        self.profilers = {}
+        self.profiling = False
+        self.thread_ids = {}
+        self.start_time = time.perf_counter()
+
+    def enable(self, profiled_phases=()):
+        self.enabled = True
+        self.start_time = time.perf_counter()
+        self.profilers = {phase: cProfile.Profile() for phase in profiled_phases}
+
+    def enable_in_worker(self, start_time):
+        """ Record spans in a worker process, timed from the start_time of the
+        process that started it, so that they can be sent back and merged.
+        """
+        self.enabled = True
+        self.start_time = start_time
+        self.spans = []
+        self.rss_samples = []
+        self.profilers = {}
+        self.thread_ids = {}
+
+    def take_spans(self):
+        """ The spans recorded since last taken, which are then forgotten.
+        """
+        spans, self.spans = self.spans, []
+        return spans
+
+    def add_worker_spans(self, worker_id, spans):
+        """ Merge spans recorded by a worker process, shown as a thread of their own.
+        """
+        worker_thread_id = self.thread_ids.setdefault(("worker", worker_id), len(self.thread_ids))
+        for recorded_span in spans:
+            recorded_span["thread"] = worker_thread_id
+            self.spans.append(recorded_span)
+
+    def thread_id(self):
+        return self.thread_ids.setdefault(threading.get_ident(), len(self.thread_ids))
+
+    @contextmanager
+    def span(self, name, category="aplet", **args):
+        if not self.enabled:
+            yield
+            return
+
+        # Only one profiler can run at a time, so nested phases are profiled as part of the outer one.
+        profiler = self.profilers.get(name)
+        if profiler is not None and self.profiling:
+            profiler = None
+        if profiler is not None:
+            self.profiling = True
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            if profiler is not None:
+                profiler.disable()
+                self.profiling = False
+            self.spans.append({
+                "name": name,
+                "category": category,
+                "args": args,
+                "start": start - self.start_time,
+                "duration": end - start,
+                "thread": self.thread_id(),
+            })
+            self.rss_samples.append((end - self.start_time, get_peak_rss()))
+
+    def chrome_trace(self):
+        """ The recorded spans as Chrome trace events, with peak RSS as a counter.
+        """
+        pid = getpid()
+        events = []
+        for recorded_span in self.spans:
+            events.append({
+                "name": recorded_span["name"],
+                "cat": recorded_span["category"],
+                "ph": "X",
+                "ts": recorded_span["start"] * 1e6,
+                "dur": recorded_span["duration"] * 1e6,
+                "pid": pid,
+                "tid": recorded_span["thread"],
+                "args": recorded_span["args"],
+            })
+        for timestamp, (self_rss, children_rss) in self.rss_samples:
+            events.append({
+                "name": "peak_rss_mb",
+                "ph": "C",
+                "ts": timestamp * 1e6,
+                "pid": pid,
+                "args": {"aplet": self_rss / 2 ** 20, "children": children_rss / 2 ** 20},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, trace_path):
+        with open(trace_path, "w") as trace_file:
+            json.dump(self.chrome_trace(), trace_file)
+
+    def summary(self):
+        """ Count, total, mean and max seconds of each phase, slowest total first.
+        """
+        totals = {}
+        for recorded_span in self.spans:
+            durations = totals.setdefault(recorded_span["name"], [])
+            durations.append(recorded_span["duration"])
+        rows = [(name, len(durations), sum(durations), sum(durations) / len(durations), max(durations))
+                for name, durations in totals.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def summary_table(self):
+        lines = ["{0:<28} {1:>7} {2:>10} {3:>10} {4:>10}".format("phase", "count", "total s", "mean s", "max s")]
+        for name, count, total, mean, longest in self.summary():
+            lines.append("{0:<28} {1:>7} {2:>10.3f} {3:>10.3f} {4:>10.3f}".format(name, count, total, mean, longest))
+        self_rss, children_rss = get_peak_rss()
+        lines.append("Peak RSS: {0:.1f} MB (aplet), {1:.1f} MB (largest child process)".format(
+            self_rss / 2 ** 20, children_rss / 2 ** 20))
+        return "\n".join(lines)
+
+    def profiled(self, phase):
+        """ Whether a profiled phase ran under its profiler, and so has a profile to report.
+        """
+        return bool(self.profilers[phase].getstats())
+
+    def profile_report(self, phase, limit=20):
+        """ The functions that took the most cumulative time in a profiled phase,
+        which must have run.
+        """
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profilers[phase], stream=stream)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    def dump_profile(self, phase, profile_path):
+        self.profilers[phase].dump_stats(profile_path)
+
+
+TRACER = Tracer()
+
+
+def span(name, category="aplet", **args):
+    """ Time a phase with the global tracer, e.g. `with tracing.span("parse_model"):`.
+    """
+    return TRACER.span(name, category, **args)
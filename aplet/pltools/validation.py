@@ -0,0 +1,324 @@
+""" Provides ConfigurationValidator, which checks product configurations against
+a feature model's tree structure (mandatory features, or and alternative groups)
+and its cross-tree constraints, and counts the model's valid configurations.
+
+Checking a configuration goes through the model's rules one by one, so that
+every rule it breaks can be reported. Counting configurations compiles the
+whole model into a binary decision diagram (BDD), with one variable per feature
+in tree order, and is then linear in the size of the BDD. The BDD is only built
+when first needed, as building it can take a while for models with many
+constraints.
+"""
+from anytree import PreOrderIter
+
+
+class BDD:
+    """ A reduced ordered binary decision diagram manager.
+
+    Nodes are ints: 0 and 1 are the terminals, and every other node is an index
+    into self.nodes of a (level, low, high) triple. Identical triples are shared,
+    so equivalent functions are always the same node.
+    """
+
+    FALSE = 0
+    TRUE = 1
+
+    def __init__(self, variable_count):
+        self.variable_count = variable_count
+        # The terminals sit below the last variable.
+        self.nodes = [(variable_count, None, None), (variable_count, None, None)]
+        self.unique = {}
+        self.ite_cache = {}
+
+    def level(self, node):
+        return self.nodes[node][0]
+
+    def make_node(self, level, low, high):
+        if low == high:
+            return low
+        key = (level, low, high)
+        node = self.unique.get(key)
+        if node is None:
+            node = len(self.nodes)
+            self.nodes.append(key)
+            self.unique[key] = node
+        return node
+
+    def variable(self, level):
+        return self.make_node(level, self.FALSE, self.TRUE)
+
+    def cofactors(self, node, level):
+        node_level, low, high = self.nodes[node]
+        if node_level != level:
+            return node, node
+        return low, high
+
+    def ite_terminal(self, f, g, h):
+        """ The result of ite(f, g, h) if it is known without descending, else None.
+        """
+        if f == self.TRUE:
+            return g
+        if f == self.FALSE:
+            return h
+        if g == h:
+            return g
+        if g == self.TRUE and h == self.FALSE:
+            return f
+        return self.ite_cache.get((f, g, h))
+
+    def ite(self, f, g, h):
+        """ If f then g else h, the operation every other one is built from.
+        The cofactors are worked on from a stack rather than by recursion, which
+        would go a level deeper for every variable.
+        """
+        results = []
+        # (f, g, h, level): the level is None until both cofactors have been pushed,
+        # then the operands' node is made from their results.
+        stack = [(f, g, h, None)]
+        while stack:
+            f, g, h, level = stack.pop()
+            if level is not None:
+                high = results.pop()
+                low = results.pop()
+                result = self.make_node(level, low, high)
+                self.ite_cache[(f, g, h)] = result
+                results.append(result)
+                continue
+
+            result = self.ite_terminal(f, g, h)
+            if result is not None:
+                results.append(result)
+                continue
+
+            level = min(self.level(f), self.level(g), self.level(h))
+            f_low, f_high = self.cofactors(f, level)
+            g_low, g_high = self.cofactors(g, level)
+            h_low, h_high = self.cofactors(h, level)
+            stack.append((f, g, h, level))
+            stack.append((f_high, g_high, h_high, None))
+            stack.append((f_low, g_low, h_low, None))
+        return results.pop()
+
+    def negate(self, f):
+        return self.ite(f, self.FALSE, self.TRUE)
+
+    def conjoin(self, f, g):
+        return self.ite(f, g, self.FALSE)
+
+    def disjoin(self, f, g):
+        return self.ite(f, self.TRUE, g)
+
+    def implies(self, f, g):
+        return self.ite(f, g, self.TRUE)
+
+    def equivalent(self, f, g):
+        return self.ite(f, g, self.negate(g))
+
+    def exactly_one(self, nodes):
+        none_true, one_true = self.TRUE, self.FALSE
+        for node in nodes:
+            one_true = self.ite(node, none_true, one_true)
+            none_true = self.conjoin(self.negate(node), none_true)
+        return one_true
+
+    def evaluate(self, node, assignment):
+        """ Follow the path for an assignment (a set of levels that are true).
+        """
+        while node > self.TRUE:
+            level, low, high = self.nodes[node]
+            node = high if level in assignment else low
+        return node == self.TRUE
+
+    def count(self, node):
+        """ The number of assignments to all the variables that satisfy node.
+        """
+        counts = {self.FALSE: 0, self.TRUE: 1}
+
+        def count_rec(node):
+            if node not in counts:
+                level, low, high = self.nodes[node]
+                counts[node] = (count_rec(low) * 2 ** (self.level(low) - level - 1) +
+                                count_rec(high) * 2 ** (self.level(high) - level - 1))
+            return counts[node]
+
+        # Visit deepest nodes first so the recursion above never goes deep.
+        for node_index in sorted(range(2, len(self.nodes)), key=self.level, reverse=True):
+            count_rec(node_index)
+        return count_rec(node) * 2 ** self.level(node)
+
+
+def describe_constraint(constraint):
+    """ A constraint as readable text, e.g. "Search => (DescriptionField | LabelField)".
+    """
+    operator = constraint[0]
+    if operator == "var":
+        return constraint[1]
+    if operator == "not":
+        return "!" + describe_constraint(constraint[1])
+
+    symbols = {"and": " & ", "or": " | ", "imp": " => ", "eq": " <=> "}
+    operands = []
+    for operand in constraint[1:]:
+        description = describe_constraint(operand)
+        if operand[0] not in ("var", "not"):
+            description = "(" + description + ")"
+        operands.append(description)
+    return symbols[operator].join(operands)
+
+
+def evaluate_constraint(constraint, selected):
+    operator = constraint[0]
+    if operator == "var":
+        return constraint[1] in selected
+    values = [evaluate_constraint(operand, selected) for operand in constraint[1:]]
+    if operator == "not":
+        return not values[0]
+    if operator == "and":
+        return all(values)
+    if operator == "or":
+        return any(values)
+    if operator == "imp":
+        return not values[0] or values[1]
+    return values[0] == values[1]
+
+
+class ConfigurationValidator:
+    """ Checks configurations of a FeatureModel parsed with FeatureModelParser.
+    """
+
+    def __init__(self, feature_model):
+        self.feature_model = feature_model
+        self.features = list(PreOrderIter(feature_model.root_feature))
+        self.levels = {feature.name: level for level, feature in enumerate(self.features)}
+        self.bdd = BDD(len(self.features))
+        # The BDD of the whole model, built by get_root.
+        self.root = None
+        for constraint in feature_model.constraints:
+            self.check_constraint_features(constraint)
+
+    def check_constraint_features(self, constraint):
+        if constraint[0] == "var":
+            if constraint[1] not in self.levels:
+                raise ValueError("Constraint refers to unknown feature {0}".format(constraint[1]))
+            return
+        for operand in constraint[1:]:
+            self.check_constraint_features(operand)
+
+    def feature_variable(self, name):
+        return self.bdd.variable(self.levels[name])
+
+    def compile_constraint(self, constraint):
+        operator = constraint[0]
+        if operator == "var":
+            return self.feature_variable(constraint[1])
+        operands = [self.compile_constraint(operand) for operand in constraint[1:]]
+        if operator == "not":
+            return self.bdd.negate(operands[0])
+        if operator == "imp":
+            return self.bdd.implies(operands[0], operands[1])
+        if operator == "eq":
+            return self.bdd.equivalent(operands[0], operands[1])
+
+        combine = self.bdd.conjoin if operator == "and" else self.bdd.disjoin
+        result = self.bdd.TRUE if operator == "and" else self.bdd.FALSE
+        for operand in operands:
+            result = combine(result, operand)
+        return result
+
+    def build(self):
+        bdd = self.bdd
+        # Build bottom up, so each step only involves a parent and its children.
+        root = bdd.variable(self.levels[self.feature_model.root_feature.name])
+        for feature in reversed(self.features):
+            if not feature.children:
+                continue
+            parent = bdd.variable(self.levels[feature.name])
+            children = [bdd.variable(self.levels[child.name]) for child in feature.children]
+            for child, child_node in zip(feature.children, children):
+                root = bdd.conjoin(root, bdd.implies(child_node, parent))
+                if getattr(feature, "group_type", "and") == "and" and child.mandatory:
+                    root = bdd.conjoin(root, bdd.implies(parent, child_node))
+
+            group_type = getattr(feature, "group_type", "and")
+            if group_type == "or":
+                any_child = bdd.FALSE
+                for child_node in children:
+                    any_child = bdd.disjoin(any_child, child_node)
+                root = bdd.conjoin(root, bdd.implies(parent, any_child))
+            elif group_type == "alt":
+                root = bdd.conjoin(root, bdd.implies(parent, bdd.exactly_one(children)))
+
+        for constraint in self.feature_model.constraints:
+            root = bdd.conjoin(root, self.compile_constraint(constraint))
+        return root
+
+    def get_root(self):
+        """ The BDD of the whole model, built the first time it is asked for.
+        """
+        if self.root is None:
+            self.root = self.build()
+        return self.root
+
+    def count_configurations(self):
+        """ How many distinct feature selections the model allows.
+        """
+        return self.bdd.count(self.get_root())
+
+    def complete_configuration(self, configured_features):
+        """ The features of a product, given those listed in its config file.
+
+        Config files usually list only concrete features, so an abstract feature is
+        taken to be selected if any of its children are, or if it is a mandatory
+        child of a selected feature. The root is always selected.
+        """
+        selected = set(name for name in configured_features if name)
+        selected.add(self.feature_model.root_feature.name)
+
+        for feature in reversed(self.features):
+            if feature.abstract and any(child.name in selected for child in feature.children):
+                selected.add(feature.name)
+        for feature in self.features:
+            if (feature.abstract and feature.mandatory and feature.parent is not None
+                    and feature.parent.name in selected):
+                selected.add(feature.name)
+
+        return selected
+
+    def is_valid(self, configured_features):
+        selected = self.complete_configuration(configured_features)
+        if any(name not in self.levels for name in selected):
+            return False
+        return self.bdd.evaluate(self.get_root(), set(self.levels[name] for name in selected))
+
+    def violations(self, configured_features):
+        """ Why a configuration is invalid, as a list of messages (empty when valid).
+        """
+        selected = self.complete_configuration(configured_features)
+        messages = ["Unknown feature {0}".format(name) for name in sorted(selected - set(self.levels))]
+
+        for feature in self.features:
+            if feature.name not in selected:
+                continue
+
+            if feature.parent is not None and feature.parent.name not in selected:
+                messages.append("{0} is selected but its parent {1} is not".format(feature.name, feature.parent.name))
+
+            group_type = getattr(feature, "group_type", "and")
+            child_names = [child.name for child in feature.children]
+            selected_children = [name for name in child_names if name in selected]
+            if group_type == "and":
+                for child in feature.children:
+                    if child.mandatory and child.name not in selected:
+                        messages.append("{0} is selected but its mandatory child {1} is not".format(
+                            feature.name, child.name))
+            elif group_type == "or" and not selected_children:
+                messages.append("{0} is selected but none of {1} are".format(feature.name, ", ".join(child_names)))
+            elif group_type == "alt" and len(selected_children) != 1:
+                messages.append("{0} is selected but {1} of its alternatives {2} are".format(
+                    feature.name, len(selected_children), ", ".join(child_names)))
+
+        for constraint in self.feature_model.constraints:
+            if not evaluate_constraint(constraint, selected):
+                messages.append("Constraint {0} is violated".format(describe_constraint(constraint)))
+
+        return messages
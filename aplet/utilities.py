@@ -2,25 +2,28 @@ import re
 import shutil
 import tempfile
 
+from aplet.pltools import tracing
+
 
 def sed_inplace(filename, pattern, repl):
     """ Perform the pure-Python equivalent of in-place `sed` substitution: e.g.,
     `sed -i -e 's/'${pattern}'/'${repl}' "${filename}"`.
     Taken from: https://stackoverflow.com/a/31499114
     """
-    # For efficiency, precompile the passed regular expression.
-    pattern_compiled = re.compile(pattern)
+    with tracing.span("sed_inplace", file=filename):
+        # For efficiency, precompile the passed regular expression.
+        pattern_compiled = re.compile(pattern)
 
-    # For portability, NamedTemporaryFile() defaults to mode "w+b" (i.e., binary
-    # writing with updating). This is usually a good thing. In this case,
-    # however, binary writing imposes non-trivial encoding constraints trivially
-    # resolved by switching to text writing. Let's do that.
-    with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
-        with open(filename) as src_file:
-            for line in src_file:
-                tmp_file.write(pattern_compiled.sub(repl, line))
+        # For portability, NamedTemporaryFile() defaults to mode "w+b" (i.e., binary
+        # writing with updating). This is usually a good thing. In this case,
+        # however, binary writing imposes non-trivial encoding constraints trivially
+        # resolved by switching to text writing. Let's do that.
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            with open(filename) as src_file:
+                for line in src_file:
+                    tmp_file.write(pattern_compiled.sub(repl, line))
 
-    # Overwrite the original file with the munged temporary file in a
-    # manner preserving file attributes (e.g., permissions).
-    shutil.copystat(filename, tmp_file.name)
-    shutil.move(tmp_file.name, filename)
+        # Overwrite the original file with the munged temporary file in a
+        # manner preserving file attributes (e.g., permissions).
+        shutil.copystat(filename, tmp_file.name)
+        shutil.move(tmp_file.name, filename)
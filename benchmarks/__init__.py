@@ -0,0 +1,6 @@
+""" Performance benchmarks for aplet, run against synthetic product lines.
+
+    $ python -m benchmarks.run --features 2000 --products 200
+
+See benchmarks/run.py for the options.
+"""
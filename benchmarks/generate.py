@@ -0,0 +1,179 @@
+""" Generates synthetic product lines for benchmarking: a FeatureIDE model,
+product configs, tagged .feature files and JUnit test reports, laid out as in
+an aplet project folder.
+"""
+import json
+import random
+import xml.etree.ElementTree as et
+from os import makedirs, path
+
+
+class GeneratedFeature:
+
+    def __init__(self, name, parent=None, mandatory=True):
+        self.name = name
+        self.parent = parent
+        self.mandatory = mandatory
+        self.abstract = False
+        self.children = []
+        if parent is not None:
+            parent.children.append(self)
+
+
+def generate_feature_tree(feature_count, max_depth, fanout, rng):
+    """ Grow a tree breadth first, giving each feature between 1 and fanout
+    children, until it has feature_count features or reaches max_depth.
+    Returns the features in breadth first order, the root first.
+    """
+    root = GeneratedFeature("productline")
+    root.abstract = True
+    features = [root]
+    frontier = [(root, 0)]
+
+    while frontier and len(features) < feature_count:
+        parent, depth = frontier.pop(0)
+        if depth >= max_depth:
+            continue
+        for _ in range(min(rng.randint(1, fanout), feature_count - len(features))):
+            feature = GeneratedFeature("F{0}".format(len(features)), parent, mandatory=rng.random() < 0.3)
+            features.append(feature)
+            frontier.append((feature, depth + 1))
+
+    for feature in features[1:]:
+        feature.abstract = bool(feature.children) and rng.random() < 0.5
+    return features
+
+
+def write_model(features, model_path):
+    def add_feature_el(parent_el, feature):
+        tag = "and" if feature.children else "feature"
+        feature_el = et.SubElement(parent_el, tag, name=feature.name)
+        if feature.abstract:
+            feature_el.set("abstract", "true")
+        if feature.mandatory:
+            feature_el.set("mandatory", "true")
+        for child in feature.children:
+            add_feature_el(feature_el, child)
+
+    model_el = et.Element("featureModel")
+    add_feature_el(et.SubElement(model_el, "struct"), features[0])
+    et.SubElement(model_el, "constraints")
+    et.ElementTree(model_el).write(model_path, encoding="UTF-8", xml_declaration=True)
+
+
+def select_product_features(root, rng):
+    """ A valid random product: every mandatory child of a selected feature is
+    selected, and each optional one with even odds.
+    """
+    selected = []
+    pending = [root]
+    while pending:
+        feature = pending.pop()
+        selected.append(feature)
+        pending.extend(child for child in feature.children if child.mandatory or rng.random() < 0.5)
+    return selected
+
+
+def get_scenarios(features, scenarios_per_feature, rng):
+    """ Scenario names by tag: each concrete feature gets scenarios_per_feature
+    scenarios, and some optional features a scenario for their absence.
+    """
+    scenarios_by_tag = {}
+    for feature in features:
+        if feature.abstract:
+            continue
+        scenarios_by_tag[feature.name] = ["{0} scenario {1}".format(feature.name, index + 1)
+                                          for index in range(scenarios_per_feature)]
+        if not feature.mandatory and rng.random() < 0.3:
+            scenarios_by_tag["Not" + feature.name] = ["Without {0}".format(feature.name)]
+    return scenarios_by_tag
+
+
+def write_feature_files(scenarios_by_tag, bddfeatures_path, tags_per_file=50):
+    tags = sorted(scenarios_by_tag)
+    for file_index in range(0, len(tags), tags_per_file):
+        lines = ["Feature: Generated {0}".format(file_index // tags_per_file), ""]
+        for tag in tags[file_index:file_index + tags_per_file]:
+            for scenario_name in scenarios_by_tag[tag]:
+                lines.extend([
+                    "  @" + tag,
+                    "  Scenario: " + scenario_name,
+                    "    Given a generated product",
+                    "    When the scenario runs",
+                    "    Then it is timed",
+                    "",
+                ])
+        feature_file_path = path.join(bddfeatures_path, "generated{0}.feature".format(file_index // tags_per_file))
+        with open(feature_file_path, "w") as feature_file:
+            feature_file.write("\n".join(lines))
+
+
+def write_reports(scenario_names, failure_rate, report_path_without_ext, rng):
+    """ Write a product's JUnit XML report and the matching JSON report, as the
+    runner's JSON logger writes it.
+    """
+    testsuites_el = et.Element("testsuites")
+    testsuite_el = et.SubElement(testsuites_el, "testsuite", name="acceptance", tests=str(len(scenario_names)))
+    events = [{"event": "suiteStart", "suite": "acceptance", "tests": len(scenario_names)}]
+    failures = 0
+    for scenario_name in scenario_names:
+        duration = "{0:.3f}".format(rng.uniform(0.05, 2))
+        testcase_el = et.SubElement(testsuite_el, "testcase", name="Generated: " + scenario_name,
+                                    feature=scenario_name, time=duration)
+        event = {"event": "test", "suite": "acceptance", "test": "Generated: " + scenario_name,
+                 "status": "pass", "time": float(duration), "trace": [], "message": "", "output": ""}
+        if rng.random() < failure_rate:
+            failures += 1
+            et.SubElement(testcase_el, "failure", message="Generated failure")
+            event.update(status="fail", message="Generated failure")
+        events.append(event)
+    testsuite_el.set("failures", str(failures))
+    et.ElementTree(testsuites_el).write(report_path_without_ext + ".xml", encoding="UTF-8", xml_declaration=True)
+
+    with open(report_path_without_ext + ".json", "w") as report_file:
+        for event in events:
+            report_file.write(json.dumps(event, indent=4))
+
+
+def generate_product_line(projectfolder, feature_count=1000, max_depth=8, fanout=6, product_count=100,
+                          scenarios_per_feature=2, failure_rate=0.05, seed=0):
+    """ Write a synthetic aplet project into projectfolder.
+    Returns the number of features actually generated, which is fewer than
+    feature_count if max_depth and fanout don't leave room for them.
+    """
+    rng = random.Random(seed)
+    productline_path = path.join(projectfolder, "productline")
+    configs_path = path.join(productline_path, "configs")
+    bddfeatures_path = path.join(projectfolder, "bddfeatures")
+    testreports_path = path.join(projectfolder, "testreports")
+    for directory in (configs_path, bddfeatures_path, testreports_path):
+        if not path.exists(directory):
+            makedirs(directory)
+
+    with open(path.join(projectfolder, "aplet.yml"), "w") as config_file:
+        config_file.write('project_name: "Generated product line"\n')
+
+    features = generate_feature_tree(feature_count, max_depth, fanout, rng)
+    write_model(features, path.join(productline_path, "model.xml"))
+
+    scenarios_by_tag = get_scenarios(features, scenarios_per_feature, rng)
+    write_feature_files(scenarios_by_tag, bddfeatures_path)
+
+    for product_index in range(product_count):
+        product_name = "Product{0}".format(product_index)
+        selected = select_product_features(features[0], rng)
+        with open(path.join(configs_path, product_name + ".config"), "w") as config_file:
+            for feature in selected:
+                if not feature.abstract:
+                    config_file.write(feature.name + "\n")
+
+        selected_names = set(feature.name for feature in selected)
+        scenario_names = []
+        for feature in features:
+            if feature.name in selected_names:
+                scenario_names.extend(scenarios_by_tag.get(feature.name, []))
+            else:
+                scenario_names.extend(scenarios_by_tag.get("Not" + feature.name, []))
+        write_reports(scenario_names, failure_rate, path.join(testreports_path, "report" + product_name), rng)
+
+    return len(features)
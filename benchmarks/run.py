@@ -0,0 +1,215 @@
+""" Times aplet's parsing, status calculation and rendering on a synthetic
+product line, appends the timings to a history file and flags regressions
+against the previous runs of the same size.
+
+    $ python -m benchmarks.run --features 10000 --depth 10 --fanout 8 --products 1000
+
+The end-to-end makedocs benchmarks are skipped when graphviz's dot isn't
+installed, and the lektor one when lektor isn't either.
+"""
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from os import chdir, getcwd, makedirs, path
+
+import pkg_resources
+
+from aplet.main import cli
+from aplet.pltools import coverage, ftrenderer, mapbuilder, parsers, products as productconfigs
+from benchmarks.generate import generate_product_line
+
+
+DEFAULT_HISTORY_PATH = path.join(".benchmarks", "history.jsonl")
+
+
+def time_function(function, repeat):
+    """ Run function repeat times, returning the time each run took in seconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def get_benchmarks(projectfolder):
+    """ The benchmarks, by name, as functions that each run the timed operation once.
+    Setup that isn't being timed is done here, up front.
+    """
+    featuremodel_path = path.join(projectfolder, "productline", "model.xml")
+    configs_path = path.join(projectfolder, "productline", "configs")
+    bddfeatures_path = path.join(projectfolder, "bddfeatures")
+    testreports_path = path.join(projectfolder, "testreports")
+
+    with open(featuremodel_path, "r") as model_file:
+        model_xml = model_file.read()
+    fmparser = parsers.FeatureModelParser()
+    resultsparser = parsers.TestResultsParser()
+
+    feature_model = fmparser.parse_xml(model_xml)
+    feature_model.add_gherkin_pieces(ftrenderer.gherkin_pieces_grouped_by_featurename(bddfeatures_path))
+    test_statuses = resultsparser.get_gherkin_piece_test_statuses_for_dir(testreports_path, "xml")
+    feature_model.calculate_test_statuses(test_statuses)
+
+    product_matrix = productconfigs.load_product_matrix(configs_path)
+    products = {product_name: {"features": product_matrix.features_of(product_name)}
+                for product_name in product_matrix.products}
+    products_features = {product_name: product["features"] for product_name, product in products.items()}
+
+    benchmarks = {
+        "parse_xml": lambda: fmparser.parse_xml(model_xml),
+        "gherkin_pieces_grouped_by_featurename":
+            lambda: ftrenderer.gherkin_pieces_grouped_by_featurename(bddfeatures_path),
+        "test_results_for_dir": lambda: resultsparser.get_gherkin_piece_test_statuses_for_dir(testreports_path, "xml"),
+        "test_results_for_dir_json":
+            lambda: resultsparser.get_gherkin_piece_test_statuses_for_dir(testreports_path, "json"),
+        "calculate_test_statuses": lambda: feature_model.calculate_test_statuses(test_statuses),
+        "get_productmap_html": lambda: mapbuilder.ProductMapRenderer().get_productmap_html(feature_model, products),
+        "get_productmap_html_for_matrix":
+            lambda: mapbuilder.ProductMapRenderer().get_productmap_html_for_matrix(feature_model, product_matrix),
+        "pairwise_coverage": lambda: coverage.CoverageAnalyzer(feature_model).analyze(products_features, 2),
+    }
+
+    if shutil.which("lektor") and shutil.which("dot"):
+        benchmarks["makedocs"] = lambda: run_makedocs(projectfolder)
+    if shutil.which("dot"):
+        benchmarks["makedocs_sitegen"] = lambda: run_makedocs(projectfolder, "sitegen")
+    return benchmarks
+
+
+def run_makedocs(projectfolder, generator="lektor"):
+    """ Run `aplet makedocs` on the project, with fresh docs templates each time
+    for lektor.
+    """
+    if generator == "lektor":
+        doc_templates_path = path.join(projectfolder, "doc_templates")
+        if path.exists(doc_templates_path):
+            shutil.rmtree(doc_templates_path)
+        shutil.copytree(pkg_resources.resource_filename("aplet", "templates/lektor"), doc_templates_path)
+
+    working_dir = getcwd()
+    chdir(projectfolder)
+    try:
+        cli.main(["--configfile", "aplet.yml", "makedocs", "--generator", generator], standalone_mode=False)
+    finally:
+        chdir(working_dir)
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(history_path):
+    if not path.exists(history_path):
+        return []
+    with open(history_path, "r") as history_file:
+        return [json.loads(line) for line in history_file if line.strip()]
+
+
+def append_history(history_path, record):
+    history_dir = path.dirname(history_path)
+    if history_dir and not path.exists(history_dir):
+        makedirs(history_dir)
+    with open(history_path, "a") as history_file:
+        history_file.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def find_regressions(history, record, threshold, window=5):
+    """ Compare each benchmark's fastest time with the median of its fastest
+    times over the last `window` runs with the same parameters.
+    Returns {benchmark: (baseline, change, regressed)} for every benchmark with
+    a baseline, change being the fractional slowdown (negative for a speedup)
+    and regressed whether it is more than threshold.
+    """
+    previous = [past for past in history if past["params"] == record["params"]][-window:]
+
+    comparisons = {}
+    for name, result in record["results"].items():
+        past_times = [past["results"][name]["min"] for past in previous if name in past["results"]]
+        if past_times:
+            baseline = statistics.median(past_times)
+            change = result["min"] / baseline - 1
+            comparisons[name] = (baseline, change, change > threshold)
+    return comparisons
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description="Benchmark aplet on a synthetic product line.")
+    argparser.add_argument("--features", type=int, default=1000, help="Number of features in the model")
+    argparser.add_argument("--depth", type=int, default=8, help="Maximum depth of the feature tree")
+    argparser.add_argument("--fanout", type=int, default=6, help="Maximum children per feature")
+    argparser.add_argument("--products", type=int, default=100, help="Number of product configs")
+    argparser.add_argument("--scenarios-per-feature", type=int, default=2)
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument("--repeat", type=int, default=5, help="Times to run each benchmark")
+    argparser.add_argument("--only", action="append", help="Run just this benchmark (may be repeated)")
+    argparser.add_argument("--history", default=DEFAULT_HISTORY_PATH, help="File the timings are appended to")
+    argparser.add_argument("--threshold", type=float, default=0.2,
+                           help="Slowdown over the baseline, as a fraction, that counts as a regression")
+    argparser.add_argument("--keep", help="Generate the product line into this folder and keep it")
+    args = argparser.parse_args(argv)
+
+    projectfolder = args.keep or tempfile.mkdtemp(prefix="aplet-benchmark-")
+    projectfolder = path.abspath(projectfolder)
+    params = {
+        "features": args.features,
+        "depth": args.depth,
+        "fanout": args.fanout,
+        "products": args.products,
+        "scenarios_per_feature": args.scenarios_per_feature,
+        "seed": args.seed,
+    }
+    try:
+        generated = generate_product_line(projectfolder, args.features, args.depth, args.fanout, args.products,
+                                          args.scenarios_per_feature, seed=args.seed)
+        print("Generated {0} features and {1} products in {2}".format(generated, args.products, projectfolder))
+
+        benchmarks = get_benchmarks(projectfolder)
+        if args.only:
+            benchmarks = {name: benchmarks[name] for name in args.only if name in benchmarks}
+
+        results = {}
+        for name, function in benchmarks.items():
+            durations = time_function(function, args.repeat)
+            results[name] = {"min": min(durations), "median": statistics.median(durations)}
+    finally:
+        if not args.keep:
+            shutil.rmtree(projectfolder)
+
+    record = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": get_commit(),
+        "python": sys.version.split()[0],
+        "params": params,
+        "results": results,
+    }
+    comparisons = find_regressions(load_history(args.history), record, args.threshold)
+    append_history(args.history, record)
+
+    regressions = []
+    print("{0:<40} {1:>10} {2:>10} {3:>10} {4:>8}".format("benchmark", "min", "median", "baseline", "change"))
+    for name, result in results.items():
+        baseline, change, regressed = comparisons.get(name, (None, None, False))
+        line = "{0:<40} {1:>10.4f} {2:>10.4f}".format(name, result["min"], result["median"])
+        if baseline is not None:
+            line += " {0:>10.4f} {1:>+7.0%}".format(baseline, change)
+            if regressed:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,14 +3,18 @@ from setuptools import find_packages, setup
 setup(
     name='aplet',
     version='0.1',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     include_package_data=True,
     install_requires=[
         'Click',
         'gherkin3',
         'pyyaml',
-        'graphviz'
+        'graphviz',
+        'numpy'
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     entry_points='''
         [console_scripts]
         aplet=aplet.main:cli
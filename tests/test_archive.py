@@ -0,0 +1,132 @@
+import gzip
+
+import pytest
+
+from aplet.pltools.archive import ReportArchive
+from aplet.pltools.fm import TestState
+from aplet.pltools.parsers import TestResultsParser
+
+
+REPORT_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuites>
+  <testsuite name="acceptance" tests="2" failures="1">
+    <testcase name="Todos: Add todo" feature="Add todo" time="0.3"/>
+    <testcase name="Todos: Search" feature="Search" time="0.3">
+      <failure/>
+    </testcase>
+  </testsuite>
+  <testsuite name="unit" tests="1" failures="0">
+    <testcase name="Unit: Other" feature="Other" time="0.1"/>
+  </testsuite>
+</testsuites>
+"""
+
+
+def write_report(tmp_path, name, content):
+    report_path = tmp_path / name
+    report_path.write_text(content)
+    return str(report_path)
+
+
+def test_archived_report_reads_back(tmp_path):
+    # arrange
+    archive = ReportArchive(str(tmp_path / "archive"), "gzip")
+    archive.add_reports("run1", "Product", {"xml": write_report(tmp_path, "report.xml", REPORT_XML)})
+
+    # act
+    with archive.open_report("run1", "Product", "xml") as report_stream:
+        content = report_stream.read().decode("utf-8")
+
+    # assert
+    assert content == REPORT_XML
+
+
+def test_new_run_ids_are_unique(tmp_path):
+    archive = ReportArchive(str(tmp_path / "archive"), "gzip")
+    first_run_id = archive.new_run_id()
+    archive.add_reports(first_run_id, "Product", {"xml": write_report(tmp_path, "report.xml", REPORT_XML)})
+
+    second_run_id = archive.new_run_id()
+
+    assert second_run_id != first_run_id
+    assert len(archive.runs()) == 1
+
+
+def test_identical_reports_are_stored_once(tmp_path):
+    # arrange
+    archive = ReportArchive(str(tmp_path / "archive"), "gzip")
+    report_path = write_report(tmp_path, "report.html", "<html>same</html>")
+
+    # act
+    archive.add_reports("run1", "ProductA", {"html": report_path})
+    archive.add_reports("run1", "ProductB", {"html": report_path})
+    archive.add_reports("run2", "ProductA", {"html": report_path})
+
+    # assert
+    assert len(archive.blobs()) == 1
+    assert [manifest["run_id"] for manifest in archive.runs()] == ["run1", "run2"]
+    assert sorted(archive.runs()[0]["reports"]) == ["ProductA", "ProductB"]
+
+
+def test_blobs_are_compressed(tmp_path):
+    archive = ReportArchive(str(tmp_path / "archive"), "gzip")
+    report_path = write_report(tmp_path, "report.html", "<tr><td>passed</td></tr>" * 1000)
+
+    archive.add_reports("run1", "Product", {"html": report_path})
+
+    blob_path = list(archive.blobs().values())[0]
+    assert archive.size() < 1000
+    with gzip.open(blob_path, "rb") as blob:
+        assert blob.read().startswith(b"<tr>")
+
+
+def test_missing_report_raises(tmp_path):
+    archive = ReportArchive(str(tmp_path / "archive"), "gzip")
+
+    with pytest.raises(IOError):
+        archive.open_report("run1", "Product", "xml")
+
+
+def test_old_runs_are_evicted_with_their_blobs(tmp_path):
+    # arrange
+    archive = ReportArchive(str(tmp_path / "archive"), "gzip")
+    archive.add_reports("old", "Product", {"xml": write_report(tmp_path, "old.xml", "<old/>")})
+    archive.add_reports("new", "Product", {"xml": write_report(tmp_path, "new.xml", "<new/>")})
+    manifest = archive.load_manifest("old")
+    manifest["created"] -= 100 * 86400
+    archive.save_manifest(manifest)
+
+    # act
+    removed = archive.evict(retention_days=90)
+
+    # assert
+    assert removed == ["old"]
+    assert [manifest["run_id"] for manifest in archive.runs()] == ["new"]
+    assert len(archive.blobs()) == 1
+
+
+def test_eviction_by_run_count_keeps_newest(tmp_path):
+    archive = ReportArchive(str(tmp_path / "archive"), "gzip")
+    for index in range(4):
+        report_path = write_report(tmp_path, "report{0}.xml".format(index), "<run{0}/>".format(index))
+        archive.add_reports("run{0}".format(index), "Product", {"xml": report_path})
+
+    removed = archive.evict(max_runs=2)
+
+    assert removed == ["run0", "run1"]
+    assert len(archive.blobs()) == 2
+
+
+def test_results_parse_from_archive_stream(tmp_path):
+    # arrange
+    archive = ReportArchive(str(tmp_path / "archive"), "gzip")
+    archive.add_reports("run1", "Product", {"xml": write_report(tmp_path, "report.xml", REPORT_XML)})
+    parser = TestResultsParser()
+
+    # act
+    with archive.open_report("run1", "Product", "xml") as report_stream:
+        results = parser.get_gherkin_piece_test_statuses_for_product_from_stream(report_stream)
+
+    # assert
+    assert results == parser.get_gherkin_piece_test_statuses_for_product(REPORT_XML)
+    assert results == {"Add todo": TestState.passed, "Search": TestState.failed}
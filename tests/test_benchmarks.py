@@ -0,0 +1,61 @@
+from benchmarks.generate import generate_product_line
+from benchmarks.run import find_regressions
+
+from aplet.pltools import ftrenderer
+from aplet.pltools.parsers import FeatureModelParser, ProductConfigParser, TestResultsParser
+from aplet.pltools.products import load_product_matrix
+from aplet.pltools.validation import ConfigurationValidator
+
+
+def test_generated_product_line_is_consistent(tmp_path):
+    # arrange
+    projectfolder = str(tmp_path)
+
+    # act
+    feature_count = generate_product_line(projectfolder, feature_count=200, max_depth=5, fanout=4, product_count=10)
+
+    # assert
+    feature_model = FeatureModelParser().parse_from_file(str(tmp_path / "productline" / "model.xml"))
+    validator = ConfigurationValidator(feature_model)
+    assert len(validator.features) == feature_count == 200
+
+    product_matrix = load_product_matrix(str(tmp_path / "productline" / "configs"))
+    configparser = ProductConfigParser(feature_model.root_feature.name)
+    assert len(product_matrix.products) == 10
+    for product_name in product_matrix.products:
+        assert validator.violations(configparser.parse_product(product_matrix, product_name)) == []
+
+    scenarios = [name for names in ftrenderer.scenarios_grouped_by_tag(str(tmp_path / "bddfeatures")).values()
+                 for name in names]
+    results = TestResultsParser().get_gherkin_piece_test_statuses_for_dir(str(tmp_path / "testreports"))
+    assert results and set(results) <= set(scenarios)
+    assert TestResultsParser().get_gherkin_piece_test_statuses_for_dir(str(tmp_path / "testreports"), "json") == \
+        TestResultsParser().get_gherkin_piece_test_statuses_for_dir(str(tmp_path / "testreports"), "xml") == results
+
+
+def test_depth_limits_feature_count(tmp_path):
+    feature_count = generate_product_line(str(tmp_path), feature_count=1000, max_depth=2, fanout=3, product_count=1)
+
+    assert feature_count <= 1 + 3 + 9
+
+
+def make_record(params, **minimums):
+    return {"params": params, "results": {name: {"min": value, "median": value} for name, value in minimums.items()}}
+
+
+def test_regression_is_measured_against_runs_of_the_same_size():
+    history = [
+        make_record({"features": 100}, parse_xml=1.0),
+        make_record({"features": 100}, parse_xml=1.2),
+        make_record({"features": 100}, parse_xml=1.1),
+        make_record({"features": 5000}, parse_xml=50.0),
+    ]
+
+    comparisons = find_regressions(history, make_record({"features": 100}, parse_xml=1.65, makedocs=3.0), 0.2)
+
+    assert list(comparisons) == ["parse_xml"]
+    baseline, change, regressed = comparisons["parse_xml"]
+    assert baseline == 1.1
+    assert round(change, 2) == 0.5
+    assert regressed
+    assert not find_regressions(history, make_record({"features": 100}, parse_xml=1.65), 0.6)["parse_xml"][2]
@@ -0,0 +1,205 @@
+import resource
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from aplet.pltools import concurrency
+from aplet.pltools.concurrency import AdaptivePool, ConcurrencyController, SystemStats
+
+
+MB = 1024 * 1024
+
+
+class FakeStats:
+    cpu_count = 4
+
+    def __init__(self, **sample):
+        self.values = {"cpu_busy": 0.2, "load_per_cpu": 0.5, "memory_available": 8000 * MB, "memory_pressure": 0.0}
+        self.values.update(sample)
+
+    def sample(self):
+        return dict(self.values)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def write_proc(proc_dir, cpu_line, loadavg="3.00 2.00 1.00 2/300 1234", available_kb=2048000, pressure=True):
+    (proc_dir / "stat").write_text(cpu_line + "\ncpu0 1 2 3 4 5 6 7 8 9 10\n")
+    (proc_dir / "loadavg").write_text(loadavg + "\n")
+    (proc_dir / "meminfo").write_text("MemTotal:       8192000 kB\nMemAvailable:   {0} kB\nHugePages_Total:       0\n"
+                                      .format(available_kb))
+    if pressure:
+        (proc_dir / "pressure").mkdir(exist_ok=True)
+        (proc_dir / "pressure" / "memory").write_text(
+            "some avg10=12.50 avg60=3.00 avg300=1.00 total=100\nfull avg10=1.00 avg60=0.00 avg300=0.00 total=10\n")
+
+
+def test_system_stats_are_read_from_proc(tmp_path):
+    # arrange
+    write_proc(tmp_path, "cpu  100 0 100 700 100 0 0 0 0 0")
+    stats = SystemStats(str(tmp_path))
+    stats.cpu_count = 2
+    first_sample = stats.sample()
+    write_proc(tmp_path, "cpu  400 0 100 900 100 0 0 0 0 0")
+
+    # act
+    sample = stats.sample()
+
+    # assert
+    assert first_sample["cpu_busy"] is None
+    assert sample["cpu_busy"] == 300 / 500
+    assert sample["load_per_cpu"] == 1.5
+    assert sample["memory_available"] == 2048000 * 1024
+    assert sample["memory_pressure"] == 12.5
+
+
+def test_system_stats_without_proc(tmp_path):
+    sample = SystemStats(str(tmp_path / "missing")).sample()
+
+    assert sample == {"cpu_busy": None, "load_per_cpu": None, "memory_available": None, "memory_pressure": None}
+
+
+def test_memory_limit_applies_from_the_start_of_the_process():
+    limit = 2048 * MB
+
+    output = subprocess.check_output(
+        [sys.executable, "-c", "import resource; print(resource.getrlimit(resource.RLIMIT_AS)[0])"],
+        preexec_fn=concurrency.memory_limiter(limit))
+
+    assert int(output) == limit
+
+
+def test_memory_limit_above_the_hard_limit_is_rejected(monkeypatch):
+    monkeypatch.setattr(resource, "getrlimit", lambda limit: (512 * MB, 1024 * MB))
+
+    with pytest.raises(ValueError, match="2048 MB is above this process's hard limit of 1024 MB"):
+        concurrency.memory_limiter(2048 * MB)
+
+
+def test_limit_grows_while_the_machine_has_room():
+    # arrange
+    clock = FakeClock()
+    controller = ConcurrencyController(8, FakeStats(), clock=clock)
+
+    # act
+    limits = []
+    for _ in range(5):
+        clock.now += 10
+        limits.append(controller.update(running=controller.limit))
+
+    # assert
+    assert limits == [3, 4, 5, 6, 7]
+
+
+def test_limit_stops_growing_at_max_jobs_or_when_cpus_are_busy():
+    clock = FakeClock()
+    capped = ConcurrencyController(2, FakeStats(), clock=clock)
+    busy = ConcurrencyController(8, FakeStats(cpu_busy=0.95), clock=clock)
+    clock.now += 10
+
+    assert capped.update(running=2) == 2
+    assert busy.update(running=2) == 2
+
+
+def test_limit_leaves_memory_for_another_job():
+    # arrange
+    clock = FakeClock()
+    stats = FakeStats(memory_available=4000 * MB)
+    controller = ConcurrencyController(8, stats, min_free_memory=1000 * MB, clock=clock)
+    controller.update(running=0)
+
+    # act: two jobs took 1000 MB each, leaving room for one more but not for two
+    stats.values["memory_available"] = 2000 * MB
+    clock.now += 10
+    first_limit = controller.update(running=2)
+    stats.values["memory_available"] = 1500 * MB
+    clock.now += 10
+    second_limit = controller.update(running=3)
+
+    # assert
+    assert (first_limit, second_limit) == (3, 3)
+
+
+def test_limit_halves_when_overloaded():
+    stats = FakeStats()
+    controller = ConcurrencyController(8, stats)
+    controller.limit = 6
+
+    stats.values["memory_pressure"] = 40.0
+    assert controller.update(running=6) == 3
+    assert controller.reason == "memory pressure 40%"
+    # The jobs started under the old limit are still running, so the overload isn't held against the new one.
+    assert controller.update(running=6) == 3
+    assert controller.update(running=3) == 1
+    assert controller.update(running=1) == 1
+
+
+def test_limit_halves_when_jobs_fail_more_than_they_did():
+    # arrange
+    controller = ConcurrencyController(8, FakeStats(cpu_busy=0.95), failure_window=3)
+    controller.limit = 4
+    for failure_rate in (0.1, 0.0, 0.1, 0.1):
+        controller.record_job(failure_rate)
+    limit_at_baseline = controller.update(running=4)
+
+    # act
+    for failure_rate in (0.5, 0.6, 0.4):
+        controller.record_job(failure_rate)
+    limit = controller.update(running=4)
+
+    # assert
+    assert limit_at_baseline == 4
+    assert limit == 2
+    assert controller.reason == "50% of tests failing"
+
+
+class FixedController:
+    def __init__(self, limits, max_jobs=3):
+        self.limits = list(limits)
+        self.max_jobs = max_jobs
+        self.reason = "fixed"
+
+    def update(self, running):
+        if len(self.limits) > 1:
+            return self.limits.pop(0)
+        return self.limits[0]
+
+
+def test_pool_runs_jobs_within_the_limit_on_reused_slots():
+    # arrange
+    lock = threading.Lock()
+    running = []
+    most_running = [0]
+    slots_of_jobs = {}
+    done = []
+
+    def run_job(slot, job):
+        with lock:
+            assert slot not in running
+            running.append(slot)
+            most_running[0] = max(most_running[0], len(running))
+        threading.Event().wait(0.02)
+        with lock:
+            running.remove(slot)
+        slots_of_jobs[job] = slot
+        return job * 10
+
+    echoed = []
+    pool = AdaptivePool(FixedController([2]), poll_interval=0.01, echo=echoed.append)
+
+    # act
+    pool.run(range(8), run_job, lambda job, result: done.append((job, result)))
+
+    # assert
+    assert sorted(done) == [(job, job * 10) for job in range(8)]
+    assert most_running[0] <= 2
+    assert set(slots_of_jobs.values()) <= {0, 1}
+    assert echoed == ["Running up to 2 jobs at once (fixed)"]
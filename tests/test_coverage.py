@@ -0,0 +1,217 @@
+import itertools
+import random
+
+import pytest
+
+from aplet.pltools.coverage import CoverageAnalyzer
+from aplet.pltools.parsers import FeatureModelParser
+
+
+FLAT_MODEL_XML = """<featureModel>
+    <struct>
+        <and abstract="true" mandatory="true" name="todoapp">
+            <feature mandatory="true" name="AddTodo"/>
+            <feature name="Search"/>
+            <feature name="Labels"/>
+        </and>
+    </struct>
+    <constraints/>
+</featureModel>
+"""
+
+STRUCTURED_MODEL_XML = """<featureModel>
+    <struct>
+        <and abstract="true" mandatory="true" name="todoapp">
+            <and name="Search">
+                <feature name="Regex"/>
+            </and>
+            <alt abstract="true" mandatory="true" name="Sort">
+                <feature name="ByDate"/>
+                <feature name="ByName"/>
+            </alt>
+        </and>
+    </struct>
+    <constraints/>
+</featureModel>
+"""
+
+FLAT_PRODUCTS = {
+    "Basic": ["AddTodo", "todoapp"],
+    "Copy": ["AddTodo", "todoapp"],
+    "Search": ["AddTodo", "Search", "todoapp"],
+    "Full": ["AddTodo", "Search", "Labels", "todoapp"],
+}
+
+
+def get_analyzer(model_xml):
+    return CoverageAnalyzer(FeatureModelParser().parse_xml(model_xml))
+
+
+def test_pairwise_coverage_and_redundant_products():
+    result = get_analyzer(FLAT_MODEL_XML).analyze(FLAT_PRODUCTS, 2)
+
+    # Nothing covers (Search not selected, Labels selected).
+    assert (result["possible"], result["covered"]) == (4, 3)
+    # Duplicate products are redundant, since either one can go.
+    assert result["redundant"] == ["Basic", "Copy"]
+
+
+def test_featurewise_coverage():
+    result = get_analyzer(FLAT_MODEL_XML).analyze(FLAT_PRODUCTS, 1)
+
+    assert (result["possible"], result["covered"]) == (4, 4)
+    # Search's features are each also selected or deselected in another product.
+    assert result["redundant"] == ["Basic", "Copy", "Search"]
+
+
+def test_structurally_impossible_interactions_are_not_counted():
+    analyzer = get_analyzer(STRUCTURED_MODEL_XML)
+    products = {
+        "ByDate": ["todoapp", "Sort", "ByDate"],
+        "Regex": ["todoapp", "Search", "Regex", "Sort", "ByName"],
+    }
+
+    result = analyzer.analyze(products, 2)
+
+    # 6 pairs of 4 features, less Regex without Search, and ByDate with or without ByName.
+    assert result["possible"] == 6 * 4 - 3
+    assert result["covered"] == 12
+    assert result["redundant"] == []
+
+
+def test_branches_of_an_optional_alternative_group_can_be_selected_with_it():
+    analyzer = get_analyzer("""<featureModel><struct>
+        <and abstract="true" mandatory="true" name="todoapp">
+            <alt name="Sort">
+                <feature name="ByDate"/>
+                <feature name="ByName"/>
+            </alt>
+        </and>
+    </struct></featureModel>""")
+    products = {
+        "Unsorted": ["todoapp"],
+        "ByDate": ["todoapp", "Sort", "ByDate"],
+        "ByName": ["todoapp", "Sort", "ByName"],
+    }
+
+    result = analyzer.analyze(products, 2)
+
+    # Selecting ByDate only rules out selecting ByName, not Sort.
+    by_date, by_name = analyzer.feature_indexes["ByDate"], analyzer.feature_indexes["ByName"]
+    assert analyzer.impossible[1][1][by_date] == 1 << by_name
+    # 3 pairs of 4, less ByDate or ByName without Sort and ByDate with ByName.
+    assert result["possible"] == 3 * 4 - 3
+    assert (result["possible"], result["covered"], result["redundant"]) == \
+        brute_force_coverage(analyzer, products, 2)
+
+
+def test_branches_of_an_alternative_group_that_is_always_selected_cant_all_be_deselected():
+    analyzer = get_analyzer("""<featureModel><struct>
+        <and abstract="true" mandatory="true" name="todoapp">
+            <alt abstract="true" mandatory="true" name="Storage">
+                <feature name="Local"/>
+                <feature name="Database"/>
+                <feature name="Cloud"/>
+            </alt>
+        </and>
+    </struct></featureModel>""")
+    products = {name: ["todoapp", "Storage", name] for name in ("Local", "Database", "Cloud")}
+
+    result = analyzer.analyze(products, 3)
+
+    # Exactly one of the three is selected.
+    assert (result["possible"], result["covered"]) == (3, 3)
+    assert (result["possible"], result["covered"], result["redundant"]) == \
+        brute_force_coverage(analyzer, products, 3)
+
+
+def test_t_larger_than_the_feature_count_is_rejected():
+    with pytest.raises(ValueError):
+        get_analyzer(FLAT_MODEL_XML).analyze(FLAT_PRODUCTS, 3)
+
+
+def random_model_xml(rng, feature_count):
+    budget = [feature_count]
+
+    def grow(depth):
+        elements = []
+        while budget[0] > 0 and rng.random() < 0.8:
+            budget[0] -= 1
+            attributes = ' name="F{0}"'.format(budget[0])
+            if rng.random() < 0.2:
+                attributes += ' mandatory="true"'
+            children = grow(depth + 1) if depth < 3 and rng.random() < 0.5 else []
+            if children:
+                group_type = rng.choice(["and", "alt", "or"])
+                if rng.random() < 0.3:
+                    attributes += ' abstract="true"'
+                elements.append("<{0}{1}>{2}</{0}>".format(group_type, attributes, "".join(children)))
+            else:
+                elements.append("<feature{0}/>".format(attributes))
+        return elements
+
+    return ('<featureModel><struct><and abstract="true" mandatory="true" name="root">{0}</and></struct>'
+            '</featureModel>'.format("".join(grow(0))))
+
+
+def is_always_selected(node):
+    return node.parent is None or (node.mandatory and getattr(node.parent, "group_type", "and") == "and"
+                                   and is_always_selected(node.parent))
+
+
+def is_possible(interaction):
+    """ Whether an interaction ([(feature, selected)]) is allowed by the
+    model's structure.
+    """
+    deselected = set(feature for feature, selected in interaction if not selected)
+    for feature in deselected:
+        group = feature.parent
+        if (getattr(group, "group_type", "and") == "alt" and is_always_selected(group)
+                and set(group.children) <= deselected):
+            return False
+    for (feature, selected), (other, other_selected) in itertools.permutations(interaction, 2):
+        if feature in other.ancestors and not selected and other_selected:
+            return False
+        if selected and other_selected:
+            for group in feature.ancestors:
+                if getattr(group, "group_type", "and") == "alt" and group in other.ancestors:
+                    branch = next(child for child in group.children if child is feature or child in feature.ancestors)
+                    if other is not branch and branch not in other.ancestors:
+                        return False
+    return True
+
+
+def brute_force_coverage(analyzer, products, t):
+    possible = covered = 0
+    unique = set()
+    for features in itertools.combinations(analyzer.features, t):
+        for values in itertools.product((True, False), repeat=t):
+            interaction = list(zip(features, values))
+            if not is_possible(interaction):
+                continue
+            possible += 1
+            covering = [product_name for product_name, product_features in products.items()
+                        if all((feature.name in product_features) == selected for feature, selected in interaction)]
+            covered += bool(covering)
+            if len(covering) == 1:
+                unique.update(covering)
+    return possible, covered, sorted(set(products) - unique)
+
+
+@pytest.mark.parametrize("t", [1, 2, 3])
+def test_analyze_matches_brute_force_on_random_models(t):
+    rng = random.Random(t)
+
+    for _ in range(40):
+        analyzer = get_analyzer(random_model_xml(rng, rng.randint(3, 10)))
+        if len(analyzer.features) < t:
+            continue
+        names = [feature.name for feature in analyzer.features]
+        # Enough products that some classes are ORed through the lookup tables.
+        products = {"P{0}".format(index): [name for name in names if rng.random() < 0.5]
+                    for index in range(rng.choice([3, 40]))}
+
+        result = analyzer.analyze(products, t)
+
+        assert (result["possible"], result["covered"], result["redundant"]) == \
+            brute_force_coverage(analyzer, products, t)
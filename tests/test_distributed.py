@@ -0,0 +1,145 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from aplet.pltools.distributed import Coordinator, Worker, decode_reports, read_message, send_message
+
+
+def make_jobs(count):
+    return [{"job_id": "Product{0}/0".format(index), "product": "Product{0}".format(index)} for index in range(count)]
+
+
+def run_coordinator_in_thread(coordinator):
+    outcome = {}
+    thread = threading.Thread(target=lambda: outcome.update(returncodes=coordinator.run()))
+    thread.start()
+    return thread, outcome
+
+
+def fake_job_runner(ran_jobs):
+    def run_job(job):
+        ran_jobs.append(job["job_id"])
+        return 0, {"report.xml": "<testsuites>{0}</testsuites>".format(job["product"]).encode()}
+    return run_job
+
+
+def test_jobs_are_shared_between_workers():
+    # arrange
+    received = {}
+    coordinator = Coordinator(make_jobs(6), on_result=lambda job, result: received.update(
+        {job["job_id"]: decode_reports(result["reports"])}))
+    host, port = coordinator.address
+    thread, outcome = run_coordinator_in_thread(coordinator)
+    ran_by_worker = [[], [], []]
+
+    # act
+    workers = [threading.Thread(target=Worker(host, port, fake_job_runner(ran_jobs)).run) for ran_jobs in ran_by_worker]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers + [thread]:
+        worker_thread.join(10)
+
+    # assert
+    assert sorted(job_id for ran_jobs in ran_by_worker for job_id in ran_jobs) == sorted(received)
+    assert len(received) == 6
+    assert received["Product3/0"]["report.xml"] == b"<testsuites>Product3</testsuites>"
+    assert outcome["returncodes"] == {job["job_id"]: 0 for job in make_jobs(6)}
+
+
+def test_job_of_lost_worker_is_requeued():
+    # arrange
+    coordinator = Coordinator(make_jobs(2))
+    host, port = coordinator.address
+    thread, outcome = run_coordinator_in_thread(coordinator)
+
+    # a worker that takes a job and then goes away without a result
+    with socket.create_connection((host, port)) as sock, sock.makefile("rb") as rfile, sock.makefile("wb") as wfile:
+        send_message(wfile, {"type": "ready"})
+        lost_job = read_message(rfile)["job"]
+
+    # act
+    ran_jobs = []
+    Worker(host, port, fake_job_runner(ran_jobs)).run()
+    thread.join(10)
+
+    # assert
+    assert lost_job["job_id"] in ran_jobs
+    assert sorted(outcome["returncodes"]) == ["Product0/0", "Product1/0"]
+
+
+def test_job_of_timed_out_worker_is_requeued():
+    # arrange
+    coordinator = Coordinator(make_jobs(1), job_timeout=0.2)
+    host, port = coordinator.address
+    thread, outcome = run_coordinator_in_thread(coordinator)
+
+    with socket.create_connection((host, port)) as sock, sock.makefile("rb") as rfile, sock.makefile("wb") as wfile:
+        send_message(wfile, {"type": "ready"})
+        read_message(rfile)
+
+        # act
+        ran_jobs = []
+        Worker(host, port, fake_job_runner(ran_jobs)).run()
+        thread.join(10)
+
+    # assert
+    assert ran_jobs == ["Product0/0"]
+    assert outcome["returncodes"] == {"Product0/0": 0}
+
+
+def test_worker_stops_when_no_jobs_are_left():
+    # arrange
+    coordinator = Coordinator(make_jobs(2))
+    host, port = coordinator.address
+    thread, outcome = run_coordinator_in_thread(coordinator)
+
+    # act
+    ran_jobs = []
+    jobs_run = Worker(host, port, fake_job_runner(ran_jobs)).run()
+    thread.join(10)
+
+    # assert
+    assert jobs_run == 2
+    assert ran_jobs == ["Product0/0", "Product1/0"]
+    assert not thread.is_alive()
+
+
+def test_coordinator_without_jobs_finishes_at_once():
+    coordinator = Coordinator([])
+    thread, _ = run_coordinator_in_thread(coordinator)
+    thread.join(10)
+
+    assert coordinator.returncodes == {}
+
+
+# Reports that fit in the worker's write buffer, and that don't.
+@pytest.mark.parametrize("report_repeat", [1, 100000])
+def test_worker_whose_job_timed_out_stops_cleanly(report_repeat):
+    # arrange
+    coordinator = Coordinator(make_jobs(1), job_timeout=0.2)
+    host, port = coordinator.address
+    thread, outcome = run_coordinator_in_thread(coordinator)
+    job_started = threading.Event()
+    slow_outcome = {}
+
+    def run_slow_job(job):
+        job_started.set()
+        time.sleep(1)
+        return 0, {"report.xml": b"<testsuites/>" * report_repeat}
+
+    slow_worker = threading.Thread(target=lambda: slow_outcome.update(jobs_run=Worker(host, port, run_slow_job).run()))
+    slow_worker.start()
+    job_started.wait(10)
+
+    # act: the job is handed to another worker once it times out
+    ran_jobs = []
+    Worker(host, port, fake_job_runner(ran_jobs)).run()
+    thread.join(10)
+    slow_worker.join(10)
+
+    # assert
+    assert ran_jobs == ["Product0/0"]
+    assert outcome["returncodes"] == {"Product0/0": 0}
+    assert slow_outcome == {"jobs_run": 1}
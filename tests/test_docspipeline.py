@@ -0,0 +1,98 @@
+from os import getpid
+
+from aplet.pltools import docspipeline
+from aplet.pltools.fm import TestState
+from aplet.pltools.mapbuilder import ProductMapRenderer
+from aplet.pltools.parsers import FeatureModelParser
+from aplet.pltools.products import ProductMatrix
+
+
+MODEL_XML = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<featureModel>
+    <struct>
+        <and abstract="true" mandatory="true" name="todoapp">
+            <feature mandatory="true" name="AddTodo"/>
+            <feature name="Search"/>
+        </and>
+    </struct>
+    <constraints/>
+</featureModel>
+"""
+
+FAILING_SEARCH_REPORT = """<testsuites><testsuite name="acceptance">
+    <testcase name="Add todo to list: Add todo" feature="Add todo"/>
+    <testcase name="Search todos: Search" feature="Search"><failure/></testcase>
+</testsuite></testsuites>"""
+
+
+def write_page(product_name, root_feature, test_status, test_report_path):
+    return getpid(), [feature.name for feature in root_feature.descendants], test_report_path is not None
+
+
+def get_inputs(tmp_path):
+    product_matrix = ProductMatrix()
+    for index in range(6):
+        product_matrix.add_product("Basic{0}".format(index), ["todoapp", "AddTodo"])
+        product_matrix.add_product("Full{0}".format(index), ["todoapp", "AddTodo", "Search"])
+        (tmp_path / "reportFull{0}.xml".format(index)).write_text(FAILING_SEARCH_REPORT)
+    (tmp_path / "reportFull0.html").write_text("<html>report</html>")
+    return {
+        "model_xml": MODEL_XML,
+        "gherkin_pieces": {"AddTodo": ["Add todo"], "Search": ["Search"]},
+        "product_matrix": product_matrix,
+        "testreports_path": str(tmp_path),
+        "results_format": "xml",
+    }
+
+
+def make_pages(inputs, jobs):
+    pages = {}
+
+    def page_done(product_name, test_status, page):
+        pages[product_name] = (test_status, page)
+
+    docspipeline.make_product_pages(inputs, inputs["product_matrix"].products, write_page, jobs, page_done)
+    return pages
+
+
+def test_pages_made_by_workers_match_those_made_in_process(tmp_path):
+    # arrange
+    inputs = get_inputs(tmp_path)
+
+    # act
+    in_process_pages = make_pages(inputs, jobs=1)
+    worker_pages = make_pages(inputs, jobs=3)
+
+    # assert
+    def without_pid(pages):
+        return {product_name: (test_status, page[1:]) for product_name, (test_status, page) in pages.items()}
+    assert without_pid(worker_pages) == without_pid(in_process_pages)
+    assert worker_pages["Full0"] == (TestState.failed, (worker_pages["Full0"][1][0], ["AddTodo", "Search"], True))
+    assert worker_pages["Basic1"][0] is TestState.inconclusive
+    assert {page[0] for _, page in in_process_pages.values()} == {getpid()}
+    assert getpid() not in {page[0] for _, page in worker_pages.values()}
+
+
+def test_product_map_from_matrix_matches_product_map_from_feature_lists():
+    # arrange: enough features for rows several bytes long
+    feature_names = ["Feature{0}".format(index) for index in range(20)]
+    model_xml = MODEL_XML.replace('<feature name="Search"/>', "".join(
+        '<feature name="{0}"/>'.format(feature_name) for feature_name in feature_names))
+    feature_model = FeatureModelParser().parse_xml(model_xml)
+    feature_model.add_gherkin_pieces({})
+    feature_model.calculate_test_statuses({})
+    products = {
+        "Basic": {"features": ["todoapp", "AddTodo"]},
+        "Odd": {"features": ["todoapp", "AddTodo"] + feature_names[1::2]},
+        "Last": {"features": ["todoapp", "AddTodo", feature_names[-1]]},
+    }
+    product_matrix = ProductMatrix()
+    for product_name, product in products.items():
+        product_matrix.add_product(product_name, product["features"])
+
+    # act
+    html = ProductMapRenderer().get_productmap_html_for_matrix(feature_model, product_matrix)
+
+    # assert
+    assert html == ProductMapRenderer().get_productmap_html(feature_model, products)
+    assert html.count("[&plus;]") == 3 + 10 + 1
@@ -0,0 +1,122 @@
+import random
+
+from gherkin3.parser import Parser
+
+from aplet.pltools.featurescan import scan_feature
+
+
+FEATURE = """@Search @Filter
+Feature: Searching
+  As a user I want to find todos.
+
+  Background:
+    Given I have todos
+
+  @Label
+  Scenario: Search by label
+    Given I am on the todo list
+    When I search for "work"
+    \"\"\"
+    Scenario: not a scenario
+    @NotATag
+    \"\"\"
+    Then I see the todos labelled "work"
+
+  # @Commented out
+  @Slow @Label
+  Scenario Outline: Search by <field>
+    Given a todo with <field> "x"
+      | field | value |
+      | label | x     |
+    Then it is found
+
+    @ExamplesTag
+    Examples:
+      | field |
+      | label |
+"""
+
+
+def project(feature_parsed):
+    """ The parts of a parsed feature that aplet uses.
+    """
+    return {
+        "tags": [tag["name"] for tag in feature_parsed["tags"]],
+        "name": feature_parsed["name"],
+        "scenarios": [(scenario["name"], [tag["name"] for tag in scenario["tags"]])
+                      for scenario in feature_parsed["scenarioDefinitions"]],
+    }
+
+
+def parse_with_gherkin3(text):
+    try:
+        return Parser().parse(text)
+    except Exception:
+        return None
+
+
+def test_scan_matches_parser():
+    scanned = scan_feature(FEATURE)
+
+    assert project(scanned) == project(Parser().parse(FEATURE))
+    assert project(scanned) == {
+        "tags": ["@Search", "@Filter"],
+        "name": "Searching",
+        "scenarios": [("Search by label", ["@Label"]), ("Search by <field>", ["@Slow", "@Label"])],
+    }
+
+
+def test_other_languages_fall_back():
+    text = "# language: fr\nFonctionnalité: Recherche\n\n  Scénario: Par étiquette\n    Soit une liste\n"
+
+    assert scan_feature(text) is None
+
+
+def test_tags_without_a_scenario_fall_back():
+    assert scan_feature("Feature: Tags\n  Scenario: One\n    Given a step\n  @Dangling\n") is None
+
+
+def test_doc_string_outside_a_step_falls_back():
+    assert scan_feature('Feature: Docs\n  """\n  Scenario: in a description\n  """\n') is None
+
+
+# Pieces of feature files, some of them deliberately awkward or invalid.
+HEADER_PIECES = ["", "# a comment", "@Tag", "@One @Two", "  @Spaced   @Tags  ", "@Odd#tag", "# language: en"]
+DESCRIPTION_PIECES = ["Some description", "Given a description that looks like a step", "| not | a table |",
+                      "Examples: in a description", '"""', "@Tag"]
+SECTION_PIECES = ["Scenario: {0}", "Scenario Outline: {0} <x>", "Background:", "Scenario Template: {0}",
+                  "Examples:", "Feature: Another {0}"]
+BODY_PIECES = ["Given a step", "When something happens", "* a star step", "And more", "| a | b |",
+               '"""\nScenario: hidden {0}\n@Hidden\n"""', "```json\n{{}}\n```", "# comment in body", "",
+               "@Tag", "Description after steps", '"""', "| x |\n| 1 |"]
+
+
+def random_feature_text(rng):
+    lines = [rng.choice(HEADER_PIECES) for _ in range(rng.randint(0, 3))]
+    lines.append("Feature: Random {0}".format(rng.randint(0, 99)))
+    lines.extend(rng.choice(DESCRIPTION_PIECES) for _ in range(rng.randint(0, 2)))
+    for section_index in range(rng.randint(0, 5)):
+        lines.extend(rng.choice(HEADER_PIECES[:5]) for _ in range(rng.randint(0, 2)))
+        lines.append("  " + rng.choice(SECTION_PIECES).format(section_index))
+        lines.extend("    " + rng.choice(BODY_PIECES).format(section_index) for _ in range(rng.randint(0, 5)))
+    line_ending = rng.choice(["\n", "\r\n"])
+    return line_ending.join(lines) + rng.choice(["", line_ending])
+
+
+def test_scan_is_equivalent_to_parser_on_random_input():
+    rng = random.Random(1234)
+    scanned_count = 0
+
+    for _ in range(3000):
+        text = random_feature_text(rng)
+        scanned = scan_feature(text)
+        if scanned is None:
+            continue
+
+        scanned_count += 1
+        parsed = parse_with_gherkin3(text)
+        assert parsed is not None, text
+        assert project(scanned) == project(parsed), text
+
+    # The fast path should handle a good share of the (often invalid) random input.
+    assert scanned_count > 300
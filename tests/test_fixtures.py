@@ -0,0 +1,181 @@
+import socket
+import sys
+import threading
+
+import pytest
+
+from aplet.pltools.fixtures import FixtureError, FixtureSupervisor
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def http_server_spec(name, port, scope="product", probe_kind="http"):
+    probe = {"http": "http://localhost:{0}/".format(port)}
+    if probe_kind == "tcp":
+        probe = {"tcp": "localhost:{0}".format(port)}
+    return {
+        "name": name,
+        "command": [sys.executable, "-m", "http.server", str(port), "--bind", "localhost", "--directory", "{app_dir}"],
+        "scope": scope,
+        "probe": probe,
+        "timeout": 10,
+    }
+
+
+def test_fixture_is_ready_when_start_returns(tmp_path):
+    # arrange
+    port = get_free_port()
+    supervisor = FixtureSupervisor([http_server_spec("app", port)])
+
+    # act
+    with supervisor:
+        started = supervisor.start("product", {"app_dir": str(tmp_path)})
+
+        # assert
+        assert started == ["app"]
+        socket.create_connection(("localhost", port), timeout=1).close()
+
+
+def test_unchanged_fixture_is_reused_across_products(tmp_path):
+    # arrange
+    port = get_free_port()
+
+    with FixtureSupervisor([http_server_spec("app", port, probe_kind="tcp")]) as supervisor:
+        supervisor.start("product", {"app_dir": str(tmp_path)})
+        process = supervisor.fixtures[0].process
+
+        # act
+        started = supervisor.start("product", {"app_dir": str(tmp_path)})
+
+        # assert
+        assert started == []
+        assert supervisor.fixtures[0].process is process
+
+
+def test_changed_fixture_is_restarted(tmp_path):
+    # arrange
+    port = get_free_port()
+    other_dir = tmp_path / "other"
+    other_dir.mkdir()
+
+    with FixtureSupervisor([http_server_spec("app", port)]) as supervisor:
+        supervisor.start("product", {"app_dir": str(tmp_path)})
+        old_process = supervisor.fixtures[0].process
+
+        # act
+        started = supervisor.start("product", {"app_dir": str(other_dir)})
+
+        # assert
+        assert started == ["app"]
+        assert old_process.returncode is not None
+
+
+def test_only_fixtures_of_scope_are_started(tmp_path):
+    port = get_free_port()
+
+    with FixtureSupervisor([http_server_spec("webdriver", port, scope="productline")]) as supervisor:
+        assert supervisor.start("product", {"app_dir": str(tmp_path)}) == []
+        assert supervisor.start("productline", {"app_dir": str(tmp_path)}) == ["webdriver"]
+
+
+def test_fixtures_are_reaped_on_close(tmp_path):
+    # arrange
+    supervisor = FixtureSupervisor([http_server_spec("app", get_free_port())])
+    supervisor.start("product", {"app_dir": str(tmp_path)})
+    process = supervisor.fixtures[0].process
+
+    # act
+    supervisor.close()
+
+    # assert
+    assert process.returncode is not None
+
+
+def test_only_fixtures_of_scope_are_stopped(tmp_path):
+    # arrange
+    specs = [http_server_spec("app", get_free_port()), http_server_spec("webdriver", get_free_port(), "productline")]
+    with FixtureSupervisor(specs) as supervisor:
+        supervisor.start("productline", {"app_dir": str(tmp_path)})
+        supervisor.start("product", {"app_dir": str(tmp_path)})
+        app_process = supervisor.fixtures[0].process
+
+        # act
+        supervisor.stop("product")
+
+        # assert
+        assert app_process.returncode is not None
+        assert not supervisor.fixtures[0].is_running()
+        assert supervisor.fixtures[1].is_running()
+        assert supervisor.start("product", {"app_dir": str(tmp_path)}) == ["app"]
+
+
+def test_fixture_exiting_before_ready_raises():
+    spec = {
+        "name": "broken",
+        "command": [sys.executable, "-c", "import sys; sys.exit(3)"],
+        "probe": {"tcp": "localhost:{0}".format(get_free_port())},
+    }
+
+    with FixtureSupervisor([spec]) as supervisor:
+        with pytest.raises(FixtureError):
+            supervisor.start("product", {})
+
+
+def test_fixture_never_ready_raises():
+    spec = {
+        "name": "sleeper",
+        "command": [sys.executable, "-c", "import time; time.sleep(30)"],
+        "probe": {"tcp": "localhost:{0}".format(get_free_port())},
+        "timeout": 0.3,
+    }
+
+    with FixtureSupervisor([spec]) as supervisor:
+        with pytest.raises(FixtureError):
+            supervisor.start("product", {})
+
+
+def test_placeholder_unknown_for_scope_raises(tmp_path):
+    spec = http_server_spec("webdriver", get_free_port(), scope="productline")
+    spec["command"].append("--port={port}")
+
+    with FixtureSupervisor([spec]) as supervisor:
+        with pytest.raises(FixtureError, match=r"webdriver uses \{port\}"):
+            supervisor.start("productline", {"app_dir": str(tmp_path)})
+
+
+def test_literal_braces_must_be_doubled():
+    spec = {"name": "shell", "command": ["sh", "-c", "f() { :; }"]}
+
+    with FixtureSupervisor([spec]) as supervisor:
+        with pytest.raises(FixtureError, match="literal braces"):
+            supervisor.start("product", {})
+        supervisor.fixtures[0].command = ["f() {{ :; }}"]
+        assert supervisor.fixtures[0].render_command({}) == ["f() { :; }"]
+
+
+def test_malformed_http_status_line_is_not_ready():
+    # arrange
+    server = socket.socket()
+    server.bind(("localhost", 0))
+    server.listen()
+
+    def reply():
+        connection, _ = server.accept()
+        with connection:
+            connection.sendall(b"HTTP/1.0 OK\r\n\r\n")
+
+    replier = threading.Thread(target=reply)
+    replier.start()
+
+    # act
+    with server, FixtureSupervisor([]) as supervisor:
+        ready = supervisor.loop.run_until_complete(
+            supervisor._probe_http("http://localhost:{0}/".format(server.getsockname()[1])))
+    replier.join()
+
+    # assert
+    assert ready is False
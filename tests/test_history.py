@@ -0,0 +1,94 @@
+import random
+
+import numpy as np
+
+from aplet.pltools import history
+from aplet.pltools.fm import TestState
+from aplet.pltools.history import ResultsCube
+
+
+PASSED = TestState.passed
+FAILED = TestState.failed
+
+
+def test_results_are_kept_across_reopening(tmp_path):
+    # arrange
+    results_cube = ResultsCube(str(tmp_path))
+    results_cube.add_results("run1", "Basic", {"Add todo": PASSED, "Search": FAILED})
+    results_cube.add_results("run1", "Full", {"Search": PASSED})
+
+    # act
+    reopened = ResultsCube(str(tmp_path))
+
+    # assert
+    assert reopened.runs.names == ["run1"]
+    assert reopened.get_run_products("run1") == {"Basic", "Full"}
+    assert reopened.get_run_results("run1").tolist() == [[PASSED.value, FAILED.value], [0, PASSED.value]]
+
+
+def test_wider_rows_start_a_new_segment(tmp_path):
+    results_cube = ResultsCube(str(tmp_path))
+    results_cube.add_results("run1", "Basic", {"Scenario 0": PASSED})
+    results_cube.add_results("run2", "Basic", {"Scenario {0}".format(index): FAILED for index in range(100)})
+
+    assert [segment["scenarios"] for segment in results_cube.segments] == [64, 128]
+    assert results_cube.get_run_results("run1")[0, :2].tolist() == [PASSED.value, 0]
+    assert results_cube.get_run_results("run2")[0].tolist() == [FAILED.value] * 100
+    assert [cells.shape for _, cells in results_cube.iter_chunks()] == [(1, 100), (1, 100)]
+
+
+def test_interrupted_append_is_overwritten(tmp_path):
+    # arrange
+    results_cube = ResultsCube(str(tmp_path))
+    results_cube.add_results("run1", "Basic", {"Add todo": PASSED})
+    # cells written without their row
+    with open(results_cube.segment_path(0), "ab") as segment_file:
+        segment_file.write(b"\xff" * 16)
+
+    # act
+    results_cube = ResultsCube(str(tmp_path))
+    results_cube.add_results("run2", "Basic", {"Add todo": FAILED})
+
+    # assert
+    assert results_cube.get_run_results("run2").tolist() == [[FAILED.value]]
+    assert results_cube.get_flip_counts().tolist() == [[1]]
+
+
+def brute_force_flip_counts(rows, product_count, scenario_count):
+    flips = np.zeros((product_count, scenario_count), dtype=np.int64)
+    last_results = {}
+    for product_index, results in rows:
+        for scenario_index, test_status in results.items():
+            if test_status not in (PASSED, FAILED):
+                continue
+            key = (product_index, scenario_index)
+            if key in last_results and last_results[key] != test_status:
+                flips[key] += 1
+            last_results[key] = test_status
+    return flips
+
+
+def test_flip_counts_match_brute_force(tmp_path, monkeypatch):
+    # Small chunks, so that products' histories span several of them.
+    monkeypatch.setattr(history, "CHUNK_CELLS", 200)
+    rng = random.Random(7)
+    results_cube = ResultsCube(str(tmp_path))
+    rows = []
+
+    for run_index in range(40):
+        for product_index in rng.sample(range(5), rng.randint(1, 5)):
+            scenario_count = rng.choice([10, 30, 70])
+            results = {scenario_index: rng.choice([PASSED, PASSED, FAILED, TestState.inconclusive])
+                       for scenario_index in rng.sample(range(scenario_count), rng.randint(0, scenario_count))}
+            results_cube.add_results("run{0}".format(run_index), "Product{0}".format(product_index),
+                                     {"Scenario {0}".format(index): state for index, state in results.items()})
+            rows.append((product_index, results))
+
+    flips = results_cube.get_flip_counts()
+
+    # Map the cube's product and scenario order back to the generated indexes.
+    product_order = [int(name[len("Product"):]) for name in results_cube.products.names]
+    scenario_order = [int(name[len("Scenario "):]) for name in results_cube.scenarios.names]
+    expected = brute_force_flip_counts(rows, 5, 70)[np.ix_(product_order, scenario_order)]
+    assert flips.tolist() == expected.tolist()
+    assert flips.sum() > 100
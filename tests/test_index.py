@@ -0,0 +1,91 @@
+from aplet.pltools.index import build_index, get_sources_fingerprint, load_index
+from aplet.pltools.parsers import FeatureModelParser
+
+
+MODEL_XML = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<featureModel>
+    <struct>
+        <and abstract="true" mandatory="true" name="todoapp">
+            <feature mandatory="true" name="AddTodo"/>
+            <and abstract="true" name="Fields">
+                <feature name="DescriptionField"/>
+            </and>
+            <feature name="Search"/>
+        </and>
+    </struct>
+    <constraints/>
+</featureModel>
+"""
+
+PRODUCT_FEATURES = {
+    "Basic": ["AddTodo", "todoapp"],
+    "Described": ["AddTodo", "DescriptionField", "todoapp"],
+    "Full": ["AddTodo", "DescriptionField", "Search", "todoapp"],
+}
+
+GHERKIN_PIECES = {
+    "AddTodo": ["Add todo"],
+    "DescriptionField": ["Add description"],
+    "NotDescriptionField": ["No description box"],
+}
+
+
+def build_test_index(sources=None):
+    feature_model = FeatureModelParser().parse_xml(MODEL_XML)
+    return build_index(feature_model, PRODUCT_FEATURES, GHERKIN_PIECES, sources)
+
+
+def test_products_with_feature():
+    productline_index = build_test_index()
+
+    assert productline_index.products_with_feature("Search") == ["Full"]
+    assert productline_index.products_with_feature("DescriptionField") == ["Described", "Full"]
+    assert productline_index.products_with_feature("todoapp") == ["Basic", "Described", "Full"]
+    assert productline_index.products_with_feature("Unknown") == []
+
+
+def test_abstract_feature_is_in_products_with_its_descendants():
+    productline_index = build_test_index()
+
+    assert productline_index.products_with_feature("Fields") == ["Described", "Full"]
+
+
+def test_scenarios_for_feature_include_absence_scenarios():
+    productline_index = build_test_index()
+
+    assert productline_index.scenarios_for_feature("DescriptionField") == ["Add description", "No description box"]
+    assert productline_index.features_for_scenario("No description box") == ["DescriptionField"]
+
+
+def test_features_without_scenarios():
+    productline_index = build_test_index()
+
+    assert productline_index.features_without_scenarios() == ["Search"]
+
+
+def test_saved_index_loads_back(tmp_path):
+    # arrange
+    (tmp_path / "configs").mkdir()
+    (tmp_path / "configs" / "Basic.config").write_text("AddTodo\n")
+    source_paths = [str(tmp_path / "configs")]
+    sources = get_sources_fingerprint(source_paths)
+    index_path = str(tmp_path / "index.json")
+
+    # act
+    build_test_index(sources).save(index_path)
+    loaded = load_index(index_path)
+
+    # assert
+    assert loaded.products_with_feature("DescriptionField") == ["Described", "Full"]
+    assert loaded.features_for_scenario("Add todo") == ["AddTodo"]
+    assert not loaded.is_stale(source_paths)
+
+
+def test_index_is_stale_when_a_source_changes(tmp_path):
+    config_path = tmp_path / "Basic.config"
+    config_path.write_text("AddTodo\n")
+    productline_index = build_test_index(get_sources_fingerprint([str(tmp_path)]))
+
+    config_path.write_text("AddTodo\nSearch\n")
+
+    assert productline_index.is_stale([str(tmp_path)])
@@ -0,0 +1,107 @@
+import sys
+
+import pytest
+import yaml
+from click.testing import CliRunner
+
+from aplet import main
+
+
+MODEL_XML = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<featureModel>
+    <struct>
+        <and abstract="true" mandatory="true" name="todoapp">
+            <feature mandatory="true" name="AddTodo"/>
+            <feature name="Search"/>
+        </and>
+    </struct>
+    <constraints/>
+</featureModel>
+"""
+
+FEATURE = """@AddTodo
+Feature: Add todo
+  Scenario: Add todo
+    Given I am on the page
+"""
+
+# Passes every scenario it is given, writing the reports named on its command line.
+RUNNER = """import os, sys
+os.makedirs("tests/_output", exist_ok=True)
+print("PASS Add todo (0.1s)", flush=True)
+report = ('<testsuites><testsuite name="acceptance">'
+          '<testcase name="Add todo: Add todo" feature="Add todo"/></testsuite></testsuites>')
+for report_name in sys.argv[1:]:
+    if not report_name.startswith("-"):
+        with open(os.path.join("tests", "_output", report_name), "w") as report_file:
+            report_file.write(report if report_name.endswith(".xml") else "<html>report</html>")
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """ A project with one product, run by a runner that needs no fixtures.
+    Returns a function that runs aplet in it with the given config and arguments.
+    """
+    (tmp_path / "productline" / "configs").mkdir(parents=True)
+    (tmp_path / "productline" / "model.xml").write_text(MODEL_XML)
+    (tmp_path / "productline" / "configs" / "Basic.config").write_text("AddTodo\n")
+    (tmp_path / "bddfeatures").mkdir()
+    (tmp_path / "bddfeatures" / "todo.feature").write_text(FEATURE)
+    (tmp_path / "runner.py").write_text(RUNNER)
+    (tmp_path / "app").mkdir()
+    # runtests changes directory, and load_config replaces the module's CONFIG.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "CONFIG", {})
+
+    def run_aplet(config, *args, report_names=("report.xml",)):
+        config = dict({
+            "test_runner": {
+                "name": "runner",
+                "command": sys.executable,
+                "arguments": ["runner.py"] + list(report_names),
+                "feature_include_switch": "-g",
+                "scenario_filter_switch": "--filter",
+            },
+            "fixtures": [],
+        }, **config)
+        (tmp_path / "aplet.yml").write_text(yaml.safe_dump(config))
+        return CliRunner().invoke(main.cli, ["--configfile", str(tmp_path / "aplet.yml")] + list(args),
+                                  catch_exceptions=False)
+
+    return run_aplet
+
+
+def test_runtests_without_archive(project, tmp_path):
+    result = project({"archive": False, "cache": False}, "runtests", "--projectfolder", str(tmp_path),
+                     str(tmp_path / "app"))
+
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "testreports" / "reportBasic.xml").exists()
+    assert not (tmp_path / ".aplet" / "archive").exists()
+
+
+def test_malformed_constraint_is_reported(project, tmp_path):
+    model_xml = MODEL_XML.replace("<constraints/>", "<constraints><rule><imp><var>Search</var></imp></rule></constraints>")
+    (tmp_path / "productline" / "model.xml").write_text(model_xml)
+
+    result = project({}, "validate", "--projectfolder", str(tmp_path))
+
+    assert result.exit_code == 1
+    assert "Invalid constraint <rule><imp><var>Search</var></imp></rule>: <imp> has 1 operands" in result.output
+
+
+def test_worker_removes_its_folder_when_it_fails(project, tmp_path, monkeypatch):
+    class FailingWorker:
+        def __init__(self, host, port, run_job):
+            pass
+
+        def run(self):
+            raise ConnectionResetError()
+
+    monkeypatch.setattr(main.distributed, "Worker", FailingWorker)
+
+    with pytest.raises(ConnectionResetError):
+        project({}, "worker", "--projectfolder", str(tmp_path), "--connect", "localhost:1", str(tmp_path / "app"))
+
+    assert not list((tmp_path / ".aplet").glob("worker-*"))
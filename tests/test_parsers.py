@@ -86,3 +86,50 @@ def test_feature_model_with_nested_children():
     grandchild = list(child.children)[0]
 
     assert grandchild.name == "mandatory_grandchild"
+
+
+def test_feature_model_with_groups_and_constraints():
+    xml = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+	<featureModel>
+		<struct>
+			<and abstract="true" mandatory="true" name="productline">
+                <alt name="alt_group">
+                    <feature name="first"/>
+                    <feature name="second"/>
+                </alt>
+            </and>
+		</struct>
+		<constraints>
+			<rule>
+				<imp>
+					<var>first</var>
+					<not>
+						<var>second</var>
+					</not>
+				</imp>
+			</rule>
+		</constraints>
+	</featureModel>
+    """
+    parser = FeatureModelParser()
+    fm = parser.parse_xml(xml)
+
+    assert fm.root_feature.group_type == "and"
+    assert fm.root_feature.children[0].group_type == "alt"
+    assert fm.constraints == [("imp", ("var", "first"), ("not", ("var", "second")))]
+
+
+@pytest.mark.parametrize("rule", ["<imp><var>first</var></imp>", "<not><var/></not>"])
+def test_malformed_constraint_raises_value_error(rule):
+    xml = """<featureModel>
+		<struct>
+			<and abstract="true" mandatory="true" name="productline">
+                <feature name="first"/>
+            </and>
+		</struct>
+		<constraints><rule>{0}</rule></constraints>
+	</featureModel>
+    """.format(rule)
+
+    with pytest.raises(ValueError, match="Invalid constraint <rule>"):
+        FeatureModelParser().parse_xml(xml)
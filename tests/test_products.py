@@ -0,0 +1,102 @@
+import pytest
+
+from aplet.pltools.parsers import ProductConfigParser
+from aplet.pltools.products import (ProductMatrix, load_product_matrix, read_binary_matrix, read_csv_matrix,
+                                    write_binary_matrix, write_csv_matrix)
+
+
+FEATUREIDE_CONFIG = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<configuration>
+    <feature automatic="selected" manual="undefined" name="todoapp"/>
+    <feature manual="selected" name="TodoList"/>
+    <feature automatic="unselected" name="Search"/>
+    <feature manual="selected" name="LabelField"/>
+</configuration>
+"""
+
+
+def build_matrix():
+    matrix = ProductMatrix()
+    matrix.add_product("Basic", ["TodoList", "LabelField"])
+    matrix.add_product("Full", ["TodoList", "LabelField", "Search"])
+    return matrix
+
+
+def test_features_of_product():
+    matrix = build_matrix()
+
+    assert matrix.features_of("Full") == ["TodoList", "LabelField", "Search"]
+    assert matrix.has_feature("Full", "Search")
+    assert not matrix.has_feature("Basic", "Search")
+    assert matrix.config_text("Basic") == "TodoList\nLabelField\n"
+
+
+def test_csv_matrix_roundtrip(tmp_path):
+    matrix_path = str(tmp_path / "products.csv")
+
+    write_csv_matrix(build_matrix(), matrix_path)
+    loaded = read_csv_matrix(matrix_path)
+
+    assert loaded.products == ["Basic", "Full"]
+    assert loaded.rows == build_matrix().rows
+
+
+def test_binary_matrix_roundtrip(tmp_path):
+    # arrange: enough features for the rows to span several bytes
+    matrix = ProductMatrix()
+    for index in range(100):
+        matrix.add_product("Product{0}".format(index), ["F{0}".format(bit) for bit in range(20) if index >> bit % 7 & 1])
+    matrix_path = str(tmp_path / "products.matrix")
+
+    # act
+    write_binary_matrix(matrix, matrix_path)
+    loaded = read_binary_matrix(matrix_path)
+
+    # assert
+    assert loaded.features == matrix.features
+    assert loaded.products == matrix.products
+    assert loaded.rows == matrix.rows
+
+
+def test_truncated_binary_matrix_raises(tmp_path):
+    matrix_path = tmp_path / "products.matrix"
+    write_binary_matrix(build_matrix(), str(matrix_path))
+    matrix_path.write_bytes(matrix_path.read_bytes()[:-1])
+
+    with pytest.raises(ValueError):
+        read_binary_matrix(str(matrix_path))
+
+
+def test_configs_folder_mixes_formats(tmp_path):
+    # arrange
+    (tmp_path / "Basic.config").write_text("TodoList\nLabelField\n")
+    (tmp_path / "FromFeatureIDE.xml").write_text(FEATUREIDE_CONFIG)
+    (tmp_path / "generated.csv").write_text("product,Search,TodoList\nGenerated1,1,1\nGenerated2,0,1\n")
+    (tmp_path / "notes.txt").write_text("not a product")
+
+    # act
+    matrix = load_product_matrix(str(tmp_path))
+
+    # assert
+    assert matrix.products == ["Basic", "FromFeatureIDE", "Generated1", "Generated2"]
+    assert matrix.features_of("FromFeatureIDE") == ["TodoList", "LabelField", "todoapp"]
+    assert matrix.features_of("Generated1") == ["TodoList", "Search"]
+    assert matrix.features_of("Generated2") == ["TodoList"]
+
+
+def test_duplicate_product_raises(tmp_path):
+    (tmp_path / "Basic.config").write_text("TodoList\n")
+    (tmp_path / "more.csv").write_text("product,TodoList\nBasic,1\n")
+
+    with pytest.raises(ValueError):
+        load_product_matrix(str(tmp_path))
+
+
+def test_parse_product_matches_parse_config(tmp_path):
+    config_path = tmp_path / "Basic.config"
+    config_path.write_text("TodoList\nLabelField\n")
+    parser = ProductConfigParser("todoapp")
+
+    matrix = load_product_matrix(str(tmp_path))
+
+    assert parser.parse_product(matrix, "Basic") == parser.parse_config(str(config_path))
@@ -0,0 +1,89 @@
+import subprocess
+import sys
+
+from aplet.pltools.fm import TestState
+from aplet.pltools.parsers import TestResultsParser
+from aplet.pltools.progress import TestRunProgress
+
+
+def start_fake_runner(lines, delay=0.0):
+    script = "import sys, time\nfor line in {0!r}:\n    print(line, flush=True)\n    time.sleep({1})\n".format(lines, delay)
+    return subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE,
+                            universal_newlines=True, bufsize=1)
+
+
+def test_codeception_lines_are_matched():
+    progress = TestRunProgress("Product", 2, echo=lambda line: None)
+
+    passed = progress.match_line("✔ Add todo to list: Add one-word todo (0.18s)")
+    failed = progress.match_line("✖ Add todo to list: Add empty todo (0.05s)")
+
+    assert passed == {"status": TestState.passed, "feature": "Add todo to list",
+                      "scenario": "Add one-word todo", "time": 0.18}
+    assert failed["status"] is TestState.failed
+    assert failed["scenario"] == "Add empty todo"
+    assert progress.match_line("Codeception PHP Testing Framework v2.3.6") is None
+
+
+def test_outcomes_are_recorded_as_they_are_printed():
+    # arrange
+    echoed = []
+    progress = TestRunProgress("Product", 3, echo=echoed.append)
+    process = start_fake_runner(["Starting", "✔ Todos: One (0.1s)", "✖ Todos: Two (0.1s)", "✔ Todos: Three (0.1s)"])
+
+    # act
+    progress.run([process])
+
+    # assert
+    assert [outcome["scenario"] for outcome in progress.outcomes] == ["One", "Two", "Three"]
+    assert progress.passed == 2
+    assert progress.failed == 1
+    assert not progress.aborted
+    assert "Product: 2 passed, 1 failed, 0 remaining, ETA 0:00:00" in echoed
+
+
+def test_runner_errors_and_warnings_are_not_scenario_results():
+    progress = TestRunProgress("Product", 1, echo=lambda line: None)
+
+    assert progress.match_line("E  Deprecated: Function each() is deprecated in vendor/lib.php on line 3") is None
+    assert progress.match_line("x = parse(config)") is None
+    assert progress.match_line("+ added line") is None
+    assert progress.match_line("✖ Todos: Two") is None
+    assert progress.match_line("E Todos: Broken fixture (1s)")["scenario"] == "Broken fixture"
+
+
+def test_custom_patterns():
+    progress = TestRunProgress("Product", 1, patterns={"passed": r"^ok (?P<scenario>.+)$"}, echo=lambda line: None)
+
+    assert progress.match_line("ok Something")["scenario"] == "Something"
+    assert progress.match_line("✖ Todos: Two") is None
+
+
+def test_fail_fast_stops_the_runner():
+    # arrange
+    lines = ["✖ Todos: One (0.1s)", "✖ Todos: Two (0.1s)"] + [
+        "✔ Todos: Later {0} (0.1s)".format(index) for index in range(50)]
+    progress = TestRunProgress("Product", len(lines), fail_fast=2, echo=lambda line: None)
+    process = start_fake_runner(lines, delay=0.05)
+
+    # act
+    progress.run([process])
+
+    # assert
+    assert progress.aborted
+    assert process.returncode != 0
+    assert progress.failed == 2
+    assert len(progress.outcomes) < len(lines)
+
+
+def test_partial_report_can_be_parsed():
+    # arrange
+    progress = TestRunProgress("Product", 3, echo=lambda line: None)
+    process = start_fake_runner(["✔ Todos: One (0.1s)", "✖ Todos: Two (0.2s)"])
+    progress.run([process])
+
+    # act
+    results = TestResultsParser().get_gherkin_piece_test_statuses_for_product(progress.junit_xml())
+
+    # assert
+    assert results == {"One": TestState.passed, "Two": TestState.failed}
@@ -0,0 +1,98 @@
+import xml.etree.ElementTree as et
+
+from aplet.pltools.fm import TestState
+from aplet.pltools.parsers import TestResultsParser
+from aplet.pltools.reruns import RetryHistory, merge_rerun_report
+
+
+REPORT_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuites>
+  <testsuite name="acceptance" tests="3" assertions="3" errors="0" failures="2" skipped="0" time="0.9">
+    <testcase name="Todos: Add todo" feature="Add todo" time="0.3">
+      <failure/>
+    </testcase>
+    <testcase name="Todos: Mark done" feature="Mark done" time="0.3"/>
+    <testcase name="Todos: Search" feature="Search" time="0.3">
+      <failure/>
+    </testcase>
+  </testsuite>
+</testsuites>
+"""
+
+RERUN_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuites>
+  <testsuite name="acceptance" tests="2" assertions="2" errors="0" failures="1" skipped="0" time="0.6">
+    <testcase name="Todos: Add todo" feature="Add todo" time="0.3"/>
+    <testcase name="Todos: Search" feature="Search" time="0.3">
+      <failure/>
+    </testcase>
+  </testsuite>
+</testsuites>
+"""
+
+
+def test_failed_scenarios_are_found(tmp_path):
+    report_path = tmp_path / "reportProduct.xml"
+    report_path.write_text(REPORT_XML)
+
+    results, _ = TestResultsParser().get_test_results_for_product(str(tmp_path), "Product", "xml")
+
+    assert [scenario_name for scenario_name, test_status in results.items() if test_status is TestState.failed] == [
+        "Add todo", "Search"]
+
+
+def test_merge_replaces_rerun_testcases(tmp_path):
+    # arrange
+    history = RetryHistory(str(tmp_path / "retries.json"))
+    history.record_failure("Add todo")
+    history.record_failure("Search")
+
+    # act
+    merged = merge_rerun_report(REPORT_XML, RERUN_XML, history)
+
+    # assert
+    results = TestResultsParser().get_gherkin_piece_test_statuses_for_product(merged)
+    assert results == {
+        "Add todo": TestState.passed,
+        "Mark done": TestState.passed,
+        "Search": TestState.failed,
+    }
+    suite = et.fromstring(merged).find("testsuite")
+    assert suite.get("tests") == "3"
+    assert suite.get("failures") == "1"
+    assert [testcase.get("feature") for testcase in suite] == ["Add todo", "Mark done", "Search"]
+
+
+def test_merge_marks_flaky_scenarios(tmp_path):
+    # arrange
+    history = RetryHistory(str(tmp_path / "retries.json"))
+    history.record_failure("Add todo")
+    history.record_failure("Search")
+
+    # act
+    merged = merge_rerun_report(REPORT_XML, RERUN_XML, history)
+
+    # assert
+    testcases = {testcase.get("feature"): testcase for testcase in et.fromstring(merged).find("testsuite")}
+    assert testcases["Add todo"].get("flaky") == "true"
+    assert testcases["Add todo"].get("retries") == "1"
+    assert testcases["Search"].get("flaky") is None
+    assert history.flaky_scenarios() == ["Add todo"]
+
+
+def test_retry_history_is_persisted(tmp_path):
+    # arrange
+    history_path = str(tmp_path / "retries.json")
+    history = RetryHistory(history_path)
+    history.record_failure("Add todo")
+    history.record_attempt("Add todo", TestState.failed)
+
+    # act
+    history.save()
+    reloaded = RetryHistory(history_path)
+    reloaded.record_failure("Add todo")
+
+    # assert
+    assert reloaded.attempts["Add todo"] == ["failed", "failed"]
+    assert reloaded.retries("Add todo") == 1
+    assert not reloaded.is_flaky("Add todo")
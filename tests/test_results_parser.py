@@ -1,9 +1,12 @@
+import io
+import os
+
 import pytest
 
 from anytree import Node, RenderTree
 
 from aplet.pltools.fm import TestState
-from aplet.pltools.parsers import TestResultsParser
+from aplet.pltools.parsers import TestResultsParser, iter_json_stream_values
 
 
 # single product
@@ -54,3 +57,99 @@ def test_single_product_one_test_that_fails():
 
 def test_all_products():
     pass
+
+
+JSON_REPORT = """{
+    "event": "suiteStart",
+    "suite": "acceptance",
+    "tests": 2
+}{
+    "event": "testStart",
+    "suite": "acceptance",
+    "test": "Add todo to list: Add one-word todo"
+}{
+    "event": "test",
+    "suite": "acceptance",
+    "test": "Add todo to list: Add one-word todo",
+    "status": "pass",
+    "time": 0.181719,
+    "trace": [],
+    "message": "",
+    "output": ""
+}{
+    "event": "test",
+    "suite": "acceptance",
+    "test": "Add todo to list: Add todo with \\"quotes\\" {and braces}",
+    "status": "fail",
+    "time": 1.5,
+    "trace": [{"file": "AddTodo.feature", "line": 12}],
+    "message": "Failed asserting that \\"}\\" is on the page",
+    "output": ""
+}{
+    "event": "test",
+    "suite": "unit",
+    "test": "TodoTest: Add one-word todo",
+    "status": "fail",
+    "time": 0.01
+}"""
+
+JSON_RESULTS = {
+    "Add one-word todo": TestState.passed,
+    'Add todo with "quotes" {and braces}': TestState.failed,
+}
+
+
+def test_json_report_gives_statuses_and_durations():
+    results, durations = TestResultsParser().get_test_results_for_product_from_json_stream(io.StringIO(JSON_REPORT))
+
+    assert results == JSON_RESULTS
+    assert durations == {"Add one-word todo": 0.181719, 'Add todo with "quotes" {and braces}': 1.5}
+
+
+def test_json_values_are_read_across_small_chunks():
+    stream = io.BytesIO(("[" + JSON_REPORT.replace("}{", "}, {") + "]").encode("utf-8"))
+
+    events = list(iter_json_stream_values(stream, chunk_size=7))
+
+    assert [event["event"] for event in events] == ["suiteStart", "testStart", "test", "test", "test"]
+
+
+def test_json_report_cut_short_is_an_error():
+    with pytest.raises(ValueError):
+        TestResultsParser().get_test_results_for_product_from_json_stream(io.StringIO(JSON_REPORT[:-40]))
+
+
+def write_report(reports_dir, filename, content, mtime):
+    report_path = reports_dir / filename
+    report_path.write_text(content)
+    os.utime(str(report_path), (mtime, mtime))
+
+
+def test_auto_format_prefers_the_json_report_whatever_its_age(tmp_path):
+    # arrange
+    parser = TestResultsParser()
+    passing_xml = """<testsuites><testsuite name="acceptance">
+    <testcase name="Add todo to list: Add one-word todo" feature="Add one-word todo" time="0.2"/>
+</testsuite></testsuites>"""
+    write_report(tmp_path, "reportBasic.json", JSON_REPORT, 1000)
+    write_report(tmp_path, "reportBasic.xml", passing_xml, 2000)
+    write_report(tmp_path, "reportXmlOnly.xml", passing_xml, 2000)
+
+    # act / assert
+    assert parser.get_test_results_for_product(str(tmp_path), "Basic", "auto")[0] == JSON_RESULTS
+    assert parser.get_test_results_for_product(str(tmp_path), "Basic", "xml")[0] == {
+        "Add one-word todo": TestState.passed}
+    assert parser.get_test_results_for_product(str(tmp_path), "XmlOnly", "auto")[0] == {
+        "Add one-word todo": TestState.passed}
+    assert parser.get_test_results_for_product(str(tmp_path), "Missing", "auto") == ({}, {})
+
+
+def test_auto_format_falls_back_to_xml_if_json_is_cut_short(tmp_path):
+    write_report(tmp_path, "reportBasic.xml", """<testsuites><testsuite name="acceptance">
+    <testcase name="Add todo to list: Add one-word todo" feature="Add one-word todo"><failure/></testcase>
+</testsuite></testsuites>""", 1000)
+    write_report(tmp_path, "reportBasic.json", JSON_REPORT[:-40], 2000)
+
+    results = TestResultsParser().get_gherkin_piece_test_statuses_for_dir(str(tmp_path))
+
+    assert results == {"Add one-word todo": TestState.failed}
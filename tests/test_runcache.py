@@ -0,0 +1,100 @@
+import os
+
+from aplet.pltools.ftrenderer import feature_file_tags
+from aplet.pltools.runcache import RunCache, fingerprint, folder_digest
+
+
+def write_reports(reports_dir, product_name, content):
+    report_paths = {}
+    for report_type in ("xml", "html"):
+        report_path = reports_dir / "report{0}.{1}".format(product_name, report_type)
+        report_path.write_text("<{0}>{1}</{0}>".format(report_type, content))
+        report_paths[report_type] = str(report_path)
+    return report_paths
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint({"a": 1, "b": [1, 2]}) != fingerprint({"a": 1, "b": [2, 1]})
+
+
+def test_folder_digest_follows_content_and_skips_excluded_files(tmp_path):
+    # arrange
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "index.php").write_text("<?php echo 1;")
+    (tmp_path / "todo.config").write_text("Search")
+    digest = folder_digest(str(tmp_path), "content", ["todo.config"])
+
+    # act
+    (tmp_path / "todo.config").write_text("Labels")
+    digest_without_change = folder_digest(str(tmp_path), "content", ["todo.config"])
+    (tmp_path / "src" / "index.php").write_text("<?php echo 2;")
+    digest_after_change = folder_digest(str(tmp_path), "content", ["todo.config"])
+
+    # assert
+    assert digest == digest_without_change
+    assert digest != digest_after_change
+
+
+def test_folder_digest_by_mtime(tmp_path):
+    (tmp_path / "index.php").write_text("<?php echo 1;")
+    digest = folder_digest(str(tmp_path), "mtime")
+
+    os.utime(str(tmp_path / "index.php"), (0, 0))
+
+    assert folder_digest(str(tmp_path), "mtime") != digest
+    assert folder_digest(str(tmp_path), "content") == folder_digest(str(tmp_path), "content")
+
+
+def test_reports_are_restored_by_fingerprint(tmp_path):
+    # arrange
+    run_cache = RunCache(str(tmp_path / "cache"))
+    run_fingerprint = fingerprint({"productconfig": "Search"})
+    run_cache.add_reports(run_fingerprint, "Full", write_reports(tmp_path, "Full", "old"))
+
+    # act
+    run_cache.add_reports(run_fingerprint, "Full", write_reports(tmp_path, "Full", "new"))
+    cached_dir = run_cache.lookup(run_fingerprint)
+
+    # assert
+    assert sorted(os.listdir(cached_dir)) == ["entry.json", "report.html", "report.xml"]
+    assert open(os.path.join(cached_dir, "report.xml")).read() == "<xml>new</xml>"
+    assert run_cache.lookup(fingerprint({"productconfig": "Labels"})) is None
+
+
+def test_runs_without_results_are_not_cached(tmp_path):
+    run_cache = RunCache(str(tmp_path / "cache"))
+    (tmp_path / "reportFull.html").write_text("<html>crashed</html>")
+
+    run_cache.add_reports("ab" * 32, "Full", {"html": str(tmp_path / "reportFull.html")})
+
+    assert run_cache.lookup("ab" * 32) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    # arrange
+    run_cache = RunCache(str(tmp_path / "cache"))
+    fingerprints = [fingerprint({"product": index}) for index in range(3)]
+    for index, run_fingerprint in enumerate(fingerprints):
+        run_cache.add_reports(run_fingerprint, "P", write_reports(tmp_path, "P", index))
+        os.utime(run_cache.entry_dir(run_fingerprint), (index, index))
+    # Entries differ in size by a byte or two, with the length of their creation time.
+    kept_size = sum(run_cache.entry_size(run_cache.entry_dir(fingerprints[index])) for index in (0, 2))
+    # Using the oldest entry keeps it.
+    run_cache.lookup(fingerprints[0])
+
+    # act
+    removed = run_cache.evict(kept_size)
+
+    # assert
+    assert removed == 1
+    assert run_cache.lookup(fingerprints[1]) is None
+    assert run_cache.lookup(fingerprints[0]) is not None
+    assert run_cache.clear() == 2
+
+
+def test_feature_file_tags_include_scenario_tags(tmp_path):
+    (tmp_path / "search.feature").write_text("@Search\nFeature: Search\n  @Regex\n  Scenario: By regex\n    Given a\n")
+    (tmp_path / "plain.feature").write_text("Feature: Plain\n  Scenario: Untagged\n    Given a\n")
+
+    assert feature_file_tags(str(tmp_path)) == {"search.feature": {"Search", "Regex"}, "plain.feature": set()}
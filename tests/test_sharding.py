@@ -0,0 +1,121 @@
+import json
+import xml.etree.ElementTree as et
+
+from aplet.pltools import sharding
+from aplet.pltools.parsers import TestResultsParser
+
+
+def shard_report(*testcases):
+    return """<?xml version="1.0" encoding="UTF-8"?>
+<testsuites>
+  <testsuite name="acceptance" tests="{0}" failures="0" time="1.5">{1}</testsuite>
+</testsuites>
+""".format(len(testcases), "".join('<testcase feature="{0}" time="0.5"/>'.format(name) for name in testcases))
+
+
+def test_select_scenarios_follows_toggles_without_duplicates():
+    scenarios_by_tag = {
+        "AddTodo": ["Add todo", "Add todo with label"],
+        "LabelField": ["Add todo with label"],
+        "Search": ["Search"],
+    }
+
+    selected = sharding.select_scenarios(scenarios_by_tag, ["AddTodo", "LabelField", "NotSearch"])
+
+    assert selected == ["Add todo", "Add todo with label"]
+
+
+def test_partition_balances_by_duration():
+    # arrange
+    durations = {"a": 8.0, "b": 4.0, "c": 4.0, "d": 2.0, "e": 1.0, "f": 1.0}
+
+    # act
+    shards = sharding.partition_scenarios(list(durations), durations, 2)
+
+    # assert
+    totals = sorted(sum(durations[name] for name in shard) for shard in shards)
+    assert totals == [10.0, 10.0]
+    assert sorted(name for shard in shards for name in shard) == sorted(durations)
+
+
+def test_partition_uses_mean_duration_for_unknown_scenarios():
+    durations = {"a": 3.0, "b": 1.0}
+
+    shards = sharding.partition_scenarios(["a", "b", "new1", "new2"], durations, 2)
+
+    assert shards == [["a", "b"], ["new1", "new2"]]
+
+
+def test_partition_drops_empty_shards():
+    shards = sharding.partition_scenarios(["a"], {}, 4)
+
+    assert shards == [["a"]]
+
+
+def test_merge_junit_reports_combines_testcases():
+    # act
+    merged = sharding.merge_junit_reports([shard_report("a", "b"), shard_report("c")])
+
+    # assert
+    suite = et.fromstring(merged).find("testsuite")
+    assert suite.get("tests") == "3"
+    assert float(suite.get("time")) == 3.0
+    results = TestResultsParser().get_gherkin_piece_test_statuses_for_product(merged)
+    assert sorted(results) == ["a", "b", "c"]
+
+
+def test_merge_json_reports_keeps_all_events():
+    first = json.dumps({"event": "test", "test": "a"}) + json.dumps({"event": "test", "test": "b"})
+    second = json.dumps({"event": "test", "test": "c"})
+
+    merged = sharding.merge_json_reports([first, second])
+
+    assert [event["test"] for event in sharding.iter_json_values(merged)] == ["a", "b", "c"]
+
+
+def test_merge_html_reports_appends_bodies():
+    merged = sharding.merge_html_reports([
+        "<html><head></head><body><p>a</p></body></html>",
+        "<html><head></head><body class='x'><p>b</p></body></html>",
+    ])
+
+    assert merged == "<html><head></head><body><p>a</p><p>b</p></body></html>"
+
+
+def test_merged_reports_of_an_earlier_run_are_removed(tmp_path):
+    # arrange
+    shard_output_dirs = [tmp_path / "0", tmp_path / "1"]
+    for shard_output_dir in shard_output_dirs:
+        shard_output_dir.mkdir()
+        (shard_output_dir / "report.xml").write_text("<testsuites/>")
+    merged_dir = tmp_path / "merged"
+    merged_dir.mkdir()
+    (merged_dir / "report.html").write_text("<html>earlier run</html>")
+    (merged_dir / "report.json").write_text("{}")
+
+    # act
+    sharding.merge_shard_reports([str(shard_output_dir) for shard_output_dir in shard_output_dirs], str(merged_dir))
+
+    # assert
+    assert sorted(report_path.name for report_path in merged_dir.iterdir()) == ["report.xml"]
+
+
+def test_shard_workspace_copies_tests_and_links_the_rest(tmp_path):
+    # arrange
+    project = tmp_path / "project"
+    (project / "tests" / "_output").mkdir(parents=True)
+    (project / "tests" / "_output" / "report.xml").write_text("old")
+    (project / "tests" / "acceptance.suite.yml").write_text("suite")
+    (project / "vendor").mkdir()
+    (project / "testreports").mkdir()
+    workspace = tmp_path / "workspace"
+
+    # act
+    sharding.create_shard_workspace(str(project), str(workspace))
+
+    # assert
+    assert (workspace / "tests" / "acceptance.suite.yml").read_text() == "suite"
+    assert not (workspace / "tests").is_symlink()
+    assert not (workspace / "tests" / "_output").exists()
+    assert (workspace / "vendor").is_symlink()
+    assert not (workspace / "testreports").exists()
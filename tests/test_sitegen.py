@@ -0,0 +1,88 @@
+import graphviz as gv
+
+from aplet.pltools.fm import TestState
+from aplet.pltools.parsers import FeatureModelParser
+from aplet.pltools.products import ProductMatrix
+from aplet.pltools.sitegen import SiteGenerator
+
+
+MODEL_XML = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<featureModel>
+    <struct>
+        <and abstract="true" mandatory="true" name="todoapp">
+            <feature mandatory="true" name="AddTodo"/>
+            <feature name="Search"/>
+        </and>
+    </struct>
+    <constraints/>
+</featureModel>
+"""
+
+PRODUCTS = {
+    "Basic": {"features": ["AddTodo", "todoapp"]},
+    "Full <beta>": {"features": ["AddTodo", "Search", "todoapp"]},
+}
+
+
+def get_feature_model(product_features=None):
+    feature_model = FeatureModelParser().parse_xml(MODEL_XML)
+    if product_features is not None:
+        feature_model.trim_based_on_config(product_features)
+    feature_model.add_gherkin_pieces({"AddTodo": ["Add todo"]})
+    feature_model.calculate_test_statuses({"Add todo": TestState.passed})
+    return feature_model
+
+
+def get_product_matrix():
+    product_matrix = ProductMatrix()
+    for product_name, product in PRODUCTS.items():
+        product_matrix.add_product(product_name, product["features"])
+    return product_matrix
+
+
+def generate_site(docs_dir, report_path=None):
+    with SiteGenerator(str(docs_dir), "Todo & co", jobs=2) as site:
+        for product_name, product in PRODUCTS.items():
+            feature_model = get_feature_model(product["features"])
+            site.write_product_page(product_name, feature_model.root_feature, TestState.passed, report_path)
+        site.add_index_page(get_feature_model(), get_product_matrix(),
+                            {"Basic": TestState.passed, "Full <beta>": TestState.failed})
+    return site
+
+
+def test_site_has_index_and_product_pages(tmp_path, monkeypatch):
+    # arrange
+    monkeypatch.setattr(gv.Digraph, "pipe", lambda graph, format: b"<svg>" + graph.source.encode("utf-8") + b"</svg>")
+    report_path = tmp_path / "reportBasic.html"
+    report_path.write_text("<html>report</html>")
+    docs_dir = tmp_path / "docs"
+
+    # act
+    site = generate_site(docs_dir, str(report_path))
+
+    # assert
+    assert not site.missing_dot
+    index_html = (docs_dir / "index.html").read_text()
+    assert "<title>Todo &amp; co | Todo &amp; co</title>" in index_html
+    assert 'href="products/Full &lt;beta&gt;/index.html"' in index_html
+    assert '<span class="status-failed">failed</span>' in index_html
+    assert "&rsaquo;&nbsp;Search" in index_html
+    assert (docs_dir / "style.css").exists()
+
+    product_dir = docs_dir / "products" / "Basic"
+    assert "Search" not in (product_dir / "feature_model.svg").read_text()
+    assert '<a href="reportBasic.html">' in (product_dir / "index.html").read_text()
+    assert (product_dir / "reportBasic.html").read_text() == "<html>report</html>"
+    assert 'href="../../style.css"' in (product_dir / "index.html").read_text()
+
+
+def test_pages_are_written_without_diagrams_if_dot_is_missing(tmp_path, monkeypatch):
+    def missing_dot(graph, format):
+        raise gv.ExecutableNotFound(["dot"])
+    monkeypatch.setattr(gv.Digraph, "pipe", missing_dot)
+
+    site = generate_site(tmp_path)
+
+    assert site.missing_dot
+    assert not (tmp_path / "feature_model.svg").exists()
+    assert "<h1>Basic</h1>" in (tmp_path / "products" / "Basic" / "index.html").read_text()
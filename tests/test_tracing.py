@@ -0,0 +1,109 @@
+import json
+import re
+from os import path, walk
+
+import aplet
+from aplet.pltools.tracing import PHASES, Tracer
+
+
+def busy_work():
+    return sum(index * index for index in range(1000))
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+
+    with tracer.span("parse_model"):
+        busy_work()
+
+    assert tracer.spans == []
+
+
+def test_spans_are_summarised_by_phase():
+    # arrange
+    tracer = Tracer()
+    tracer.enable()
+
+    # act
+    for product_name in ("Basic", "Full"):
+        with tracer.span("parse_report", product=product_name):
+            busy_work()
+    with tracer.span("parse_model"):
+        pass
+
+    # assert
+    summary = {row[0]: row for row in tracer.summary()}
+    assert summary["parse_report"][1] == 2
+    assert summary["parse_model"][1] == 1
+    assert [row[0] for row in tracer.summary()][0] == "parse_report"
+    assert "Peak RSS" in tracer.summary_table()
+
+
+def test_chrome_trace_events(tmp_path):
+    # arrange
+    tracer = Tracer()
+    tracer.enable()
+    with tracer.span("test_runner", product="Basic"):
+        busy_work()
+    trace_path = str(tmp_path / "trace.json")
+
+    # act
+    tracer.write_chrome_trace(trace_path)
+
+    # assert
+    with open(trace_path) as trace_file:
+        events = json.load(trace_file)["traceEvents"]
+    complete_events = [event for event in events if event["ph"] == "X"]
+    assert len(complete_events) == 1
+    assert complete_events[0]["name"] == "test_runner"
+    assert complete_events[0]["args"] == {"product": "Basic"}
+    assert complete_events[0]["dur"] > 0
+    assert any(event["ph"] == "C" and event["name"] == "peak_rss_mb" for event in events)
+
+
+def test_span_records_even_when_the_phase_raises():
+    tracer = Tracer()
+    tracer.enable()
+
+    try:
+        with tracer.span("fixtures"):
+            raise RuntimeError("fixture failed")
+    except RuntimeError:
+        pass
+
+    assert [recorded_span["name"] for recorded_span in tracer.spans] == ["fixtures"]
+
+
+def test_profiled_phase_reports_its_functions():
+    tracer = Tracer()
+    tracer.enable(["render_svg"])
+
+    with tracer.span("render_svg"):
+        with tracer.span("sed_inplace"):
+            busy_work()
+
+    assert "busy_work" in tracer.profile_report("render_svg")
+
+
+def test_phase_that_never_ran_is_not_profiled():
+    tracer = Tracer()
+    tracer.enable(["render_svg", "parse_model"])
+
+    with tracer.span("render_svg"):
+        busy_work()
+
+    assert tracer.profiled("render_svg")
+    assert not tracer.profiled("parse_model")
+
+
+def test_every_span_is_a_known_phase():
+    package_dir = path.dirname(aplet.__file__)
+    span_names = set()
+    for dirpath, _, filenames in walk(package_dir):
+        for filename in filenames:
+            if filename.endswith(".py"):
+                with open(path.join(dirpath, filename), "r", encoding="utf-8") as source_file:
+                    span_names.update(re.findall(r'\bspan\("(\w+)"', source_file.read()))
+
+    assert span_names
+    assert span_names <= set(PHASES)
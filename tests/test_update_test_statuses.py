@@ -0,0 +1,99 @@
+import random
+
+from anytree import Node, PreOrderIter
+
+from aplet.pltools.fm import FeatureModel, TestState
+
+
+def build_feature_model():
+    fm = FeatureModel()
+    root = Node("root", mandatory=True, abstract=True)
+    fields = Node("fields", parent=root, mandatory=True, abstract=True)
+    Node("label", parent=fields, mandatory=True, abstract=False)
+    Node("description", parent=fields, mandatory=False, abstract=False, notname="Notdescription")
+    Node("search", parent=root, mandatory=False, abstract=False, notname="Notsearch")
+    fm.root_feature = root
+    fm.add_gherkin_pieces({
+        "label": ["Add label", "Edit label"],
+        "description": ["Add description"],
+        "search": ["Search"],
+    })
+    return fm
+
+
+def get_feature(fm, name):
+    return next(node for node in PreOrderIter(fm.root_feature) if node.name == name)
+
+
+def test_failure_propagates_to_root():
+    # arrange
+    fm = build_feature_model()
+    fm.calculate_test_statuses({
+        "Add label": TestState.passed,
+        "Edit label": TestState.passed,
+        "Add description": TestState.passed,
+        "Search": TestState.passed,
+    })
+
+    # act
+    changed = fm.update_test_statuses({"Add description": TestState.failed})
+
+    # assert
+    assert [feature.name for feature in changed] == ["description", "fields", "root"]
+    assert fm.root_feature.test_status is TestState.failed
+
+
+def test_propagation_stops_at_unchanged_ancestor():
+    # arrange
+    fm = build_feature_model()
+    fm.calculate_test_statuses({
+        "Add label": TestState.failed,
+        "Edit label": TestState.failed,
+        "Add description": TestState.passed,
+        "Search": TestState.passed,
+    })
+
+    # act
+    changed = fm.update_test_statuses({"Add description": TestState.failed})
+
+    # assert
+    assert [feature.name for feature in changed] == ["description"]
+    assert get_feature(fm, "fields").child_test_statuses[TestState.failed] == 2
+
+
+def test_unknown_scenario_changes_nothing():
+    fm = build_feature_model()
+    fm.calculate_test_statuses({})
+
+    assert fm.update_test_statuses({"Not a scenario": TestState.failed}) == []
+
+
+def test_incremental_update_matches_full_recalculation():
+    rng = random.Random(42)
+
+    for _ in range(20):
+        # arrange: a random tree with random pieces and results
+        fm = FeatureModel()
+        nodes = [Node("f0", mandatory=True, abstract=True)]
+        for index in range(1, 40):
+            nodes.append(Node("f{0}".format(index), parent=rng.choice(nodes), mandatory=True, abstract=False))
+        fm.root_feature = nodes[0]
+        pieces = {node.name: ["s{0}_{1}".format(node.name, piece) for piece in range(rng.randint(0, 3))]
+                  for node in nodes}
+        fm.add_gherkin_pieces(pieces)
+        all_piece_names = [name for names in pieces.values() for name in names]
+        states = list(TestState)
+        test_statuses = {name: rng.choice(states) for name in all_piece_names if rng.random() < 0.7}
+        fm.calculate_test_statuses(test_statuses)
+
+        # act
+        changes = {name: rng.choice(states) for name in rng.sample(all_piece_names, min(5, len(all_piece_names)))}
+        fm.update_test_statuses(changes)
+        incremental = {node.name: node.test_status for node in nodes}
+
+        test_statuses.update(changes)
+        fm.calculate_test_statuses(test_statuses)
+        full = {node.name: node.test_status for node in nodes}
+
+        # assert
+        assert incremental == full
@@ -0,0 +1,152 @@
+import itertools
+import sys
+
+import pytest
+from anytree import PreOrderIter
+
+from aplet.pltools.parsers import FeatureModelParser
+from aplet.pltools.validation import BDD, ConfigurationValidator, describe_constraint
+
+
+MODEL_XML = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<featureModel>
+    <struct>
+        <and abstract="true" mandatory="true" name="todoapp">
+            <feature mandatory="true" name="TodoList"/>
+            <alt abstract="true" mandatory="true" name="Storage">
+                <feature name="LocalStorage"/>
+                <feature name="Database"/>
+            </alt>
+            <or name="Filter">
+                <feature name="Search"/>
+                <feature name="Tags"/>
+            </or>
+        </and>
+    </struct>
+    <constraints>
+        <rule>
+            <imp>
+                <var>Search</var>
+                <var>Database</var>
+            </imp>
+        </rule>
+    </constraints>
+</featureModel>
+"""
+
+
+def get_validator():
+    return ConfigurationValidator(FeatureModelParser().parse_xml(MODEL_XML))
+
+
+def test_valid_configuration():
+    validator = get_validator()
+
+    assert validator.is_valid(["TodoList", "LocalStorage"])
+    assert validator.violations(["TodoList", "LocalStorage"]) == []
+
+
+def test_abstract_features_are_inferred():
+    validator = get_validator()
+
+    assert validator.complete_configuration(["TodoList", "Database"]) == {"todoapp", "TodoList", "Storage", "Database"}
+
+
+def test_missing_mandatory_feature():
+    validator = get_validator()
+
+    assert not validator.is_valid(["LocalStorage"])
+    assert validator.violations(["LocalStorage"]) == ["todoapp is selected but its mandatory child TodoList is not"]
+
+
+def test_alternative_group_needs_exactly_one():
+    validator = get_validator()
+
+    assert not validator.is_valid(["TodoList", "LocalStorage", "Database"])
+    assert validator.violations(["TodoList"]) == [
+        "Storage is selected but 0 of its alternatives LocalStorage, Database are"]
+
+
+def test_or_group_needs_at_least_one():
+    validator = get_validator()
+
+    assert validator.violations(["TodoList", "LocalStorage", "Filter"]) == [
+        "Filter is selected but none of Search, Tags are"]
+
+
+def test_child_needs_parent():
+    validator = get_validator()
+
+    assert validator.violations(["TodoList", "Database", "Tags"]) == ["Tags is selected but its parent Filter is not"]
+
+
+def test_violated_cross_tree_constraint():
+    validator = get_validator()
+
+    configuration = ["TodoList", "LocalStorage", "Filter", "Search"]
+    assert not validator.is_valid(configuration)
+    assert validator.violations(configuration) == ["Constraint Search => Database is violated"]
+
+
+def test_unknown_feature():
+    validator = get_validator()
+
+    assert not validator.is_valid(["TodoList", "LocalStorage", "Typo"])
+    assert validator.violations(["TodoList", "LocalStorage", "Typo"]) == ["Unknown feature Typo"]
+
+
+def test_checking_configurations_doesnt_build_the_bdd():
+    validator = get_validator()
+
+    validator.violations(["TodoList", "LocalStorage"])
+
+    assert validator.root is None
+
+
+def test_constraint_on_unknown_feature_is_rejected():
+    model_xml = MODEL_XML.replace("<var>Database</var>", "<var>Typo</var>")
+
+    with pytest.raises(ValueError, match="Typo"):
+        ConfigurationValidator(FeatureModelParser().parse_xml(model_xml))
+
+
+def test_count_matches_brute_force():
+    # arrange
+    validator = get_validator()
+    names = [feature.name for feature in PreOrderIter(validator.feature_model.root_feature)]
+
+    # act: a selection is valid if it breaks no rule and nothing needs inferring
+    brute_force_count = 0
+    for values in itertools.product([False, True], repeat=len(names)):
+        selected = set(name for name, value in zip(names, values) if value)
+        if validator.complete_configuration(selected) == selected:
+            is_valid = not validator.violations(selected)
+            assert validator.is_valid(selected) == is_valid
+            brute_force_count += is_valid
+
+    # assert
+    assert validator.count_configurations() == brute_force_count == 6
+
+
+def test_describe_constraint():
+    constraint = ("imp", ("and", ("var", "A"), ("not", ("var", "B"))), ("var", "C"))
+
+    assert describe_constraint(constraint) == "(A & !B) => C"
+
+
+def test_deep_bdd_needs_no_more_recursion():
+    # arrange
+    recursion_limit = sys.getrecursionlimit()
+    variable_count = 3 * recursion_limit
+    bdd = BDD(variable_count)
+
+    all_true = bdd.TRUE
+    for level in reversed(range(variable_count)):
+        all_true = bdd.conjoin(bdd.variable(level), all_true)
+
+    # act: negating walks the whole depth of the diagram
+    not_all_true = bdd.negate(all_true)
+
+    # assert
+    assert bdd.count(not_all_true) == 2 ** variable_count - 1
+    assert sys.getrecursionlimit() == recursion_limit